@@ -0,0 +1,3 @@
+from patch_submod import dummy  # <- REQUIRED
+
+dummy()
@@ -0,0 +1,222 @@
+import math
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from utils import BB_WINDOW, RSI_WINDOW, should_buy_mask, should_sell_mask
+
+BB_WINDOW_DEV = 2
+
+
+class IndicatorValues(NamedTuple):
+    c: float
+    rsi: float
+    bb_upper: float
+    bb_lower: float
+
+
+class BatchIndicators(NamedTuple):
+    c: np.ndarray
+    rsi: np.ndarray
+    bb_upper: np.ndarray
+    bb_lower: np.ndarray
+    buy: np.ndarray
+    sell: np.ndarray
+    avg_up: np.ndarray
+    avg_down: np.ndarray
+    count: np.ndarray
+
+
+def stack_closes(closes: List[np.ndarray], depth: Optional[int] = None) -> np.ndarray:
+    """
+    Stack the last `depth` closes of every series into one (series, depth) matrix, left padded with NaN.
+    """
+    depth = depth if depth is not None else max([len(c) for c in closes], default=0)
+    matrix = np.full((len(closes), depth), np.nan, dtype=np.float64)
+    for i, c in enumerate(closes):
+        tail = c[len(c) - depth:] if len(c) > depth else c
+        if len(tail) > 0:
+            matrix[i, depth - len(tail):] = tail
+
+    return matrix
+
+
+def evaluate_batch(closes: np.ndarray, rsi_window: int = RSI_WINDOW, bb_window: int = BB_WINDOW,
+                   bb_window_dev: float = BB_WINDOW_DEV) -> BatchIndicators:
+    """
+    RSI, Bollinger Bands and buy/sell masks of the last close of every row in one vectorized pass.
+    Rows are close series left padded with NaN, see `stack_closes`.
+    """
+    closes = np.atleast_2d(np.asarray(closes, dtype=np.float64))
+    rows, depth = closes.shape
+    count = np.count_nonzero(~np.isnan(closes), axis=1)
+
+    diff = np.zeros_like(closes)
+    if depth > 1:
+        diff[:, 1:] = np.nan_to_num(np.diff(closes, axis=1))
+
+    # ewm(adjust=False) starts from the first diff, which is always 0 (as is the NaN padding),
+    # so the smoothed value of the last column is a plain weighted sum of the series
+    alpha = 1 / rsi_window
+    weights = alpha * (1 - alpha) ** np.arange(depth - 1, -1, -1, dtype=np.float64)
+    avg_up = np.clip(diff, 0, None) @ weights
+    avg_down = np.clip(-diff, 0, None) @ weights
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_down == 0, 100.0, 100 - 100 / (1 + avg_up / avg_down))
+    rsi[count < rsi_window] = np.nan
+
+    window = closes[:, -bb_window:] if depth >= bb_window else np.full((rows, bb_window), np.nan)
+    mean = window.mean(axis=1)
+    std = window.std(axis=1)
+    bb_upper = mean + bb_window_dev * std
+    bb_lower = mean - bb_window_dev * std
+
+    c = closes[:, -1] if depth > 0 else np.full(rows, np.nan)
+    return BatchIndicators(c, rsi, bb_upper, bb_lower, should_buy_mask(c, rsi, bb_lower),
+                           should_sell_mask(c, rsi, bb_upper), avg_up, avg_down, count)
+
+
+class StreamingIndicators(object):
+    """
+    RSI (Wilder smoothing) and Bollinger Bands of one close series, updated in O(1) per close.
+    Matches `ta.momentum.rsi` and `ta.volatility.BollingerBands` computed over the whole series.
+    """
+
+    def __init__(self, rsi_window: int = RSI_WINDOW, bb_window: int = BB_WINDOW, bb_window_dev: float = BB_WINDOW_DEV):
+        self.rsi_window = rsi_window
+        self.bb_window = bb_window
+        self.bb_window_dev = bb_window_dev
+        self.alpha = 1 / rsi_window
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.last_close = math.nan
+        self.avg_up = 0.0
+        self.avg_down = 0.0
+        self.closes = np.zeros(self.bb_window, dtype=np.float64)
+        self.pos = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def warm_up(self, closes: np.ndarray) -> IndicatorValues:
+        closes = np.asarray(closes, dtype=np.float64)
+        batch = evaluate_batch(closes[None, :], self.rsi_window, self.bb_window, self.bb_window_dev)
+        return self.load_state(closes, batch.avg_up[0], batch.avg_down[0])
+
+    def load_state(self, closes: np.ndarray, avg_up: float, avg_down: float) -> IndicatorValues:
+        self.reset()
+        closes = closes[~np.isnan(closes)]
+        if len(closes) == 0:
+            return self.values
+
+        self.avg_up = float(avg_up)
+        self.avg_down = float(avg_down)
+        self.last_close = float(closes[-1])
+        self.count = len(closes)
+
+        tail = closes[-self.bb_window:]
+        self.closes[:len(tail)] = tail
+        self.pos = len(tail) % self.bb_window
+        self._sync_bands()
+
+        return self.values
+
+    def update(self, close: float) -> IndicatorValues:
+        if self.count > 0:
+            diff = close - self.last_close
+            self.avg_up += self.alpha * (max(diff, 0.0) - self.avg_up)
+            self.avg_down += self.alpha * (max(-diff, 0.0) - self.avg_down)
+
+        self.last_close = close
+        self.count += 1
+
+        if self.count <= self.bb_window:
+            # window is still filling
+            self.closes[self.pos] = close
+            delta = close - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (close - self.mean)
+        else:
+            old = self.closes[self.pos]
+            self.closes[self.pos] = close
+            mean = self.mean + (close - old) / self.bb_window
+            self.m2 += (close - old) * (close - mean + old - self.mean)
+            self.mean = mean
+
+        self.pos = (self.pos + 1) % self.bb_window
+        if self.pos == 0:
+            # once per window: drop the accumulated float error of the sliding update
+            self._sync_bands()
+
+        return self.values
+
+    def _sync_bands(self):
+        window = self.closes[:min(self.count, self.bb_window)]
+        if len(window) == 0:
+            return
+
+        self.mean = float(window.mean())
+        self.m2 = float(((window - self.mean) ** 2).sum())
+
+    @property
+    def rsi(self) -> float:
+        if self.count < self.rsi_window:
+            return math.nan
+        if self.avg_down == 0:
+            return 100.0
+
+        return 100 - 100 / (1 + self.avg_up / self.avg_down)
+
+    @property
+    def bands(self) -> Tuple[float, float]:
+        if self.count < self.bb_window:
+            return math.nan, math.nan
+
+        std = math.sqrt(max(self.m2, 0.0) / self.bb_window)
+        return self.mean + self.bb_window_dev * std, self.mean - self.bb_window_dev * std
+
+    @property
+    def is_ready(self) -> bool:
+        return self.count >= max(self.rsi_window, self.bb_window)
+
+    @property
+    def values(self) -> IndicatorValues:
+        bb_upper, bb_lower = self.bands
+        return IndicatorValues(self.last_close, self.rsi, bb_upper, bb_lower)
+
+
+class IndicatorEngine(object):
+    def __init__(self, rsi_window: int = RSI_WINDOW, bb_window: int = BB_WINDOW):
+        self.rsi_window = rsi_window
+        self.bb_window = bb_window
+        self.states: Dict[Tuple[str, str], StreamingIndicators] = {}
+
+    def warm_up(self, symbol: str, tf: str, closes: np.ndarray) -> IndicatorValues:
+        state = StreamingIndicators(self.rsi_window, self.bb_window)
+        self.states[(symbol, tf)] = state
+        return state.warm_up(closes)
+
+    def warm_up_batch(self, keys: List[Tuple[str, str]], closes: np.ndarray) -> BatchIndicators:
+        batch = evaluate_batch(closes, self.rsi_window, self.bb_window)
+        for i, key in enumerate(keys):
+            state = StreamingIndicators(self.rsi_window, self.bb_window)
+            state.load_state(closes[i], batch.avg_up[i], batch.avg_down[i])
+            self.states[key] = state
+
+        return batch
+
+    def update(self, symbol: str, tf: str, close: float) -> Optional[IndicatorValues]:
+        state = self.states.get((symbol, tf), None)
+        if state is None:
+            return None
+
+        return state.update(close)
+
+    def get(self, symbol: str, tf: str) -> Optional[IndicatorValues]:
+        state = self.states.get((symbol, tf), None)
+        if state is None or not state.is_ready:
+            return None
+
+        return state.values
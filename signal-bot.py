@@ -1,28 +1,41 @@
 from patch_submod import dummy  # <- REQUIRED
 from tc.core.exchange.binance.public_futures import PublicFuturesBinance
-from tc.core.utils.telegram import send_to_telegram, get_telegram_chat_updates
+from tc.core.utils.telegram import send_to_telegram, get_telegram_chat_updates, TelegramQueue
 import asyncio
+import numpy as np
 from tc.core.types import Symbol, OrderType, Side, SymbolStr, SideEffectType, OrderStatus, Tf
 from datetime import datetime, timedelta
 from typing import Optional, Union, List, Any
 from tc.core.utils.logs import setup_logger, add_traceback
 from tc.core.providers.data_provider import TimescaleDataProvider
-from utils import get_indicators, should_buy, should_sell, BB_WINDOW
+from tc.core.providers.file_data_provider import FileDataProvider
+from utils import should_buy, should_sell
+from indicators import IndicatorEngine, stack_closes
 from tc.config import Config
 import logging
 dummy()
 SIGNAL_FEEDS = ["kline_1h", "kline_4h", "kline_1d"]
+# only the 1h klines are streamed, 4h and 1d candles are built from them
+KLINE_BASE_TF = Tf("1h")
 config = Config.load_from_env()
 setup_logger(config=config)
-MAX_SYMBOLS = 30
+MAX_SYMBOLS = None  # the whole futures universe, streams are sharded over several websocket connections
+WS_SHARDS = 4
 CHANNEL_ID = "-854973697" # Dasein Signal
 
 
 class TradingBot(object):
     def __init__(self):
-        db_provider = TimescaleDataProvider(config)
+        db_provider = TimescaleDataProvider(config) if config.TIMESCALE_DB_HOST else None
+        if config.CANDLES_CACHE_PATH:
+            # local candle files in front of the DB, or on their own on a node without Postgres
+            db_provider = FileDataProvider(config.CANDLES_CACHE_PATH, upstream=db_provider)
         self.client = PublicFuturesBinance(data_provider=db_provider)
+        self.client.ws_shards = WS_SHARDS
+        self.client.kline_base_tf = KLINE_BASE_TF
         self.symbols: List[SymbolStr] = []
+        self.indicators = IndicatorEngine()
+        self.telegram = TelegramQueue()
 
     async def load_symbols(self):
         self.symbols = [symbol for symbol, info in self.client.symbol_info.items()][:MAX_SYMBOLS]
@@ -38,29 +51,40 @@ class TradingBot(object):
         await self.client.subscribe(self.symbols, SIGNAL_FEEDS)
 
     async def preload(self):
-        for symbol, tfs in self.client.candles.items():
-            for tf in tfs:
-                await self.trade_decision(symbol, tf)
+        keys = [(symbol, tf) for symbol, tfs in self.client.candles.items() for tf in tfs]
+        closes = stack_closes([self.client.candles[symbol][tf].column("c") for symbol, tf in keys])
+        batch = self.indicators.warm_up_batch(keys, closes)
+
+        for i in np.flatnonzero(batch.buy | batch.sell):
+            symbol, tf = keys[i]
+            await self.trade_decision(symbol, tf)
 
     async def start(self):
         logging.info("Starting bot...")
         await self.init()
         await self.preload()
 
+    async def close(self):
+        if self.client.data_provider is not None:
+            await self.client.data_provider.close()
+
     async def trade_decision(self, symbol: SymbolStr, tf: Tf):
-        candles = get_indicators(self.client.candles[symbol][tf].iloc[-1*(BB_WINDOW + 1):])
-        row = candles.iloc[-1]
+        row = self.indicators.get(symbol, tf)
+        if row is None:
+            return
+
         msg = f"{symbol}_{tf} rsi: {row.rsi} bb: {row.bb_upper} | {row.c} | {row.bb_lower}"
 
         if should_buy(row):
-            await send_to_telegram(f"{msg} => <strong>BUY</strong>", CHANNEL_ID)
+            self.telegram.send(f"{msg} => <strong>BUY</strong>", CHANNEL_ID)
         elif should_sell(row):
-            await send_to_telegram(f"{msg} => <strong>SELL</strong>", CHANNEL_ID)
+            self.telegram.send(f"{msg} => <strong>SELL</strong>", CHANNEL_ID)
 
     async def on_candle_callback(self, symbol: SymbolStr, tf: Tf, candle_closed: bool, candle_item: List[Any],
                                  close_time: datetime):
         try:
             if candle_closed:
+                self.indicators.update(symbol, tf, candle_item[4])
                 await self.trade_decision(symbol, tf)
         except Exception as e:
             logging.error(add_traceback(e))
@@ -79,5 +103,8 @@ if __name__ == "__main__":
                 await asyncio.sleep(5)
         except Exception as e:
             logging.error(add_traceback(e))
+        finally:
+            # Ctrl+C cancels main, the data provider still writes what it buffered
+            await bot.close()
 
     asyncio.run(main())
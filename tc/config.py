@@ -9,6 +9,11 @@ MAX_CANDLES = 1000
 ZMQ_CLUSTERS_PORT = 5555
 ZMQ_ARBITRAGE_BOT_PORT = 5544
 CMD_ARBITRAGE_SPREADS = "arbitrage_spreads"
+# TimesScaleDb defaults, overridden by the env variables of the same name
+TIMESCALE_DB_POOL_MIN_SIZE = 2
+TIMESCALE_DB_POOL_MAX_SIZE = 10
+# seconds, enforced by the server for every statement of the session
+TIMESCALE_DB_STATEMENT_TIMEOUT = 60
 
 
 class SingletonClass(object):
@@ -38,6 +43,10 @@ class Config(SingletonClass):
     TIMESCALE_DB_USERNAME: str
     TIMESCALE_DB_PASSWORD: str
     TIMESCALE_DB_INIT_SQL_FILE: str
+    TIMESCALE_DB_POOL_MIN_SIZE: int
+    TIMESCALE_DB_POOL_MAX_SIZE: int
+    TIMESCALE_DB_STATEMENT_TIMEOUT: float
+    CANDLES_CACHE_PATH: Optional[str]
     DATA_COLLECTOR_ITEMS_COUNT: str
     ORACLE_SYMBOLS_COUNT: int
     ORACLE_TFS: List[str]
@@ -54,7 +63,9 @@ class Config(SingletonClass):
     @staticmethod
     def get_timescale_db_params() -> Dict[str, Any]:
         return dict(host=Config.TIMESCALE_DB_HOST, username=Config.TIMESCALE_DB_USERNAME,
-                    password=Config.TIMESCALE_DB_PASSWORD)
+                    password=Config.TIMESCALE_DB_PASSWORD, pool_min_size=Config.TIMESCALE_DB_POOL_MIN_SIZE,
+                    pool_max_size=Config.TIMESCALE_DB_POOL_MAX_SIZE,
+                    statement_timeout=Config.TIMESCALE_DB_STATEMENT_TIMEOUT)
 
     @staticmethod
     def load_from_env(root_path: Optional[str] = ".", env_file_name: Optional[str] = '.env'):
@@ -81,6 +92,11 @@ class Config(SingletonClass):
         Config.TIMESCALE_DB_USERNAME = os.getenv("POSTGRES_USER")
         Config.TIMESCALE_DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
         Config.TIMESCALE_DB_INIT_SQL_FILE = os.getenv("TIMESCALE_DB_INIT_SQL_FILE")
+        Config.TIMESCALE_DB_POOL_MIN_SIZE = int(os.getenv("TIMESCALE_DB_POOL_MIN_SIZE", TIMESCALE_DB_POOL_MIN_SIZE))
+        Config.TIMESCALE_DB_POOL_MAX_SIZE = int(os.getenv("TIMESCALE_DB_POOL_MAX_SIZE", TIMESCALE_DB_POOL_MAX_SIZE))
+        Config.TIMESCALE_DB_STATEMENT_TIMEOUT = float(os.getenv("TIMESCALE_DB_STATEMENT_TIMEOUT",
+                                                                TIMESCALE_DB_STATEMENT_TIMEOUT))
+        Config.CANDLES_CACHE_PATH = os.getenv("CANDLES_CACHE_PATH", None)
         Config.DATA_COLLECTOR_ITEMS_COUNT = os.getenv("DATA_COLLECTOR_ITEMS_COUNT", 2)
         Config.ORACLE_SYMBOLS_COUNT = int(os.getenv("ORACLE_SYMBOLS_COUNT", 20))
         Config.ORACLE_TFS = os.getenv("ORACLE_TFS", "1d,4h,1h,15m").split(",")
@@ -0,0 +1,113 @@
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+PG_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PG_COPY_TRAILER = struct.pack(">h", -1)
+# binary TIMESTAMP is microseconds since 2000-01-01
+PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")
+
+PG_TYPES = {
+    "timestamp": ">i8",
+    "int4": ">i4",
+    "int8": ">i8",
+    "float8": ">f8",
+    "bool": "?",
+}
+
+CANDLES_COPY_COLUMNS: List[Tuple[str, str]] = [
+    ("timestamp", "timestamp"),
+    ("symbol_tf_id", "int4"),
+    ("o", "float8"),
+    ("h", "float8"),
+    ("l", "float8"),
+    ("c", "float8"),
+    ("v", "float8"),
+]
+
+TRADES_COPY_COLUMNS: List[Tuple[str, str]] = [
+    ("timestamp", "timestamp"),
+    ("symbol_tf_id", "int4"),
+    ("price", "float8"),
+    ("volume", "float8"),
+    ("is_buyer", "bool"),
+]
+
+
+def copy_dtype(columns: List[Tuple[str, str]]) -> np.dtype:
+    """
+    One binary COPY tuple as a packed structured dtype: field count, then (length, value) per column.
+    Only fixed width, NOT NULL columns fit.
+    """
+    fields = [("_count", ">i2")]
+    for name, pg_type in columns:
+        fields += [(f"_{name}_len", ">i4"), (name, PG_TYPES[pg_type])]
+
+    return np.dtype(fields)
+
+
+def to_pg_timestamp(timestamps: Any) -> np.ndarray:
+    return (np.asarray(timestamps, dtype="datetime64[us]") - PG_EPOCH).astype(np.int64)
+
+
+def encode_copy(columns: List[Tuple[str, str]], values: Dict[str, Any], rows: int) -> bytes:
+    """
+    Encode columns (arrays of `rows` items or scalars) into a PostgreSQL binary COPY payload.
+    """
+    dtype = copy_dtype(columns)
+    records = np.empty(rows, dtype=dtype)
+    records["_count"] = len(columns)
+    for name, pg_type in columns:
+        records[f"_{name}_len"] = dtype[name].itemsize
+        value = values[name]
+        records[name] = to_pg_timestamp(value) if pg_type == "timestamp" else value
+
+    return PG_COPY_HEADER + records.tobytes() + PG_COPY_TRAILER
+
+
+def decode_copy(payload: bytes, columns: List[Tuple[str, str]]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Decode a binary COPY TO payload straight into per-column numpy arrays.
+    Returns None when the rows don't fit the fixed width layout (NULLs, unexpected lengths).
+    """
+    if not payload.startswith(PG_COPY_HEADER[:11]):
+        return None
+
+    (extension_length,) = struct.unpack_from(">i", payload, 15)
+    start = 19 + extension_length
+    end = len(payload) - len(PG_COPY_TRAILER)
+    dtype = copy_dtype(columns)
+    if (end - start) % dtype.itemsize != 0 or payload[end:] != PG_COPY_TRAILER:
+        return None
+
+    records = np.frombuffer(payload, dtype=dtype, count=(end - start) // dtype.itemsize, offset=start)
+    if not (records["_count"] == len(columns)).all():
+        return None
+
+    result = {}
+    for name, pg_type in columns:
+        if not (records[f"_{name}_len"] == dtype[name].itemsize).all():
+            return None
+        if pg_type == "timestamp":
+            result[name] = (PG_EPOCH + records[name].astype(np.int64)).astype("datetime64[ns]")
+        else:
+            result[name] = records[name].astype(dtype[name].newbyteorder("="))
+
+    return result
+
+
+def encode_candles_copy(candles: pd.DataFrame, symbol_tf_id: int) -> bytes:
+    values = {name: candles[name].to_numpy(dtype=np.float64) for name in ["o", "h", "l", "c", "v"]}
+    values["timestamp"] = candles.index.values
+    values["symbol_tf_id"] = symbol_tf_id
+
+    return encode_copy(CANDLES_COPY_COLUMNS, values, len(candles))
+
+
+def encode_trades_copy(symbol_tf_id: int, timestamps: np.ndarray, prices: np.ndarray, volumes: np.ndarray,
+                       is_buyer: np.ndarray) -> bytes:
+    values = dict(timestamp=timestamps, symbol_tf_id=symbol_tf_id, price=prices, volume=volumes, is_buyer=is_buyer)
+    return encode_copy(TRADES_COPY_COLUMNS, values, len(timestamps))
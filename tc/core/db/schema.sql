@@ -41,10 +41,13 @@ CREATE TABLE IF NOT EXISTS symbol_status (
                        last_volume   DOUBLE PRECISION,
                        active   boolean,
                        cluster_size DOUBLE PRECISION,
+                       first_available TIMESTAMP,
                        PRIMARY KEY (symbol_tf_id),
                        FOREIGN KEY (symbol_tf_id) REFERENCES symbol_tf (id)
                        );
 
+ALTER TABLE symbol_status ADD COLUMN IF NOT EXISTS first_available TIMESTAMP;
+
 CREATE TABLE IF NOT EXISTS clusters (
                        symbol_tf_id INTEGER,
                        timestamp   TIMESTAMP NOT NULL,
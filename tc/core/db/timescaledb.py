@@ -1,37 +1,79 @@
 import asyncio
+from contextlib import asynccontextmanager
+
 import asyncpg
 
-from datetime import datetime
-from typing import Optional, Union, Dict, Any, List
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional, Union, Dict, Any, List
 from urllib.parse import quote_plus
 
+import numpy as np
 import pandas as pd
 
-from config import Config
+from config import Config, TIMESCALE_DB_POOL_MAX_SIZE, TIMESCALE_DB_POOL_MIN_SIZE, TIMESCALE_DB_STATEMENT_TIMEOUT
 from core.base import CoreBase
 
 from core.types import Singleton, SymbolStr, Tf, Tuple, TaLevels
 from core.utils.data import candles_to_data_frame
+from core.utils.timeframe import tf_size_minutes
 import logging
 
-
-def get_timestamp_condition(ts_from: Optional[datetime] = None, ts_to: Optional[datetime] = None) -> str:
-    def format_date(date: datetime):
-        return date.strftime("%Y-%m-%d %H:%M:%S")
-
-    if ts_from is not None and ts_to is not None:
-        return f" timestamp >= '{format_date(ts_from)}' AND timestamp < '{format_date(ts_to)}' "
-    elif ts_from is not None and ts_to is None:
-        return f" timestamp >= '{format_date(ts_from)}' "
-    elif ts_from is None and ts_to is not None:
-        return f" timestamp < '{format_date(ts_to)}' "
-
-    return " 1=1"
+from core.db.trades_writer import TradesWriter
+from core.db.pg_copy import CANDLES_COPY_COLUMNS, PG_TYPES, TRADES_COPY_COLUMNS, decode_copy, encode_candles_copy, \
+    encode_trades_copy
+
+COPY_TIMEOUT = 10
+# prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+# rows per frame of the iter_* generators
+STREAM_CHUNK_SIZE = 100_000
+# expected rows from which a load reads a binary COPY: below it the round trip asyncpg spends interpolating
+# the arguments into the COPY costs more than decoding the Records
+COLUMNAR_MIN_ROWS = 300
+
+
+def get_timestamp_condition(ts_from: Optional[datetime] = None, ts_to: Optional[datetime] = None,
+                            first_arg: int = 1) -> Tuple[str, List[datetime]]:
+    """
+    Parameterized timestamp range: the statement text only depends on which bounds are set,
+    so each query shape is prepared once per connection.
+    """
+    conditions = []
+    args = []
+    if ts_from is not None:
+        conditions.append(f"timestamp >= ${first_arg + len(args)}")
+        args.append(ts_from)
+    if ts_to is not None:
+        conditions.append(f"timestamp < ${first_arg + len(args)}")
+        args.append(ts_to)
+
+    return f" {' AND '.join(conditions) if len(conditions) > 0 else '1=1'} ", args
+
+
+def is_bulk_load(tf: Tf, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
+                 series: int = 1) -> bool:
+    # an open start means the whole history
+    if start_time is None:
+        return True
+
+    span = (end_time if end_time is not None else datetime.utcnow()) - start_time
+    return series * (span / timedelta(minutes=tf_size_minutes(tf))) >= COLUMNAR_MIN_ROWS
+
+
+@asynccontextmanager
+async def bulk_transaction(conn: asyncpg.connection.Connection) -> AsyncIterator[None]:
+    # the importer's scans and staged inserts may run past the session statement_timeout,
+    # SET LOCAL lifts it until the transaction ends
+    async with conn.transaction():
+        await conn.execute("SET LOCAL statement_timeout = 0")
+        yield
 
 
 class TimesScaleDb(object, metaclass=Singleton):
     def __init__(self, host: str, username: str,
-                 password: str, use_pool=False):
+                 password: str, use_pool=True, pool_min_size: int = TIMESCALE_DB_POOL_MIN_SIZE,
+                 pool_max_size: int = TIMESCALE_DB_POOL_MAX_SIZE,
+                 statement_timeout: Optional[float] = TIMESCALE_DB_STATEMENT_TIMEOUT):
         self.host = host
         self.username = username
         self.password = password
@@ -40,6 +82,14 @@ class TimesScaleDb(object, metaclass=Singleton):
         self.init_time = datetime.utcnow()
         self.symbol_tf: Dict[Tuple[SymbolStr, Tf], int] = {}
         self.use_pool = use_pool
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self.statement_timeout = statement_timeout
+        self._conn_lock: Optional[asyncio.Lock] = None
+        # (name, type) of the result columns per sql text, for results without rows
+        self.result_columns: Dict[str, List[Tuple[str, str]]] = {}
+        # batches the trades of add_trade, started by the first one
+        self.trades_writer: Optional[TradesWriter] = None
 
     async def init(self, simple=False):
         if self.conn is None:
@@ -49,45 +99,115 @@ class TimesScaleDb(object, metaclass=Singleton):
                           database="timescaledb",
                           host=self.host,
                           port="5432")
+            # fetch/fetchval/cursor take their statements from the connection's LRU cache keyed by the sql text
+            params["statement_cache_size"] = STATEMENT_CACHE_SIZE
+            if self.statement_timeout:
+                params["server_settings"] = {"statement_timeout": str(int(self.statement_timeout * 1000))}
+
             if self.use_pool:
-                self.conn = await asyncpg.create_pool(**params)
+                self.conn = await asyncpg.create_pool(**params, min_size=min(self.pool_min_size, self.pool_max_size),
+                                                      max_size=self.pool_max_size)
             else:
                 self.conn = await asyncpg.connect(**params)
+                self._conn_lock = asyncio.Lock()
 
             if not simple:
                 # await self.init_migration()
                 await self.init_symbols()
 
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.connection.Connection]:
+        # a connection per call: from the pool, or the single connection, one call at a time
+        if self.use_pool:
+            async with self.conn.acquire() as conn:
+                yield conn
+        else:
+            async with self._conn_lock:
+                yield self.conn
+
     async def init_migration(self):
         try:
             sql_file = open(Config.TIMESCALE_DB_INIT_SQL_FILE, 'r')
             sql = sql_file.read()
-            await self.conn.execute(sql)
+            async with self.acquire() as conn:
+                await conn.execute(sql)
         except Exception as e:
             logging.warning(e)
 
-    async def fetch_as_dataframe(self, sql: str, *args):
-        if self.use_pool:
-            async with self.conn.acquire() as conn:
-                stmt = await conn.prepare(sql)
-                columns = [a.name for a in stmt.get_attributes()]
-                data = await stmt.fetch(*args)
-        else:
-            stmt = await self.conn.prepare(sql)
-            columns = [a.name for a in stmt.get_attributes()]
-            data = await stmt.fetch(*args)
+    async def close(self):
+        if self.trades_writer is not None:
+            await self.trades_writer.close()
+            self.trades_writer = None
+
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
+
+    async def get_result_columns(self, conn: asyncpg.connection.Connection, sql: str) -> List[Tuple[str, str]]:
+        # the columns of a query don't depend on the connection, it is described once
+        if sql not in self.result_columns:
+            stmt = await conn.prepare(sql)
+            self.result_columns[sql] = [(a.name, a.type.name) for a in stmt.get_attributes()]
+
+        return self.result_columns[sql]
+
+    async def fetch_as_dataframe(self, sql: str, *args, columnar: bool = False):
+        """
+        `columnar` reads the rows with a binary COPY TO decoded per column instead of one Record per row.
+        COPY can't bind arguments, asyncpg interpolates them with an extra round trip and without the statement
+        cache, so it is for bulk loads (see COLUMNAR_MIN_ROWS). Columns that aren't fixed width, or NULLs, fall
+        back to `fetch`.
+        """
+        async with self.acquire() as conn:
+            copy_columns = await self.get_result_columns(conn, sql) if columnar else []
+            if len(copy_columns) > 0 and all(pg_type in PG_TYPES for _, pg_type in copy_columns):
+                buffer = bytearray()
+
+                async def output(chunk: bytes):
+                    buffer.extend(chunk)
+
+                await conn.copy_from_query(sql, *args, output=output, format="binary")
+                data = decode_copy(buffer, copy_columns)
+                if data is not None:
+                    return pd.DataFrame(data, columns=[name for name, _ in copy_columns])
+
+            data = await conn.fetch(sql, *args)
+            if len(data) > 0:
+                columns = list(data[0].keys())
+            else:
+                columns = [name for name, _ in await self.get_result_columns(conn, sql)]
         return pd.DataFrame(data, columns=columns)
 
+    async def iter_as_dataframe(self, sql: str, *args, chunk_size: int = STREAM_CHUNK_SIZE,
+                                index: Optional[str] = None) -> AsyncIterator[pd.DataFrame]:
+        """
+        Query rows in frames of up to `chunk_size` rows, read from a server-side cursor.
+        The connection is held until the generator is exhausted or closed (`aclose`), so don't leave it half read.
+        """
+        async with self.acquire() as conn:
+            # a cursor only lives inside a transaction
+            async with conn.transaction():
+                cursor = await conn.cursor(sql, *args)
+                while True:
+                    rows = await cursor.fetch(chunk_size)
+                    if len(rows) == 0:
+                        break
+
+                    df = pd.DataFrame(rows, columns=list(rows[0].keys()))
+                    yield df if index is None else df.set_index(index)
+                    if len(rows) < chunk_size:
+                        break
+
     async def add_symbol(self, symbol: SymbolStr, tf: Tf):
-        try:
-            id = await self.conn.fetchval(f"INSERT INTO symbol_tf(symbol, tf) VALUES('{symbol}', '{tf}') RETURNING id")
-            logging.warning(f"{symbol}, {tf} ADDED id: {id}")
+        # the no-op update makes RETURNING give the id of a row added meanwhile by another task or process
+        async with self.acquire() as conn:
+            id = await conn.fetchval("INSERT INTO symbol_tf(symbol, tf) VALUES($1, $2) "
+                                     "ON CONFLICT (symbol, tf) DO UPDATE SET symbol = EXCLUDED.symbol RETURNING id",
+                                     symbol, tf)
+        logging.warning(f"{symbol}, {tf} id: {id}")
 
-            self.symbol_tf[(symbol, tf)] = id
-            return id
-        except asyncpg.exceptions.UniqueViolationError:
-            logging.warning(f"{symbol}, {tf} - already exist!")
-            return self.symbol_tf[(symbol, tf)]
+        self.symbol_tf[(symbol, tf)] = id
+        return id
 
     async def add_symbol_status(self, symbol: SymbolStr, last_sync: datetime, last_volume: float, active: bool):
         symbol_tf_id = await self.get_symbol_tf_id(symbol)
@@ -95,11 +215,13 @@ class TimesScaleDb(object, metaclass=Singleton):
         VALUES($1, $2, $3, $4) 
         ON CONFLICT (symbol_tf_id) DO UPDATE SET last_sync=$2, last_volume=$3, active=$4;"""
 
-        await self.conn.execute(statement, symbol_tf_id, last_sync, last_volume, active)
+        async with self.acquire() as conn:
+            await conn.execute(statement, symbol_tf_id, last_sync, last_volume, active)
 
     async def update_symbol_status_one_value(self, symbol: SymbolStr, last_sync: Optional[datetime] = None,
                                              last_volume: Optional[float] = None, active: Optional[bool] = None,
-                                             cluster_size: Optional[float] = None):
+                                             cluster_size: Optional[float] = None,
+                                             first_available: Optional[datetime] = None):
         symbol_tf_id = await self.get_symbol_tf_id(symbol)
         column = ""
         value: Optional[Union[float, datetime, bool]] = None
@@ -115,22 +237,36 @@ class TimesScaleDb(object, metaclass=Singleton):
         elif cluster_size is not None:
             column = "cluster_size"
             value = cluster_size
+        elif first_available is not None:
+            column = "first_available"
+            value = first_available
 
-        await self.conn.execute(
-            f'UPDATE symbol_status SET {column}=$2 WHERE symbol_tf_id=$1', symbol_tf_id, value)
+        async with self.acquire() as conn:
+            await conn.execute(f'UPDATE symbol_status SET {column}=$2 WHERE symbol_tf_id=$1', symbol_tf_id, value)
 
     async def get_symbol_status(self, active: Optional[bool] = None,
                                 symbol: Optional[SymbolStr] = None) -> Union[Dict[str, Any],
                                                                              List[Dict[str, Any]]]:
         statement = f"""SELECT symbol_status.symbol_tf_id, symbol_tf.symbol, symbol_status.last_sync, 
-        symbol_status.last_volume, symbol_status.active, symbol_status.cluster_size
+        symbol_status.last_volume, symbol_status.active, symbol_status.cluster_size, symbol_status.first_available
         FROM symbol_status JOIN symbol_tf ON symbol_status.symbol_tf_id = symbol_tf.id """
-        if symbol is not None:
-            statement += f" WHERE symbol='{symbol}' and tf='1d'"
-            return await self.conn.fetchrow(statement)
-        elif active is not None:
-            statement += f" WHERE active={str(active).lower()}"
-            return await self.conn.fetch(statement)
+        async with self.acquire() as conn:
+            if symbol is not None:
+                statement += " WHERE symbol=$1 and tf='1d'"
+                return await conn.fetchrow(statement, symbol)
+            elif active is not None:
+                statement += " WHERE active=$1"
+                return await conn.fetch(statement, active)
+
+    async def load_first_available(self, symbols: List[SymbolStr]) -> Dict[SymbolStr, datetime]:
+        # the first candle the exchange has for a symbol, recorded by the importer once it is known
+        statement = """SELECT symbol_tf.symbol, symbol_status.first_available
+        FROM symbol_status JOIN symbol_tf ON symbol_status.symbol_tf_id = symbol_tf.id
+        WHERE symbol = ANY($1::varchar[]) AND tf='1d' AND first_available IS NOT NULL"""
+        async with self.acquire() as conn:
+            rows = await conn.fetch(statement, list(symbols))
+
+        return {SymbolStr(row["symbol"]): row["first_available"] for row in rows}
 
     async def get_symbol_tf_id(self, symbol: SymbolStr, tf: Optional[Tf] = '1d'):
         if (symbol, tf) not in self.symbol_tf.keys():
@@ -141,49 +277,43 @@ class TimesScaleDb(object, metaclass=Singleton):
         return symbol_tf_id
 
     async def init_symbols(self):
-        self.symbol_tf = {(SymbolStr(i['symbol']), Tf(i['tf'])): i['id']
-                          for i in await self.conn.fetch(f'SELECT * from symbol_tf')}
+        async with self.acquire() as conn:
+            rows = await conn.fetch(f'SELECT * from symbol_tf')
+        self.symbol_tf = {(SymbolStr(i['symbol']), Tf(i['tf'])): i['id'] for i in rows}
 
         return self.symbol_tf
 
-    async def save_candles(self, symbol: SymbolStr, tf: Tf, candles: pd.DataFrame):
+    async def save_candles(self, symbol: SymbolStr, tf: Tf, candles: pd.DataFrame, replace: bool = False,
+                           bulk: bool = False):
         logging.info(f"Save candles {symbol} {tf} - {len(candles)} {datetime.utcnow() - self.init_time}")
-        candles['timestamp'] = candles.index
-        candles['symbol_tf_id'] = await self.get_symbol_tf_id(symbol, tf)
-
-        tuples = [tuple(x) for x in candles.values]
-        columns = list(candles.columns)
-        candles.drop(['timestamp', 'symbol_tf_id'], axis=1)
-        try:
-            # INSERT ON CONFLICT DO UPDATE
-            # await self.conn.execute("CREATE TEMPORARY TABLE _candles (timestamp TIMESTAMP,"
-            #                         "symbol_tf_id INTEGER,"
-            #                         "o   DOUBLE PRECISION,"
-            #                         "h   DOUBLE PRECISION,"
-            #                         "l   DOUBLE PRECISION,"
-            #                         "c   DOUBLE PRECISION,"
-            #                         "v   DOUBLE PRECISION)")
-            try:
-                await self.conn.copy_records_to_table("candles", records=tuples, columns=columns,
-                                                      timeout=10)
-            except asyncpg.exceptions.UniqueViolationError as e:
-                statement = f"""INSERT INTO candles ({",".join(columns)}) 
-                VALUES($1, $2, $3, $4, $5, $6, $7) 
-                ON CONFLICT (timestamp, symbol_tf_id) DO NOTHING;"""
-                await self.conn.executemany(statement, tuples)
-
-            # await conn.execute('''CREATE TEMPORARY TABLE _data(
-            #     timestamp TIMESTAMP, value NUMERIC
-            # )''')
-            # await conn.copy_records_to_table('_data', records=values)
-            # await conn.execute('''
-            #     INSERT INTO {table}(timestamp, value)
-            #     SELECT * FROM _data
-            #     ON CONFLICT (timestamp)
-            #     DO UPDATE SET value=EXCLUDED.value
-            # '''.format(table=table))
-        except asyncpg.exceptions.UniqueViolationError as e:
-            logging.warning(f"save candles error {e}")
+        if len(candles) == 0:
+            return
+
+        payload = encode_candles_copy(candles, await self.get_symbol_tf_id(symbol, tf))
+        await self.copy_upsert("candles", CANDLES_COPY_COLUMNS, payload, replace=replace, bulk=bulk)
+
+    async def copy_upsert(self, table: str, columns: List[Tuple[str, str]], payload: bytes, replace: bool = False,
+                          bulk: bool = False):
+        # binary COPY into a session temp table, then one INSERT ... SELECT skips the rows already stored,
+        # or overwrites them with `replace`. A `bulk` write runs without the statement and COPY timeouts
+        stage_table = f"_{table}_stage"
+        names = ", ".join(name for name, _ in columns)
+        key = ("symbol_tf_id", "timestamp")
+        if replace:
+            updates = ", ".join(f"{name} = EXCLUDED.{name}" for name, _ in columns if name not in key)
+            on_conflict = f"DO UPDATE SET {updates}"
+        else:
+            on_conflict = "DO NOTHING"
+        async with self.acquire() as conn:
+            async with bulk_transaction(conn) if bulk else conn.transaction():
+                await conn.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {stage_table} "
+                                   f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+                # memoryview: asyncpg would take plain bytes for a file path
+                await conn.copy_to_table(stage_table, source=memoryview(payload), format="binary",
+                                         columns=[name for name, _ in columns],
+                                         timeout=None if bulk else COPY_TIMEOUT)
+                await conn.execute(f"INSERT INTO {table} ({names}) SELECT {names} FROM {stage_table} "
+                                   f"ON CONFLICT ({', '.join(key)}) {on_conflict}")
 
     async def load_candles(
             self,
@@ -198,30 +328,149 @@ class TimesScaleDb(object, metaclass=Singleton):
 
         symbol_tf_id = self.symbol_tf[(symbol, tf)]
 
-        statement = f"SELECT * FROM candles WHERE symbol_tf_id = {symbol_tf_id} AND " \
-                    f"{get_timestamp_condition(start_time, end_time)} " \
-                    f"ORDER BY timestamp ASC"
+        condition, args = get_timestamp_condition(start_time, end_time, first_arg=2)
+        statement = f"SELECT * FROM candles WHERE symbol_tf_id = $1 AND {condition} ORDER BY timestamp ASC"
 
         # logging.info(f"Load candles {symbol} {tf} -  {statement}")
 
-        df = await self.fetch_as_dataframe(statement)
+        df = await self.fetch_as_dataframe(statement, symbol_tf_id, *args,
+                                           columnar=is_bulk_load(tf, start_time, end_time))
 
         return df.set_index("timestamp")
 
-    async def load_last_candle_timestamp(self, symbol: SymbolStr, tf: Tf):
+    async def iter_candles(
+            self,
+            symbol: SymbolStr,
+            tf: Tf,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            chunk_size: int = STREAM_CHUNK_SIZE,
+    ) -> AsyncIterator[pd.DataFrame]:
+        """
+        Same candles as `load_candles`, streamed in timestamp order with at most `chunk_size` rows in memory.
+        """
         if (symbol, tf) not in self.symbol_tf.keys():
-            return None
+            return
+
+        condition, args = get_timestamp_condition(start_time, end_time, first_arg=2)
+        statement = f"SELECT * FROM candles WHERE symbol_tf_id = $1 AND {condition} ORDER BY timestamp ASC"
+        async for df in self.iter_as_dataframe(statement, self.symbol_tf[(symbol, tf)], *args,
+                                               chunk_size=chunk_size, index="timestamp"):
+            yield df
+
+    async def load_candles_many(
+            self,
+            symbols: List[SymbolStr],
+            tf: Tf,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+    ) -> Dict[SymbolStr, pd.DataFrame]:
+        """
+        Candles of many symbols in one query, split into a frame per symbol.
+        Symbols without stored candles get an empty frame.
+        """
+        logging.info(f"Load candles {len(symbols)} symbols {tf} -  {datetime.utcnow() - self.init_time}")
+        ids = {self.symbol_tf[(symbol, tf)]: symbol for symbol in symbols if (symbol, tf) in self.symbol_tf}
+        result = {symbol: candles_to_data_frame([]) for symbol in symbols}
+        if len(ids) == 0:
+            return result
+
+        condition, args = get_timestamp_condition(start_time, end_time, first_arg=2)
+        statement = f"SELECT * FROM candles WHERE symbol_tf_id = ANY($1::int[]) AND {condition} " \
+                    f"ORDER BY symbol_tf_id, timestamp ASC"
+
+        df = await self.fetch_as_dataframe(statement, list(ids.keys()), *args,
+                                           columnar=is_bulk_load(tf, start_time, end_time, series=len(ids)))
+        df.set_index("timestamp", inplace=True)
+
+        # rows come ordered by symbol_tf_id: the bounds of every symbol in one searchsorted pass
+        keys = np.array(sorted(ids.keys()))
+        row_ids = df["symbol_tf_id"].to_numpy()
+        starts = np.searchsorted(row_ids, keys, side="left")
+        ends = np.searchsorted(row_ids, keys, side="right")
+        for symbol_tf_id, start, end in zip(keys, starts, ends):
+            result[ids[symbol_tf_id]] = df.iloc[start:end]
+
+        return result
+
+    async def load_candle_gaps(
+            self,
+            symbols: List[SymbolStr],
+            tf: Tf,
+            start_time: datetime,
+            end_time: datetime,
+    ) -> Dict[SymbolStr, List[Tuple[datetime, datetime]]]:
+        """
+        Missing candles of many symbols in one query, as [from, to) ranges of open times within
+        [start_time, end_time). A candle is expected every tf from the aligned `start_time` on.
+        """
+        result = {symbol: [(start_time, end_time)] if start_time < end_time else [] for symbol in symbols}
+        ids = {self.symbol_tf[(symbol, tf)]: symbol for symbol in symbols if (symbol, tf) in self.symbol_tf}
+        if len(ids) == 0 or start_time >= end_time:
+            return result
+
+        # the stored candles are compared with their successors by lead(), only the rows before a hole come back.
+        # Every stored symbol also gets its head row: [start_time, first candle), empty when nothing is missing
+        statement = """
+            WITH stored AS (
+                SELECT symbol_tf_id, timestamp,
+                       lead(timestamp) OVER (PARTITION BY symbol_tf_id ORDER BY timestamp) AS next_timestamp
+                FROM candles WHERE symbol_tf_id = ANY($1::int[]) AND timestamp >= $2 AND timestamp < $3
+            )
+            SELECT symbol_tf_id, $2 AS gap_from, min(timestamp) AS gap_to FROM stored GROUP BY symbol_tf_id
+            UNION ALL
+            SELECT symbol_tf_id, timestamp + $4::interval AS gap_from, COALESCE(next_timestamp, $3) AS gap_to
+            FROM stored WHERE COALESCE(next_timestamp, $3) > timestamp + $4::interval
+            ORDER BY symbol_tf_id, gap_from
+        """
+        step = timedelta(minutes=tf_size_minutes(tf))
+        async with self.acquire() as conn:
+            # a scan of the whole history
+            async with bulk_transaction(conn):
+                rows = await conn.fetch(statement, list(ids.keys()), start_time, end_time, step)
+
+        for symbol_tf_id in set(row["symbol_tf_id"] for row in rows):
+            result[ids[symbol_tf_id]] = []
+        for row in rows:
+            if row["gap_to"] > row["gap_from"]:
+                result[ids[row["symbol_tf_id"]]].append((row["gap_from"], row["gap_to"]))
 
-        symbol_tf_id = self.symbol_tf[(symbol, tf)]
-        result = await self.conn.fetchval(f"SELECT timestamp FROM CANDLES where symbol_tf_id = {symbol_tf_id} ")
         return result
 
+    async def load_last_candle_timestamps(self, symbols: List[SymbolStr], tf: Tf) -> Dict[SymbolStr, datetime]:
+        # the newest stored candle of every symbol in one aggregate query, symbols without candles are left out
+        ids = {self.symbol_tf[(symbol, tf)]: symbol for symbol in symbols if (symbol, tf) in self.symbol_tf}
+        if len(ids) == 0:
+            return {}
+
+        statement = "SELECT symbol_tf_id, max(timestamp) AS timestamp FROM candles " \
+                    "WHERE symbol_tf_id = ANY($1::int[]) GROUP BY symbol_tf_id"
+        async with self.acquire() as conn:
+            rows = await conn.fetch(statement, list(ids.keys()))
+
+        return {ids[row["symbol_tf_id"]]: row["timestamp"] for row in rows if row["timestamp"] is not None}
+
+    async def load_last_candle_timestamp(self, symbol: SymbolStr, tf: Tf):
+        return (await self.load_last_candle_timestamps([symbol], tf)).get(symbol, None)
+
     async def add_trade(self, symbol: SymbolStr, price: float, volume: float, is_buyer: bool, timestamp: datetime):
-        symbol_tf_id = await self.get_symbol_tf_id(symbol)
+        """
+        Buffered: the trade is written with the next batch of its symbol (`TradesWriter`), `close` writes the rest.
+        The signature is the one of `PublicBinance.on_trade_callback`.
+        """
+        if self.trades_writer is None:
+            self.trades_writer = TradesWriter(self)
+            self.trades_writer.start()
+
+        self.trades_writer.add(symbol, price, volume, is_buyer, timestamp)
 
-        await self.conn.execute("INSERT INTO trades (symbol_tf_id, price, volume, is_buyer, timestamp) "
-                                "VALUES ($1, $2, $3, $4, $5) ON CONFLICT (timestamp, symbol_tf_id) DO NOTHING;",
-                                symbol_tf_id, price, volume, is_buyer, timestamp)
+    async def save_trades(self, symbol: SymbolStr, timestamps: np.ndarray, prices: np.ndarray, volumes: np.ndarray,
+                          is_buyer: np.ndarray):
+        if len(timestamps) == 0:
+            return
+
+        payload = encode_trades_copy(await self.get_symbol_tf_id(symbol), timestamps, prices, volumes, is_buyer)
+        await self.copy_upsert("trades", TRADES_COPY_COLUMNS, payload)
 
     async def load_trades(
             self,
@@ -232,11 +481,31 @@ class TimesScaleDb(object, metaclass=Singleton):
         logging.info(f"Load trades {symbol} - {start_time} - {end_time} | {datetime.utcnow() - self.init_time}")
         symbol_tf_id = await self.get_symbol_tf_id(symbol)
 
-        df = await self.fetch_as_dataframe(f"SELECT * FROM trades WHERE symbol_tf_id = {symbol_tf_id} AND "
-                                           f"{get_timestamp_condition(start_time, end_time)}")
+        condition, args = get_timestamp_condition(start_time, end_time, first_arg=2)
+        # trades come many per minute, any range of them is a bulk load
+        df = await self.fetch_as_dataframe(f"SELECT * FROM trades WHERE symbol_tf_id = $1 AND {condition}",
+                                           symbol_tf_id, *args, columnar=True)
 
         return df.set_index("timestamp")
 
+    async def iter_trades(
+            self,
+            symbol: SymbolStr,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            chunk_size: int = STREAM_CHUNK_SIZE,
+    ) -> AsyncIterator[pd.DataFrame]:
+        """
+        Same trades as `load_trades`, streamed in timestamp order with at most `chunk_size` rows in memory.
+        """
+        symbol_tf_id = await self.get_symbol_tf_id(symbol)
+
+        condition, args = get_timestamp_condition(start_time, end_time, first_arg=2)
+        statement = f"SELECT * FROM trades WHERE symbol_tf_id = $1 AND {condition} ORDER BY timestamp ASC"
+        async for df in self.iter_as_dataframe(statement, symbol_tf_id, *args, chunk_size=chunk_size,
+                                               index="timestamp"):
+            yield df
+
     async def save_clusters(self, symbol_tf_id: int, timestamp: datetime, step: float, clusters: pd.DataFrame):
         # logging.info(f"Save clusters {symbol_tf_id} - {timestamp}")
 
@@ -246,55 +515,45 @@ class TimesScaleDb(object, metaclass=Singleton):
 
         tuples = [tuple(x) for x in clusters.values]
         columns = list(clusters.columns)
-        await self.conn.copy_records_to_table("clusters", records=tuples, columns=columns, timeout=10)
+        async with self.acquire() as conn:
+            await conn.copy_records_to_table("clusters", records=tuples, columns=columns, timeout=COPY_TIMEOUT)
 
     async def load_clusters(self, symbol: SymbolStr, tf: Optional[Tf] = "15m",
                             start_time: Optional[datetime] = None, end_time: Optional[datetime] = None):
 
+        condition, args = get_timestamp_condition(start_time, end_time, first_arg=3)
         statement = f"""SELECT * FROM clusters JOIN symbol_tf ON clusters.symbol_tf_id = symbol_tf.id 
-                    WHERE symbol='{symbol}' and tf='{tf}' AND {get_timestamp_condition(start_time, end_time)}"""
+                    WHERE symbol=$1 and tf=$2 AND {condition}"""
 
-        df = await self.fetch_as_dataframe(statement)
+        df = await self.fetch_as_dataframe(statement, symbol, tf, *args)
         return df
 
     async def save_levels(self, symbol_tf_id: int, timestamp: datetime, level_type: TaLevels, level_value: float):
         # logging.info(f"Save levels {symbol_tf_id} - {timestamp} {level_type} = {level_value}")
-        delete_sql = f"DELETE FROM levels WHERE symbol_tf_id={symbol_tf_id} AND " \
-                     f"level_type={level_type.value}"
+        delete_sql = "DELETE FROM levels WHERE symbol_tf_id=$1 AND level_type=$2"
         insert_sql = "INSERT INTO levels (symbol_tf_id, level_type, level_value, timestamp) " \
                      "VALUES ($1, $2, $3, $4);"
-        if self.use_pool:
-            async with self.conn.acquire() as conn:
-                async with conn.transaction():
-                    await conn.execute(delete_sql)
-                    await conn.execute(insert_sql, symbol_tf_id, level_type.value, level_value, timestamp)
-        else:
-            async with self.conn.transaction():
-                await self.conn.execute(delete_sql)
-                await self.conn.execute(insert_sql, symbol_tf_id, level_type.value, level_value, timestamp)
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(delete_sql, symbol_tf_id, level_type.value)
+                await conn.execute(insert_sql, symbol_tf_id, level_type.value, level_value, timestamp)
 
     async def load_levels(self, symbol: Union[SymbolStr, List[SymbolStr]], tf: Union[Tf, List[Tf]],
                           level_type: Optional[TaLevels] = None):
+        # one statement for a single value and for a list: symbol = ANY($1)
         statement = f"""SELECT * FROM levels JOIN symbol_tf ON levels.symbol_tf_id = symbol_tf.id 
-                    WHERE """
-        if type(symbol) is SymbolStr:
-            statement += f" symbol='{symbol}' "
-        else:
-            symbols_str = [f"'{s}'" for s in symbol]
-            statement += f" symbol IN ({','.join(symbols_str)}) "
-
-        if type(tf) is Tf:
-            statement += f" and tf='{tf}' "
-        else:
-            tf_str = [f"'{s}'" for s in tf]
-            statement += f" and tf IN ({','.join(tf_str)}) "
+                    WHERE symbol = ANY($1::text[]) and tf = ANY($2::text[]) """
+        args: List[Any] = [[symbol] if isinstance(symbol, str) else list(symbol),
+                           [tf] if isinstance(tf, str) else list(tf)]
 
         if level_type is not None:
-            statement += f" and level_type={level_type.value} "
+            statement += " and level_type=$3 "
+            args.append(level_type.value)
 
             # statement = f"""SELECT * FROM levels JOIN symbol_tf ON clusters.symbol_tf_id = symbol_tf.id
         #             WHERE symbol='{symbol}' and tf='{tf}' AND level_type={level_type.value}"""
-        items = await self.conn.fetch(statement)
+        async with self.acquire() as conn:
+            items = await conn.fetch(statement, *args)
         return items
 
     async def save_arbitrage_deltas(self, timestamp: datetime, data: pd.DataFrame):
@@ -304,7 +563,8 @@ class TimesScaleDb(object, metaclass=Singleton):
 
         tuples = [tuple(x) for x in data.values]
         columns = list(data.columns)
-        await self.conn.copy_records_to_table("arbitrage_delta", records=tuples, columns=columns, timeout=10)
+        async with self.acquire() as conn:
+            await conn.copy_records_to_table("arbitrage_delta", records=tuples, columns=columns, timeout=COPY_TIMEOUT)
 
     async def load_last_arbitrage_deltas(self):
         statement = f"""select distinct on(s.symbol) *
@@ -318,14 +578,15 @@ class TimesScaleDb(object, metaclass=Singleton):
 
     async def load_last_arbitrage_deltas_stats(self, start_time: Optional[datetime] = None,
                                                end_time: Optional[datetime] = None):
+        condition, args = get_timestamp_condition(start_time, end_time)
         statement = f"""select s.symbol, avg(a.delta) as avg_delta, avg(a.delta_perc) as avg_delta_perc,
                     max(a.delta) as max_delta, max(a.delta_perc) as max_delta_perc,
                     min(a.delta) as min_delta, min(a.delta_perc) as min_delta_perc
                     from arbitrage_delta as a join symbol_tf as s on s.id = a.symbol_tf_id 
-                    WHERE {get_timestamp_condition(start_time, end_time)} 
+                    WHERE {condition} 
                     GROUP BY s.symbol;"""
 
-        df = await self.fetch_as_dataframe(statement)
+        df = await self.fetch_as_dataframe(statement, *args)
         df.set_index("symbol", inplace=True)
 
         return df
@@ -333,17 +594,19 @@ class TimesScaleDb(object, metaclass=Singleton):
     async def load_arbitrage_deltas(self, symbol: Optional[SymbolStr] = None,
                                     start_time: Optional[datetime] = None,
                                     end_time: Optional[datetime] = None):
+        condition, args = get_timestamp_condition(start_time, end_time)
         symbol_cond = ""
         if symbol is not None:
-            symbol_cond = f"AND symbol='{symbol}' "
+            args.append(symbol)
+            symbol_cond = f"AND symbol=${len(args)} "
 
         statement = f"""select timestamp, s.symbol, a.delta_perc
                         from arbitrage_delta as a join symbol_tf as s on s.id = a.symbol_tf_id 
-                    WHERE {get_timestamp_condition(start_time, end_time)} {symbol_cond}
+                    WHERE {condition} {symbol_cond}
                     group by timestamp, s.symbol, a.delta_perc
                     order by timestamp;"""
 
-        df = await self.fetch_as_dataframe(statement)
+        df = await self.fetch_as_dataframe(statement, *args)
         # df.set_index("symbol", inplace=True)
 
         return df
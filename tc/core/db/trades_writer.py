@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+import numpy as np
+
+from core.base import CoreBase
+from core.types import SymbolStr
+from core.utils.logs import add_traceback
+
+TRADES_BATCH_SIZE = 5000
+TRADES_FLUSH_INTERVAL = 1.0
+# trades buffered or being written before new ones are dropped
+TRADES_MAX_PENDING = 1_000_000
+TRADES_MAX_FLUSHES = 4
+# seconds between the stats lines of a running writer
+TRADES_STATS_INTERVAL = 60.0
+
+
+class TradesBuffer(object):
+    def __init__(self, capacity: int):
+        self.timestamps = np.empty(capacity, dtype="datetime64[ms]")
+        self.prices = np.empty(capacity, dtype=np.float64)
+        self.volumes = np.empty(capacity, dtype=np.float64)
+        self.is_buyer = np.empty(capacity, dtype=np.bool_)
+        self.count = 0
+        self.first_time = 0.0
+
+    @property
+    def is_full(self) -> bool:
+        return self.count == len(self.prices)
+
+
+class TradesWriter(object):
+    """
+    Collects trades per symbol in columnar arrays and writes them with binary COPY (`TimesScaleDb.save_trades`)
+    once `batch_size` trades are buffered or the oldest one waits `flush_interval` seconds.
+    `close` writes everything that is left.
+    """
+
+    def __init__(self, db, batch_size: int = TRADES_BATCH_SIZE, flush_interval: float = TRADES_FLUSH_INTERVAL,
+                 max_pending: int = TRADES_MAX_PENDING, max_flushes: int = TRADES_MAX_FLUSHES,
+                 stats_interval: float = TRADES_STATS_INTERVAL):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.buffers: Dict[SymbolStr, TradesBuffer] = {}
+        self.flushes: Set[asyncio.Task] = set()
+        self.flush_slots: Optional[asyncio.Semaphore] = None
+        self.max_flushes = max_flushes
+        self.stats_interval = stats_interval
+        self.task: Optional[asyncio.Task] = None
+
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flush_time = 0.0
+
+    def start(self):
+        if self.task is None:
+            self.task = CoreBase.get_loop().create_task(self.run())
+
+    def add(self, symbol: SymbolStr, price: float, volume: float, is_buyer: bool, timestamp: datetime) -> bool:
+        if self.pending >= self.max_pending:
+            if self.dropped == 0:
+                logging.warning(f"Trades writer is {self.pending} trades behind, dropping new trades")
+            self.dropped += 1
+            return False
+
+        buffer = self.buffers.get(symbol, None)
+        if buffer is None:
+            buffer = self.buffers[symbol] = TradesBuffer(self.batch_size)
+        if buffer.count == 0:
+            buffer.first_time = time.monotonic()
+
+        i = buffer.count
+        buffer.timestamps[i] = timestamp
+        buffer.prices[i] = price
+        buffer.volumes[i] = volume
+        buffer.is_buyer[i] = is_buyer
+        buffer.count += 1
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+
+        if buffer.is_full:
+            self.flush_symbol(symbol)
+
+        return True
+
+    def flush_symbol(self, symbol: SymbolStr):
+        buffer = self.buffers.pop(symbol, None)
+        if buffer is None or buffer.count == 0:
+            return
+
+        # the filled arrays are handed over as they are, the next trade of the symbol starts a new buffer
+        task = CoreBase.get_loop().create_task(self.write(symbol, buffer))
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+
+    async def write(self, symbol: SymbolStr, buffer: TradesBuffer):
+        if self.flush_slots is None:
+            self.flush_slots = asyncio.Semaphore(self.max_flushes)
+
+        n = buffer.count
+        try:
+            async with self.flush_slots:
+                started = time.monotonic()
+                await self.db.save_trades(symbol, buffer.timestamps[:n], buffer.prices[:n], buffer.volumes[:n],
+                                          buffer.is_buyer[:n])
+                self.flush_time += time.monotonic() - started
+                self.written += n
+        except Exception as e:
+            self.failed += n
+            logging.error(f"Save trades {symbol} failed, {n} trades lost: {add_traceback(e)}")
+        finally:
+            self.pending -= n
+
+    async def flush(self):
+        for symbol in list(self.buffers.keys()):
+            self.flush_symbol(symbol)
+
+        if len(self.flushes) > 0:
+            await asyncio.gather(*list(self.flushes))
+
+    async def run(self):
+        stats_time = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval / 2)
+            now_ = time.monotonic()
+            for symbol, buffer in list(self.buffers.items()):
+                if buffer.count > 0 and now_ - buffer.first_time >= self.flush_interval:
+                    self.flush_symbol(symbol)
+
+            if now_ - stats_time >= self.stats_interval:
+                stats_time = now_
+                logging.info(f"Trades writer: {self.stats}")
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        await self.flush()
+        logging.info(f"Trades writer closed: {self.stats}")
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return dict(pending=self.pending, max_pending=self.max_pending_seen, in_flight=len(self.flushes),
+                    written=self.written, dropped=self.dropped, failed=self.failed,
+                    flush_time=round(self.flush_time, 3))
@@ -1,27 +1,30 @@
 import asyncio
 import logging
+from collections import deque
 from datetime import timedelta
 from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Type
 
 import pandas as pd
-import ujson
 import websockets
 from websockets import WebSocketClientProtocol
 from config import Config, MAX_CANDLES
 # from config import MAX_CANDLES
 from core.base import CoreBase
 from core.exchange.binance.common import get_filter_value
+from core.exchange.common.candles_buffer import CandlesBuffer
 from core.exchange.common.exchange import PublicExchange, SymbolInfo
 from core.exchange.common.mappers import binance_to_symbol, symbol_to_binance
 from core.exchange.common.order_book import OrderBook
-from core.exchange.common.websocket import WebSocketBase
+from core.exchange.common.websocket_pool import SHARD_BY_COUNT, WS_MAX_STREAMS, WebSocketPool
 from core.exchange.protectors.binance_request_limiter import BinanceRequestLimiter
+from core.exceptions import ExchangeApiException
 from core.types import RestMethod, Singleton, Symbol, Tf
-from core.utils.data import candles_to_data_frame
+from core.utils.data import candles_to_data_frame, klines_to_data_frame
 from core.utils.logs import setup_logger, add_traceback
+from core.utils.resample import aggregate_candles, get_derived_tfs
 from core.utils.timeframe import tf_size_minutes, round_time_to_tf, get_time_shift
 from datetime import timezone, datetime
-from core.providers.data_provider import DataProvider, TimescaleDataProvider
+from core.providers.data_provider import DataProvider
 import math
 
 CANDLES_FEED_NAMES = ["kline_1m", "kline_1h"]
@@ -33,7 +36,8 @@ WSS_URL = "wss://stream.binance.com:443/ws/"
 
 MAX_TRADES = 500
 WS_TIMEOUT = 0
-WS_MSG_TIME = 0.25
+WS_SHARDS = 1
+PRELOAD_CONCURRENCY = 8
 
 LEVEL_CANDLES_LENGTH = {
     "1d": dict(days=365 * 5),
@@ -44,8 +48,16 @@ LEVEL_CANDLES_LENGTH = {
 }
 
 
-def paginate(data: List, page_length: int):
-    return [data[i: i + page_length] for i in range(0, len(data), page_length)]
+def get_candles_capacity(tf: Tf, default: int = MAX_CANDLES) -> int:
+    if tf not in LEVEL_CANDLES_LENGTH:
+        return default
+
+    return math.ceil(timedelta(**LEVEL_CANDLES_LENGTH[tf]) / timedelta(minutes=tf_size_minutes(tf)))
+
+
+def get_last_closed_time(tf: Tf, end_time: Optional[datetime] = None) -> datetime:
+    # the last candle is still open, history ends a minute before it
+    return round_time_to_tf(end_time or datetime.utcnow(), tf) - timedelta(minutes=1)
 
 
 def side_data_to_float(data):
@@ -84,31 +96,51 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
     wss_url = WSS_URL
     request_limiter = BinanceRequestLimiter()
     last_url_response = None
+    ws_shards = WS_SHARDS
+    ws_max_streams = WS_MAX_STREAMS
+    ws_shard_by = SHARD_BY_COUNT
+    # kline tfs which are multiples of it are built from its candles instead of their own streams
+    kline_base_tf: Optional[Tf] = None
 
     def __init__(self, on_trade_callback: Optional[Callable] = None, on_candle_callback: Optional[Callable] = None,
                  on__all_price_callback: Optional[Callable] = None,
-                 data_provider: Optional[TimescaleDataProvider] = None):
+                 data_provider: Optional[DataProvider] = None):
         super().__init__()
-        self.wsb: Optional[WebSocketBase] = None
+        self.wsb: Optional[WebSocketPool] = None
         self.debug = 0
         self.on_trade_callback = on_trade_callback
         self.on_candle_callback = on_candle_callback
         self.on_all_price_callback = on__all_price_callback
         self.logger = setup_logger(self.logger_name)
         self.data_provider = data_provider
+        self.candles_pending: Dict[Tuple[Symbol, Tf], List[Dict[str, Any]]] = {}
+        # base tf -> tfs built from it
+        self.derived_tfs: Dict[Tf, List[Tf]] = {}
+        # kline tfs subscribed per symbol, as requested: a base tf only loaded for derived ones isn't in there
+        self.kline_tfs: Dict[Symbol, List[Tf]] = {}
+        # event type -> parser, only the fields each event needs are read
+        self.message_handlers: Dict[str, Callable[[Dict[str, Any]], Coroutine]] = {
+            "kline": self.on_kline_event,
+            "trade": self.on_trade_message,
+            "aggTrade": self.on_trade_message,
+            "depthUpdate": self.on_depth_message,
+        }
 
     async def async_init(
             self, on_connect_callback: Optional[Callable[[], Coroutine]] = None
     ):
-        await self.data_provider.init()
-        self.wsb = WebSocketBase(
+        if self.data_provider is not None:
+            await self.data_provider.init()
+        self.wsb = WebSocketPool(
             self.logger_name,
             self.ws_connect_public,
             self.ws_on_message,
+            shards=self.ws_shards,
+            max_streams=self.ws_max_streams,
+            shard_by=self.ws_shard_by,
             timeout=WS_TIMEOUT,
             on_reconnect=self.reconnect_streams,
             on_connect=on_connect_callback,
-            logger=self.logger,
         )
         # Important - load_exchange_info also set-up Request Balancer
         await self.load_exchange_info()
@@ -141,41 +173,33 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
         # !ticker @ arr
         # !miniTicker@arr - mark price
 
-        if global_feeds is not None:
-            await self._send_message_ws(method, global_feeds)
-
-        for page_symbols in paginate(symbols, 10):
-            params = []
-            for symbol in page_symbols:
-                params += [f"{symbol_to_binance(symbol).lower()}@{f}" for f in feeds]
-
-            if method == "SUBSCRIBE":
-                for p in params:
-                    self.streams[p] = datetime.utcnow()
-            else:
-                for p in params:
-                    try:
-                        del self.streams[p]
-                    except KeyError:
-                        pass
-
-            await self._send_message_ws(method, params)
-
-    async def _send_message_ws(self, method: str, params: List[str], id: int = 1):
-        msg = {"method": method.upper(), "params": params, "id": id}
-
-        self.logger.info(f"Send to WS {method} with {params}")
+        params = list(global_feeds) if global_feeds is not None else []
+        for symbol in symbols:
+            params += [f"{symbol_to_binance(symbol).lower()}@{f}" for f in feeds]
 
-        await self.wsb.ws.send(ujson.dumps(msg))
-        await asyncio.sleep(WS_MSG_TIME)
+        if method == "SUBSCRIBE":
+            now_ = datetime.utcnow()
+            for p in params:
+                self.streams[p] = now_
+            await self.wsb.subscribe(params)
+        else:
+            for p in params:
+                self.streams.pop(p, None)
+            await self.wsb.unsubscribe(params)
 
     async def subscribe(
-            self, symbols: List[Symbol], feeds: List[str] = DETAILS_FEED_NAMES
+            self, symbols: List[Symbol], feeds: List[str] = DETAILS_FEED_NAMES,
+            concurrency: int = PRELOAD_CONCURRENCY
     ):
         tasks = []
         # if "markPrice" in feeds:
         #     tasks.append(loop.create_task(self.load_mark_prices()))
         self.logger.info("Preload data...")
+        kline_tfs = [Tf(f.split("_")[1]) for f in feeds if "kline" in f]
+        for symbol in symbols:
+            self.kline_tfs[symbol] = list(dict.fromkeys(self.kline_tfs.get(symbol, []) + kline_tfs))
+        feeds = self.derive_kline_feeds(feeds, kline_tfs)
+        kline_tfs = list(dict.fromkeys(kline_tfs + [Tf(f.split("_")[1]) for f in feeds if "kline" in f]))
 
         for symbol in symbols:
             if "depth" in feeds:
@@ -184,33 +208,189 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
             #     tasks.append(CoreBase.get_loop().create_task(self.load_trades(symbol)))
 
             self.candle_unclosed[symbol] = {}
-
-            kline_tfs = [Tf(f.split("_")[1]) for f in feeds if "kline" in f]
-            now_ = datetime.utcnow()
             for tf in kline_tfs:
-                delta = timedelta(**LEVEL_CANDLES_LENGTH[tf])
-                await self.load_candles(
-                    symbol, tf, start_time=now_ - delta, end_time=now_
-                )
                 self.candle_unclosed[symbol][tf] = None
+                # klines are buffered until the history of symbol/tf is loaded
+                self.candles_pending[(symbol, tf)] = []
+
         self.logger.info("Do Subscribe to WS...")
         await self.send_message(symbols=symbols, feeds=feeds, method="SUBSCRIBE")
 
+        semaphore = asyncio.Semaphore(concurrency)
+        now_ = datetime.utcnow()
+        candles_db = await self.preload_candles_db(symbols, kline_tfs, now_)
+
+        async def preload_candles(symbol_: Symbol, tf_: Tf):
+            try:
+                async with semaphore:
+                    delta = timedelta(**LEVEL_CANDLES_LENGTH[tf_])
+                    await self.load_candles(symbol_, tf_, start_time=now_ - delta, end_time=now_,
+                                            candles_db=candles_db.get(tf_, {}).get(symbol_, None))
+            except Exception:
+                self.candles_pending.pop((symbol_, tf_), None)
+                raise
+
+            await self.release_pending_klines(symbol_, tf_)
+
+        await asyncio.gather(*[preload_candles(symbol, tf) for symbol in symbols for tf in kline_tfs])
+        self.logger.info("Preload data DONE.")
+
+    def derive_kline_feeds(self, feeds: List[str], kline_tfs: List[Tf]) -> List[str]:
+        # the feeds to subscribe: the base kline stream in place of the derived tfs
+        base_tf = self.kline_base_tf
+        derived = get_derived_tfs(base_tf, kline_tfs) if base_tf is not None else []
+        if len(derived) == 0:
+            return feeds
+
+        self.derived_tfs[base_tf] = list(dict.fromkeys(self.derived_tfs.get(base_tf, []) + derived))
+        self.logger.info(f"Candles {derived} are built from {base_tf}")
+        feeds = [f for f in feeds if not ("kline" in f and Tf(f.split("_")[1]) in derived)]
+        return feeds if f"kline_{base_tf}" in feeds else feeds + [f"kline_{base_tf}"]
+
+    async def preload_candles_db(self, symbols: List[Symbol], tfs: List[Tf],
+                                 now_: datetime) -> Dict[Tf, Dict[Symbol, pd.DataFrame]]:
+        # stored history of all symbols with one query per tf, instead of one per symbol and tf
+        result: Dict[Tf, Dict[Symbol, pd.DataFrame]] = {}
+        if self.data_provider is None:
+            return result
+
+        binance_symbols = {symbol_to_binance(symbol): symbol for symbol in symbols}
+        for tf in tfs:
+            start_time = now_ - timedelta(**LEVEL_CANDLES_LENGTH[tf])
+            try:
+                candles = await self.data_provider.load_candles_many(list(binance_symbols.keys()), tf, start_time,
+                                                                     get_last_closed_time(tf, now_))
+            except Exception as e:
+                # load_candles queries symbols of this tf one by one
+                self.logger.error(f"Preload candles {tf} from DB failed: {add_traceback(e)}")
+                continue
+
+            result[tf] = {binance_symbols[s]: df for s, df in candles.items()}
+
+        return result
+
+    async def release_pending_klines(self, symbol: Symbol, tf: Tf):
+        key = (symbol, tf)
+        last_time = self.candles[symbol][tf].last_timestamp
+        # the key stays pending until the buffer is drained, so new klines can't overtake the replayed ones
+        while len(self.candles_pending.get(key, [])) > 0:
+            messages = self.candles_pending[key]
+            self.candles_pending[key] = []
+            for msg in messages:
+                if last_time is not None and datetime.utcfromtimestamp(msg["k"]["t"] / 1e3) <= last_time:
+                    continue  # already in the loaded history
+                await self.on_kline_message(msg, symbol)
+
+        self.candles_pending.pop(key, None)
+
+    async def backfill_candles(self, symbol: Symbol, tf: Tf, end_time: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Load only the candles closed after the last buffered one: from the DataProvider first, the rest from REST.
+        The candles are appended in order and the closed-candle callbacks are replayed for each of them.
+        """
+        buffer = self.candles[symbol][tf]
+        last_time = buffer.last_timestamp
+        if last_time is None:
+            return await self.load_candles(symbol, tf, end_time=end_time)
+
+        tf_delta = timedelta(minutes=tf_size_minutes(tf))
+        end_time = round_time_to_tf(end_time or datetime.utcnow(), tf) - timedelta(minutes=1)  # exclude LAST CANDLE
+        start_time = last_time + tf_delta
+        if start_time > end_time:
+            return candles_to_data_frame([])
+
+        self.logger.info(f"Backfill candles: {symbol}_{tf} - {start_time} - {end_time}.")
+        candles_db = pd.DataFrame()
+        if self.data_provider is not None:
+            candles_db = await self.data_provider.load_candles(symbol_to_binance(symbol), tf, start_time, end_time)
+
+        parts = [candles_db]
+        from_time = candles_db.index[-1] + tf_delta if len(candles_db) > 0 else start_time
+        while from_time <= end_time:
+            candles = await self._load_candles(symbol, tf, from_time, end_time)
+            if len(candles) == 0:
+                break
+
+            if self.data_provider is not None:
+                await self.data_provider.save_candles(symbol=symbol_to_binance(symbol), tf=tf, candles=candles)
+            parts.append(candles)
+            from_time = candles.index[-1] + tf_delta
+
+        candles_total = pd.concat(parts)
+        candles_total = candles_total[~candles_total.index.duplicated(keep="last")].sort_index()
+        candles_total = candles_total[(candles_total.index > last_time) & (candles_total.index <= end_time)]
+
+        binance_symbol = symbol_to_binance(symbol)
+        for c_time, o_, h_, l_, c_, v_ in zip(candles_total.index.to_pydatetime(), *candles_total.values.T):
+            buffer.append(c_time, o_, h_, l_, c_, v_)
+            await self.notify_candle(symbol, binance_symbol, tf, True, [c_time, o_, h_, l_, c_, v_],
+                                     c_time + tf_delta - timedelta(milliseconds=1))
+            await self.derive_candles(symbol, binance_symbol, tf, c_time)
+
+        if len(candles_total) > 0:
+            self.update_candles_dnv(symbol=symbol, tf=tf, price=c_, volume=v_)
+        self.logger.info(f"Backfill candles: {symbol}_{tf} {len(candles_total)} DONE.")
+
+        return candles_total
+
+    async def backfill_streams(self, keys: List[Tuple[Symbol, Tf]], concurrency: int = PRELOAD_CONCURRENCY):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def backfill(symbol_: Symbol, tf_: Tf):
+            try:
+                async with semaphore:
+                    await self.backfill_candles(symbol_, tf_)
+            except Exception as e:
+                self.logger.error(f"Backfill {symbol_}_{tf_} failed: {add_traceback(e)}")
+
+            await self.release_pending_klines(symbol_, tf_)
+
+        await asyncio.gather(*[backfill(symbol, tf) for symbol, tf in keys])
+
     async def unsubscribe(
             self, symbols: List[Symbol], feeds: List[str] = DETAILS_FEED_NAMES
     ):
+        base_tf = self.kline_base_tf
+        derived = self.derived_tfs.get(base_tf, []) if base_tf is not None else []
+        kline_tfs = [Tf(f.split("_")[1]) for f in feeds if "kline" in f]
+        # the feeds to unsubscribe per symbol: derived tfs have no stream, the base one may still be needed
+        symbol_feeds: Dict[Tuple[str, ...], List[Symbol]] = {}
         for symbol in symbols:
             if "trade" in feeds:
-                self.trades[symbol] = []
+                self.trades[symbol] = deque(maxlen=MAX_TRADES)
             if "depth" in feeds:
                 self.order_books[symbol] = OrderBook()
 
-            kline_tfs = [f.split("_")[1] for f in feeds if "kline" in f]
-
+            remaining = [tf for tf in self.kline_tfs.get(symbol, []) if tf not in kline_tfs]
+            self.kline_tfs[symbol] = remaining
+            keep_base = base_tf in remaining or any(tf in derived for tf in remaining)
             for tf in kline_tfs:
-                self.candles[symbol][Tf(tf)] = []
-
-        return await self.send_message(symbols=symbols, feeds=feeds, method="UNSUBSCRIBE")
+                self.candles_pending.pop((symbol, tf), None)
+                if tf == base_tf and keep_base:
+                    self.logger.info(f"Unsubscribe {symbol} kline_{tf}: kept for the candles built from it")
+                elif tf in derived:
+                    # derive_candles skips the tfs without a buffer
+                    self.candles.get(symbol, {}).pop(tf, None)
+                    self.candle_unclosed.get(symbol, {}).pop(tf, None)
+                elif tf in self.candles.get(symbol, {}):
+                    self.candles[symbol][tf].clear()
+
+            unsubscribed = [f for f in feeds if not ("kline" in f and Tf(f.split("_")[1]) in derived + [base_tf])]
+            base_stream = f"{symbol_to_binance(symbol).lower()}@kline_{base_tf}"
+            if len(kline_tfs) > 0 and not keep_base and base_stream in self.streams:
+                unsubscribed.append(f"kline_{base_tf}")
+                if base_tf in self.candles.get(symbol, {}):
+                    self.candles[symbol][base_tf].clear()
+            symbol_feeds.setdefault(tuple(unsubscribed), []).append(symbol)
+
+        # a derived tf nobody builds any more
+        for tf in list(derived):
+            if not any(tf in tfs for tfs in self.kline_tfs.values()):
+                self.derived_tfs[base_tf].remove(tf)
+
+        for unsubscribed, group in symbol_feeds.items():
+            if len(unsubscribed) > 0:
+                await self.send_message(symbols=group, feeds=list(unsubscribed), method="UNSUBSCRIBE")
 
     async def unsubscribe_by_id(self, stream_id: Any):
         symbols = []
@@ -223,12 +403,24 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
 
         return await self.unsubscribe(symbols, feeds)
 
-    async def reconnect_streams(self):
-        if len(self.streams) > 0:
-            self.logger.warning("Reconnecting... TODO: reload candles etc..")
-            #  TODO: reload candles etc..
-            for streams in paginate(list(self.streams.keys()), 20):
-                await self._send_message_ws("SUBSCRIBE", streams)
+    async def reconnect_streams(self, streams: List[str]):
+        keys = []
+        for stream in streams:
+            name, _, feed = stream.partition("@")
+            if not feed.startswith("kline_"):
+                continue
+
+            symbol, tf = binance_to_symbol(name.upper()), Tf(feed.split("_")[1])
+            if tf not in self.candles.get(symbol, {}) or (symbol, tf) in self.candles_pending:
+                continue  # not preloaded yet
+
+            # the shard reads no message until this returns: klines are held back from here until the gap is filled
+            self.candles_pending[(symbol, tf)] = []
+            keys.append((symbol, tf))
+
+        if len(keys) > 0:
+            self.logger.warning(f"Reconnected, backfill {len(keys)} candle streams")
+            CoreBase.get_loop().create_task(self.backfill_streams(keys))
 
     async def ws_connect_public(self) -> WebSocketClientProtocol:
         stream_name = f"{self.wss_url}stream"
@@ -248,63 +440,11 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
                     self.on_all_price_callback(msg)
                 return
 
-            if "result" in msg:
+            handler = self.message_handlers.get(msg.get("e", None), None)
+            if handler is not None:
+                await handler(msg)
+            elif "result" in msg:
                 self.logger.warning(f"wss msg: {msg}")
-                return
-
-            channel = msg["e"]
-            symbol = binance_to_symbol(msg["s"])
-
-            # self.streams[channel] = datetime.utcnow()
-
-            if channel in ["trade", "aggTrade"]:  # in msg['stream']:
-                # https://www.programiz.com/python-programming/methods/built-in/zip
-                if self.on_trade_callback is not None:
-                    await self.on_trade_callback(msg["s"].upper(), float(msg["p"]), float(msg["q"]), msg["m"],
-                                                 datetime.utcfromtimestamp(msg["T"] / 1e3))
-                else:
-                    item = (float(msg["p"]), float(msg["q"]), msg["m"])
-                    self.trades[symbol].append(item)
-                    self.trades[symbol] = self.trades[symbol][-MAX_TRADES:]
-
-            elif channel == "depthUpdate":
-                self.order_books[symbol].update_sides(
-                    side_data_to_float(msg["b"]), side_data_to_float(msg["a"])
-                )
-
-            elif channel == "kline":
-                c = msg["k"]
-                tf = Tf(c["i"])
-                c_ = float(c["c"])
-                v_ = float(c["v"])
-                o_ = float(c["o"])
-                h_ = float(c["h"])
-                l_ = float(c["l"])
-                c_time = datetime.utcfromtimestamp(c["t"] / 1e3)
-
-                self.mark_prices[symbol] = c_
-                self.update_candles_dnv(symbol, tf, c_, v_)
-                candle_closed = c["x"]
-
-                candle_item = [c_time, o_, h_, l_, c_, v_]
-                self.candle_unclosed[symbol][tf] = candle_item
-                if candle_closed:
-                    self.candles[symbol][tf] = pd.concat(
-                        [self.candles[symbol][tf], candles_to_data_frame([candle_item])]
-                    )
-
-                if self.on_candle_callback is not None:
-                    await self.on_candle_callback(msg["s"].upper(), tf, candle_closed, candle_item,
-                                                  datetime.utcfromtimestamp(c["T"] / 1e3))
-                else:
-                    if candle_closed:
-                        await asyncio.gather(
-                            *[
-                                asyncio.create_task(c.callback(symbol, tf, c_time))
-                                for c in self.callbacks
-                                if c.feed == f"kline_{tf}" and c.symbol == symbol
-                            ]
-                        )
 
             # elif channel == "markPriceUpdate":
             #     p = float(data["p"])
@@ -315,6 +455,115 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
         except Exception as e:
             self.logger.error(add_traceback(e))
 
+    async def on_trade_message(self, msg: Dict[str, Any]):
+        price = float(msg["p"])
+        quantity = float(msg["q"])
+        if self.on_trade_callback is not None:
+            await self.on_trade_callback(msg["s"], price, quantity, msg["m"],
+                                         datetime.utcfromtimestamp(msg["T"] / 1e3))
+        else:
+            symbol = binance_to_symbol(msg["s"])
+            trades = self.trades.get(symbol, None)
+            if trades is None:
+                trades = self.trades[symbol] = deque(maxlen=MAX_TRADES)
+            trades.append((price, quantity, msg["m"]))
+
+    async def on_depth_message(self, msg: Dict[str, Any]):
+        self.order_books[binance_to_symbol(msg["s"])].update_sides(
+            side_data_to_float(msg["b"]), side_data_to_float(msg["a"])
+        )
+
+    async def on_kline_event(self, msg: Dict[str, Any]):
+        symbol = binance_to_symbol(msg["s"])
+        key = (symbol, msg["k"]["i"])
+        if key in self.candles_pending:
+            self.candles_pending[key].append(msg)
+            return
+
+        await self.on_kline_message(msg, symbol)
+
+    async def on_kline_message(self, msg: Dict[str, Any], symbol: Symbol):
+        c = msg["k"]
+        tf = Tf(c["i"])
+        c_ = float(c["c"])
+        v_ = float(c["v"])
+        o_ = float(c["o"])
+        h_ = float(c["h"])
+        l_ = float(c["l"])
+        c_time = datetime.utcfromtimestamp(c["t"] / 1e3)
+
+        candle_closed = c["x"]
+        self.mark_prices[symbol] = c_
+        if await self.update_candle(symbol, msg["s"], tf, candle_closed, [c_time, o_, h_, l_, c_, v_],
+                                    datetime.utcfromtimestamp(c["T"] / 1e3)):
+            await self.derive_candles(symbol, msg["s"], tf, c_time)
+
+    async def update_candle(self, symbol: Symbol, binance_symbol: str, tf: Tf, candle_closed: bool,
+                            candle_item: List[Any], close_time: datetime) -> bool:
+        c_time, o_, h_, l_, c_, v_ = candle_item
+        if candle_closed:
+            last_time = self.candles[symbol][tf].last_timestamp
+            if last_time is not None and c_time <= last_time:
+                return False  # repeated while streams move between websocket shards
+
+        self.update_candles_dnv(symbol, tf, c_, v_)
+
+        if candle_closed:
+            self.candle_unclosed[symbol][tf] = None
+            self.candles[symbol][tf].append(c_time, o_, h_, l_, c_, v_)
+        else:
+            self.candle_unclosed[symbol][tf] = candle_item
+            self.candles[symbol][tf].set_unclosed(c_time, o_, h_, l_, c_, v_)
+
+        await self.notify_candle(symbol, binance_symbol, tf, candle_closed, candle_item, close_time)
+        return True
+
+    async def derive_candles(self, symbol: Symbol, binance_symbol: str, base_tf: Tf, c_time: datetime):
+        """
+        Update the tfs built from `base_tf` with the base candle at `c_time`, closed or not:
+        the tf candle is the aggregate of the buffered base candles since its start.
+        """
+        base_buffer = self.candles[symbol][base_tf]
+        base_delta = timedelta(minutes=tf_size_minutes(base_tf))
+        for tf in self.derived_tfs.get(base_tf, []):
+            if (symbol, tf) in self.candles_pending or tf not in self.candles.get(symbol, {}):
+                continue  # history is loading, the next base candle catches up
+
+            tf_delta = timedelta(minutes=tf_size_minutes(tf))
+            start_time = round_time_to_tf(c_time, tf)
+            view = base_buffer.view(last_n=2 * (tf_delta // base_delta) + 1)
+
+            last_time = self.candles[symbol][tf].last_timestamp
+            previous_time = start_time - tf_delta
+            if last_time is not None and last_time < previous_time:
+                # the base candle closing the previous one never came (a gap in the stream), it is closed now
+                item = aggregate_candles(view.timestamp, view.values, previous_time, start_time)
+                if item is not None:
+                    await self.update_candle(symbol, binance_symbol, tf, True, item,
+                                             start_time - timedelta(milliseconds=1))
+
+            item = aggregate_candles(view.timestamp, view.values, start_time, start_time + tf_delta)
+            if item is None:
+                continue
+
+            closed = not base_buffer.has_unclosed and c_time + base_delta >= start_time + tf_delta
+            await self.update_candle(symbol, binance_symbol, tf, closed, item,
+                                     start_time + tf_delta - timedelta(milliseconds=1))
+
+    async def notify_candle(self, symbol: Symbol, binance_symbol: str, tf: Tf, candle_closed: bool,
+                            candle_item: List[Any], close_time: datetime):
+        if self.on_candle_callback is not None:
+            await self.on_candle_callback(binance_symbol, tf, candle_closed, candle_item, close_time)
+        else:
+            if candle_closed:
+                await asyncio.gather(
+                    *[
+                        asyncio.create_task(c.callback(symbol, tf, candle_item[0]))
+                        for c in self.callbacks
+                        if c.feed == f"kline_{tf}" and c.symbol == symbol
+                    ]
+                )
+
     async def load_order_books(self, symbol: Symbol):
         content, _ = await self.request_url(
             f"/depth",
@@ -342,9 +591,9 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
             },
         )
         # also : time, 'isBestMatch', quoteQty
-        self.trades[symbol] = [
-            (float(i["price"]), float(i["qty"]), i["isBuyerMaker"]) for i in content
-        ]
+        self.trades[symbol] = deque(
+            [(float(i["price"]), float(i["qty"]), i["isBuyerMaker"]) for i in content], maxlen=MAX_TRADES
+        )
         pass
 
     async def load_mark_prices(self):
@@ -389,21 +638,10 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
             logging.error(f"{_.url}")
             # raise KeyError(content['msg'])
         try:
-            candles = [
-                [
-                    datetime.utcfromtimestamp(c[0] / 1e3),
-                    float(c[1]),
-                    float(c[2]),
-                    float(c[3]),
-                    float(c[4]),
-                    float(c[5]),
-                ]
-                for c in content
-            ]
+            return klines_to_data_frame(content)
         except Exception as e:
             self.logger.error(e)
-            candles = []
-        return candles_to_data_frame(candles)
+            return klines_to_data_frame([])
 
     async def load_candles(
             self,
@@ -411,6 +649,7 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
             tf: Tf = "1m",
             start_time: Optional[datetime] = None,
             end_time: Optional[datetime] = None,
+            candles_db: Optional[pd.DataFrame] = None,
     ):
         candle_size_minutes = tf_size_minutes(tf)
 
@@ -426,18 +665,18 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
                 await self.data_provider.save_candles(symbol=symbol_to_binance(symbol), tf=tf, candles=candles_batch)
             return candles_batch
 
-        end_time = round_time_to_tf(
-            end_time or datetime.utcnow(), tf
-        ) - timedelta(minutes=1)  # exclude LAST CANDLE
+        end_time = get_last_closed_time(tf, end_time)  # exclude LAST CANDLE
 
         # end_time = end_time or datetime.utcnow()
         start_time = start_time or get_time_shift(end_time, candle_size_minutes)
 
         self.logger.info(f"Preload candles: {symbol}_{tf} - {start_time} - {end_time}.")
-        candles_db = pd.DataFrame()
-        if self.data_provider is not None:
-            candles_db = await self.data_provider.load_candles(symbol_to_binance(symbol), tf,
-                                                               start_time, end_time)
+        # candles_db is passed when the caller loaded it together with other symbols
+        if candles_db is None:
+            candles_db = pd.DataFrame()
+            if self.data_provider is not None:
+                candles_db = await self.data_provider.load_candles(symbol_to_binance(symbol), tf,
+                                                                   start_time, end_time)
 
         start_time_ = (
             candles_db.index[-1] if len(candles_db) > 0 else get_time_shift(end_time, candle_size_minutes)
@@ -454,10 +693,14 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
             candles = await load_candles_with_cache(start_time_, end_time)
             candles_total = pd.concat([candles_total, candles])
 
+        candles_total = candles_total[~candles_total.index.duplicated(keep="last")].sort_index()
+
         if symbol not in self.candles:
             self.candles[symbol] = {}
 
-        self.candles[symbol][tf] = candles_total
+        self.candles[symbol][tf] = CandlesBuffer.from_frame(
+            candles_total, get_candles_capacity(tf, default=max(len(candles_total), MAX_CANDLES))
+        )
 
         last_candle = candles_total.iloc[-1]
         self.update_candles_dnv(
@@ -517,12 +760,17 @@ class PublicBinance(PublicExchange, metaclass=Singleton):
             headers: Dict[str, str] = {},
             base_uri: Optional[str] = None
     ) -> Tuple[Any, Any]:
-        await self.request_limiter.delay(self.last_url_response)
+        await self.request_limiter.acquire(self.request_limiter.get_weight(url, params))
 
-        content, _ = await super().request_url(
-            url, method, params=params, headers=headers, base_uri=base_uri
-        )
+        try:
+            content, _ = await super().request_url(
+                url, method, params=params, headers=headers, base_uri=base_uri
+            )
+        except ExchangeApiException as e:
+            self.request_limiter.update(e.response)
+            raise
         self.last_url_response = _
+        self.request_limiter.update(_)
 
         return content, _
 
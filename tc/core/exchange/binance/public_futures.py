@@ -1,15 +1,19 @@
 from core.exchange.binance.common import get_filter_value
 from core.exchange.binance.public import PublicBinance, get_symbol_info
 from core.exchange.common.mappers import binance_to_symbol, symbol_to_binance
+from core.exchange.protectors.binance_request_limiter import BinanceRequestLimiter, FUTURES_REQUEST_WEIGHTS
 from core.types import RestMethod, Singleton
 
 BASE_FUTURES_URI = "https://fapi.binance.com/fapi/v1"
 WSS_URL = "wss://fstream.binance.com/ws/"
+WS_FUTURES_MAX_STREAMS = 200
 
 
 class PublicFuturesBinance(PublicBinance, metaclass=Singleton):
     base_uri = BASE_FUTURES_URI
     wss_url = WSS_URL  # TODO: refactor ANOTHER approach each URL onw stream
+    request_limiter = BinanceRequestLimiter(FUTURES_REQUEST_WEIGHTS)
+    ws_max_streams = WS_FUTURES_MAX_STREAMS
 
     async def load_mark_prices(self):
         content, _ = await self.request_url(f"/premiumIndex", RestMethod.GET)
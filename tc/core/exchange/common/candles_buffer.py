@@ -0,0 +1,173 @@
+from datetime import datetime
+from typing import Any, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+CANDLE_COLUMNS = ["o", "h", "l", "c", "v"]
+
+
+class CandlesView:
+    """
+    Read-only numpy views over a candles buffer, no data is copied.
+    A view is valid until the next update of the buffer it was taken from.
+    """
+
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray):
+        self.timestamp = timestamps
+        self.values = values
+        self.o, self.h, self.l, self.c, self.v = values
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name == "timestamp":
+            return self.timestamp
+
+        return self.values[CANDLE_COLUMNS.index(name)]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({name: self.values[i] for i, name in enumerate(CANDLE_COLUMNS)},
+                            index=pd.DatetimeIndex(self.timestamp, name="timestamp"))
+
+
+class CandlesBufferILoc:
+    def __init__(self, buffer: "CandlesBuffer"):
+        self.buffer = buffer
+
+    def __getitem__(self, key: Union[int, slice]):
+        length = len(self.buffer)
+        if isinstance(key, slice):
+            return self.buffer.to_frame(start=key.start, stop=key.stop, step=key.step)
+
+        position = key + length if key < 0 else key
+        if position < 0 or position >= length:
+            raise IndexError(f"single positional indexer is out-of-bounds: {key}")
+
+        frame = self.buffer.to_frame(start=position, stop=position + 1)
+        return frame.iloc[0]
+
+
+class CandlesBuffer:
+    """
+    Fixed size ring buffer of closed candles for one symbol/tf.
+    Each candle is written twice (at `pos` and `pos + capacity`), so the last `capacity` candles
+    are always a single contiguous slice and reading never has to stitch the ring.
+    The unclosed candle lives in the slot right after that slice, so it can be viewed together with the history.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError(f"Invalid candles buffer capacity {capacity}")
+
+        self.capacity = capacity
+        self.count = 0
+        self.has_unclosed = False
+        self.timestamps = np.zeros(2 * capacity, dtype="datetime64[ns]")
+        self.values = np.zeros((len(CANDLE_COLUMNS), 2 * capacity), dtype=np.float64)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def window(self):
+        if self.count < self.capacity:
+            return 0, self.count
+
+        start = self.count % self.capacity
+        return start, start + self.capacity
+
+    @property
+    def iloc(self) -> CandlesBufferILoc:
+        return CandlesBufferILoc(self)
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        start, stop = self.window
+        return pd.DatetimeIndex(self.timestamps[start:stop], name="timestamp")
+
+    @property
+    def last_timestamp(self) -> Optional[datetime]:
+        if self.count == 0:
+            return None
+
+        _, stop = self.window
+        return pd.Timestamp(self.timestamps[stop - 1]).to_pydatetime()
+
+    def column(self, name: str) -> np.ndarray:
+        start, stop = self.window
+        return self.values[CANDLE_COLUMNS.index(name), start:stop]
+
+    def append(self, timestamp: datetime, open_: float, high: float, low: float, close: float, volume: float):
+        pos = self.count % self.capacity
+        mirror = pos + self.capacity
+        self.has_unclosed = False
+        self.timestamps[pos] = self.timestamps[mirror] = np.datetime64(timestamp, "ns")
+        values = self.values
+        values[0, pos] = values[0, mirror] = open_
+        values[1, pos] = values[1, mirror] = high
+        values[2, pos] = values[2, mirror] = low
+        values[3, pos] = values[3, mirror] = close
+        values[4, pos] = values[4, mirror] = volume
+        self.count += 1
+
+    def append_item(self, candle_item: Any):
+        self.append(*candle_item[:6])
+
+    def set_unclosed(self, timestamp: datetime, open_: float, high: float, low: float, close: float,
+                     volume: float):
+        # the slot after the window is free: it is either unused yet or the mirror of the oldest candle
+        _, pos = self.window
+        self.timestamps[pos] = np.datetime64(timestamp, "ns")
+        self.values[:, pos] = (open_, high, low, close, volume)
+        self.has_unclosed = True
+
+    def view(self, last_n: Optional[int] = None, include_unclosed: bool = True) -> CandlesView:
+        start, stop = self.window
+        if include_unclosed and self.has_unclosed:
+            stop += 1
+        if last_n is not None:
+            start = max(start, stop - last_n)
+
+        return CandlesView(self.timestamps[start:stop], self.values[:, start:stop])
+
+    def extend(self, candles: pd.DataFrame):
+        size = min(len(candles), self.capacity)
+        if size == 0:
+            return
+
+        self.has_unclosed = False
+        candles = candles.iloc[-size:]
+        timestamps = candles.index.values.astype("datetime64[ns]")
+        values = candles[CANDLE_COLUMNS].to_numpy(dtype=np.float64).T
+
+        positions = (self.count + np.arange(size)) % self.capacity
+        for pos_ in (positions, positions + self.capacity):
+            self.timestamps[pos_] = timestamps
+            self.values[:, pos_] = values
+
+        self.count += size
+
+    def clear(self):
+        self.count = 0
+        self.has_unclosed = False
+
+    def to_frame(self, start: Optional[int] = None, stop: Optional[int] = None,
+                 step: Optional[int] = None) -> pd.DataFrame:
+        w_start, w_stop = self.window
+        # positions within the closed candles, normalised like a list slice
+        positions = range(len(self))[start:stop:step]
+        if positions.step > 0:
+            rows = slice(w_start + positions.start, w_start + positions.stop, positions.step)
+        else:
+            # a negative step ends before position 0, which a shifted slice can't express
+            rows = w_start + np.arange(positions.start, positions.stop, positions.step)
+
+        return CandlesView(self.timestamps[rows], self.values[:, rows]).to_frame()
+
+    @staticmethod
+    def from_frame(candles: pd.DataFrame, capacity: int) -> "CandlesBuffer":
+        buffer = CandlesBuffer(capacity)
+        buffer.extend(candles)
+        return buffer
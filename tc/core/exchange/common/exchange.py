@@ -1,15 +1,15 @@
 from datetime import datetime
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
 import pandas as pd
 
 from core.base import CoreBase
+from core.exchange.common.candles_buffer import CandlesBuffer, CandlesView
 from core.exchange.common.order_book import OrderBook
 from core.exchange.binance.entities import Order
 
 # from  new.exchange.common.order_book_partial import OrderBookBase
 from core.types import Asset, RestMethod, Symbol, Tf, SymbolStr, OrderId
-from core.utils.data import candles_to_data_frame
 from core.exceptions import apiExceptionFactory
 
 
@@ -133,20 +133,19 @@ class PublicExchange(BaseExchange):
         super().__init__()
         self.assets: List[Asset] = []
         self.order_books: Dict[Symbol, OrderBook] = {}
-        self.trades: Dict[Symbol, List[Tuple[float, float, bool]]] = {}
-        self.candles: Dict[Symbol, Dict[Tf, pd.DataFrame]] = {}
+        self.trades: Dict[Symbol, Deque[Tuple[float, float, bool]]] = {}
+        self.candles: Dict[Symbol, Dict[Tf, CandlesBuffer]] = {}
         self.candle_unclosed: Dict[Symbol, Dict[Tf, Optional[List[Any]]]] = {}
         self.symbol_info: Dict[Symbol, SymbolInfo] = {}
         self.mark_prices: Dict[Symbol, float] = {}
         self.candle_dnv: Dict[Symbol, Dict[Tf, float]] = {}
 
-    def get_candles(self, symbol: SymbolStr, tf: Tf):
-        candles_ = self.candles[symbol][tf]
-        unclosed_candle = self.candle_unclosed[symbol][tf]
-        if unclosed_candle is not None:
-            return pd.concat([candles_, candles_to_data_frame([unclosed_candle])])
+    def get_candles(self, symbol: SymbolStr, tf: Tf, last_n: Optional[int] = None) -> pd.DataFrame:
+        return self.get_candles_view(symbol, tf, last_n).to_frame()
 
-        return candles_
+    def get_candles_view(self, symbol: SymbolStr, tf: Tf, last_n: Optional[int] = None,
+                         include_unclosed: bool = True) -> CandlesView:
+        return self.candles[symbol][tf].view(last_n, include_unclosed)
 
     def update_candles_dnv(self, symbol: Symbol, tf: Tf, price: float, volume: float):
         if symbol not in self.candle_dnv:
@@ -73,9 +73,8 @@ class WebSocketBase:
             while True:
                 message = await self.ws.recv()
                 try:
-                    for line in str(message).splitlines():
-                        # msg = ujson.loads(line)
-                        await self.on_message(ujson.loads(line))
+                    # one json document per frame, ujson takes str and bytes as they are
+                    await self.on_message(ujson.loads(message))
                 except Exception as e:
                     self.logger.error(add_traceback(e))
                     # traceback.print_exc()
@@ -90,13 +89,16 @@ class WebSocketBase:
             # logging.error(add_traceback(e))
 
     async def run(self):
+        connected_before = False
         while True:
             if self.on_before_connect is not None:
                 await self.on_before_connect()
             await self._connect()
 
-            if self.on_reconnect is not None:
+            # the first connect isn't a reconnect: whoever opened the socket subscribes on it
+            if connected_before and self.on_reconnect is not None:
                 await self.on_reconnect()
+            connected_before = True
 
             await self._read_socket()
 
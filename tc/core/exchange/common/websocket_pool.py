@@ -0,0 +1,218 @@
+import asyncio
+import zlib
+from datetime import datetime
+from typing import Callable, Coroutine, Dict, List, Optional, Tuple
+
+import ujson
+
+from core.exchange.common.websocket import WebSocketBase
+from core.utils.logs import setup_logger
+from core.utils.utils import paginate
+
+SHARD_BY_COUNT = "count"
+SHARD_BY_HASH = "hash"
+WS_MAX_STREAMS = 1024
+WS_STREAMS_PAGE = 20
+WS_MSG_TIME = 0.25
+WS_CONNECT_WAIT = 0.1
+# symbols are moved to the idlest shard once the spread of stream counts exceeds this part of max_streams
+REBALANCE_RATIO = 0.25
+
+
+def stream_group(stream: str) -> str:
+    # "btcusdt@kline_1h" -> "btcusdt", all streams of a symbol share a shard; "!miniTicker@arr" is its own group
+    return stream.split("@", 1)[0]
+
+
+class WebSocketPool(object):
+    """
+    Streams sharded over several connections. A symbol's streams are placed on one shard, picked by stream count
+    (the least loaded shard) or by symbol hash; a new shard is opened when all are at `max_streams`.
+    Every shard reconnects on its own and re-subscribes only its own streams.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect: Callable[[], Coroutine],
+        on_message: Callable,
+        shards: int = 1,
+        max_streams: int = WS_MAX_STREAMS,
+        shard_by: str = SHARD_BY_COUNT,
+        timeout: float = 0.0,
+        on_reconnect: Optional[Callable[[List[str]], Coroutine]] = None,
+        on_connect: Optional[Callable[[], Coroutine]] = None,
+        msg_time: float = WS_MSG_TIME,
+    ):
+        assert shard_by in (SHARD_BY_COUNT, SHARD_BY_HASH), f"Unknown shard_by {shard_by}"
+        self.name = name
+        self.connect = connect
+        self.on_message = on_message
+        self.max_streams = max_streams
+        self.shard_by = shard_by
+        self.timeout = timeout
+        self.on_reconnect = on_reconnect
+        self.on_connect = on_connect
+        self.msg_time = msg_time
+        self.logger = setup_logger(name)
+
+        self.shards: List[WebSocketBase] = []
+        self.shard_streams: List[Dict[str, datetime]] = []
+        self.stream_shard: Dict[str, int] = {}
+        # symbol group -> shard its streams were placed on, new streams of the symbol go there too
+        self.groups: Dict[str, int] = {}
+        for _ in range(max(shards, 1)):
+            self.add_shard()
+
+    def create_shard(self, index: int) -> WebSocketBase:
+        async def on_reconnect():
+            await self.resubscribe(index)
+
+        return WebSocketBase(
+            f"{self.name}_{index}",
+            self.connect,
+            self.on_message,
+            timeout=self.timeout,
+            on_reconnect=on_reconnect,
+            on_connect=self.on_connect,
+        )
+
+    def add_shard(self) -> int:
+        index = len(self.shards)
+        self.shard_streams.append({})
+        self.shards.append(self.create_shard(index))
+        return index
+
+    @property
+    def is_connected(self) -> bool:
+        return all(shard.is_connected for shard in self.shards)
+
+    @property
+    def streams_count(self) -> List[int]:
+        return [len(streams) for streams in self.shard_streams]
+
+    def pick_shard(self, group: str, size: int) -> int:
+        counts = self.streams_count
+        if self.shard_by == SHARD_BY_HASH:
+            index = zlib.crc32(group.encode()) % len(self.shards)
+            if counts[index] + size <= self.max_streams:
+                return index
+
+        index = min(range(len(counts)), key=lambda i: counts[i])
+        if counts[index] + size <= self.max_streams or counts[index] == 0:
+            return index
+
+        return self.add_shard()
+
+    def assign(self, streams: List[str]) -> Dict[int, List[str]]:
+        groups: Dict[str, List[str]] = {}
+        for stream in streams:
+            if stream not in self.stream_shard:
+                groups.setdefault(stream_group(stream), []).append(stream)
+
+        assigned: Dict[int, List[str]] = {}
+        for group, group_streams in groups.items():
+            index = self.groups.get(group, None)
+            if index is None or self.streams_count[index] + len(group_streams) > self.max_streams:
+                index = self.pick_shard(group, len(group_streams))
+
+            self.place(group_streams, index)
+            assigned.setdefault(index, []).extend(group_streams)
+
+        return assigned
+
+    def place(self, streams: List[str], index: int):
+        now_ = datetime.utcnow()
+        for stream in streams:
+            self.stream_shard[stream] = index
+            self.shard_streams[index][stream] = now_
+            self.groups[stream_group(stream)] = index
+
+    def release(self, streams: List[str]) -> Dict[int, List[str]]:
+        released: Dict[int, List[str]] = {}
+        for stream in streams:
+            index = self.stream_shard.pop(stream, None)
+            if index is None:
+                continue
+            self.shard_streams[index].pop(stream, None)
+            released.setdefault(index, []).append(stream)
+
+        return released
+
+    async def subscribe(self, streams: List[str]):
+        assigned = self.assign(streams)
+        await asyncio.gather(*[self.send(index, "SUBSCRIBE", s) for index, s in assigned.items()])
+
+    async def unsubscribe(self, streams: List[str]):
+        released = self.release(streams)
+        await asyncio.gather(*[self.send(index, "UNSUBSCRIBE", s) for index, s in released.items()])
+        await self.rebalance()
+
+    def plan_rebalance(self) -> List[Tuple[List[str], int, int]]:
+        if self.shard_by != SHARD_BY_COUNT or len(self.shards) < 2:
+            return []
+
+        moves = []
+        threshold = max(1, int(self.max_streams * REBALANCE_RATIO))
+        counts = self.streams_count
+        moved = set()
+        while True:
+            busiest = max(range(len(counts)), key=lambda i: counts[i])
+            idlest = min(range(len(counts)), key=lambda i: counts[i])
+            spread = counts[busiest] - counts[idlest]
+            if spread <= threshold:
+                break
+
+            groups: Dict[str, List[str]] = {}
+            for stream in self.shard_streams[busiest]:
+                if stream not in moved:
+                    groups.setdefault(stream_group(stream), []).append(stream)
+
+            # the largest group which still shrinks the spread
+            candidates = [g for g in groups.values() if 2 * len(g) <= spread]
+            if len(candidates) == 0:
+                break
+
+            group_streams = max(candidates, key=len)
+            moves.append((group_streams, busiest, idlest))
+            moved.update(group_streams)
+            counts[busiest] -= len(group_streams)
+            counts[idlest] += len(group_streams)
+
+        return moves
+
+    async def rebalance(self):
+        for group_streams, source, target in self.plan_rebalance():
+            self.release(group_streams)
+            self.place(group_streams, target)
+            self.logger.info(f"WS {self.name} move {group_streams} from shard {source} to {target}")
+            # subscribe first, so the symbol has no gap; the repeated messages in between are skipped downstream
+            await self.send(target, "SUBSCRIBE", group_streams)
+            await self.send(source, "UNSUBSCRIBE", group_streams)
+
+    async def resubscribe(self, index: int):
+        streams = list(self.shard_streams[index].keys())
+        if len(streams) == 0:
+            return
+
+        self.logger.warning(f"WS {self.name}_{index} resubscribe {len(streams)} streams")
+        for page in paginate(streams, WS_STREAMS_PAGE):
+            await self.send_message(index, "SUBSCRIBE", page)
+
+        if self.on_reconnect is not None:
+            await self.on_reconnect(streams)
+
+    async def send(self, index: int, method: str, streams: List[str]):
+        shard = self.shards[index]
+        while not shard.is_connected:
+            # the first connect of a shard does not resubscribe, this send is the only SUBSCRIBE it gets
+            await asyncio.sleep(WS_CONNECT_WAIT)
+
+        for page in paginate(streams, WS_STREAMS_PAGE):
+            await self.send_message(index, method, page)
+
+    async def send_message(self, index: int, method: str, params: List[str], id: int = 1):
+        msg = {"method": method.upper(), "params": params, "id": id}
+        self.logger.info(f"Send to WS {self.name}_{index} {method} with {params}")
+        await self.shards[index].ws.send(ujson.dumps(msg))
+        await asyncio.sleep(self.msg_time)
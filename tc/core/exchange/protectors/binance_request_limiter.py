@@ -1,68 +1,154 @@
 import asyncio
-from typing import Any
-from time import sleep
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Union
+
 from core.utils.dict_ import dict_any_value
 
+# 'x-mbx-used-weight': '1', 'x-mbx-used-weight-1m': '1', 'Content-Encoding': 'gzip', 'Strict-Transport-Security': 'max-age=31536000; includeSubdomains', 'X-Frame-Options': 'SAMEORIGIN', 'X-Xss-Protection': '1; mode=block', 'X-Content-Type-Options': 'nosniff', 'Content-Security-Policy': "default-src 'self'", 'X-Content-Security-Policy': "default-src 'self'", 'X-WebKit-CSP': "default-src 'self'", 'Cache-Control': 'no-cache, no-store, must-revalidate', 'Pragma': 'no-cache', 'Expires': '0', 'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS', 'X-Cache': 'Miss from cloudfront', 'Via': '1.1 a8f46a0f81ad5be499efe8a1372dd92a.cloudfront.net (CloudFront)', 'X-Amz-Cf-Pop': 'BOM78-P4', 'X-Amz-Cf-Id': '6L3i7UY6FWQDdgdATqZoLzT9vSs5VsfDcrgLYfEd-AD1sFqqBEHzpQ==')>
+USED_WEIGHT_HEADERS = ["x-mbx-used-weight-1m", "x-sapi-used-weight-1m", "x-mbx-used-weight"]
+WEIGHT_INTERVAL = 60
+RAW_REQUESTS_INTERVAL = 5 * 60
+# part of the limits we allow ourselves to use, the rest is left for other clients of the same IP
+SAFETY_RATIO = 0.9
+DEFAULT_WEIGHT = 1
 
-# used_weight_1m = int(dictAnyValueOf(['x-mbx-used-weight-1m', 'x-sapi-used-weight-1m', 'x-mbx-used-weight'],
-#                                     headers, BinanceRestApi.weight_limit_1m))
-#
-# slow_down_time = used_weight_1m / BinanceRestApi.weight_limit_1m
-# second = pd.to_datetime(headers['date']).second
-# delay = slow_down_time if 'retry-after' not in client.response.headers else int(headers['retry-after'])
-# BinanceRestApi.rate_limit_info = f'Delay: {round(delay, 3)}s  ' \
-#                                  f'Weight: {used_weight_1m}/{BinanceRestApi.weight_limit_1m} ' \
-#                                  f'Seconds: {60 - second}'
-# sleep(delay)
+RequestWeight = Union[int, Callable[[Dict[str, Any]], int]]
 
-# 'x-mbx-used-weight': '1', 'x-mbx-used-weight-1m': '1', 'Content-Encoding': 'gzip', 'Strict-Transport-Security': 'max-age=31536000; includeSubdomains', 'X-Frame-Options': 'SAMEORIGIN', 'X-Xss-Protection': '1; mode=block', 'X-Content-Type-Options': 'nosniff', 'Content-Security-Policy': "default-src 'self'", 'X-Content-Security-Policy': "default-src 'self'", 'X-WebKit-CSP': "default-src 'self'", 'Cache-Control': 'no-cache, no-store, must-revalidate', 'Pragma': 'no-cache', 'Expires': '0', 'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS', 'X-Cache': 'Miss from cloudfront', 'Via': '1.1 a8f46a0f81ad5be499efe8a1372dd92a.cloudfront.net (CloudFront)', 'X-Amz-Cf-Pop': 'BOM78-P4', 'X-Amz-Cf-Id': '6L3i7UY6FWQDdgdATqZoLzT9vSs5VsfDcrgLYfEd-AD1sFqqBEHzpQ==')>
+
+def weight_by_limit(steps: Dict[int, int], default_limit: int) -> Callable[[Dict[str, Any]], int]:
+    def weight(params: Dict[str, Any]) -> int:
+        limit = int(params.get("limit", default_limit))
+        for max_limit, weight_ in sorted(steps.items()):
+            if limit <= max_limit:
+                return weight_
+        return max(steps.values())
+
+    return weight
+
+
+SPOT_REQUEST_WEIGHTS: Dict[str, RequestWeight] = {
+    "/exchangeInfo": 20,
+    "/klines": 2,
+    "/depth": weight_by_limit({100: 5, 500: 25, 1000: 50, 5000: 250}, default_limit=100),
+    "/trades": 25,
+    "/ticker/price": 4,
+    "/ticker/24hr": 80,
+}
+
+FUTURES_REQUEST_WEIGHTS: Dict[str, RequestWeight] = {
+    "/exchangeInfo": 1,
+    "/klines": weight_by_limit({99: 1, 499: 2, 1000: 5, 1500: 10}, default_limit=500),
+    "/depth": weight_by_limit({50: 2, 100: 5, 500: 10, 1000: 20}, default_limit=500),
+    "/trades": 5,
+    "/premiumIndex": 10,
+    "/ticker/price": 2,
+    "/ticker/24hr": 40,
+}
+
+
+class TokenBucket(object):
+    def __init__(self, capacity: float, interval: float):
+        self.capacity = capacity
+        self.rate = capacity / interval
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self.refill(now)
+        # a request heavier than the whole bucket waits for a full bucket only
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float, now: float):
+        self.refill(now)
+        self.tokens -= amount
+
+    def sync_used(self, used: float, now: float):
+        self.refill(now)
+        self.tokens = min(self.tokens, self.capacity - used)
 
 
 class BinanceRequestLimiter(object):
+    """
+    Async weight limiter: REQUEST_WEIGHT (1m) and RAW_REQUESTS (5m) are modelled as token buckets,
+    re-synced from `x-mbx-used-weight-1m` and blocked by `retry-after`.
+    Waiting requests are served in FIFO order and never block the event loop.
+    """
     weight_limit_1m = 10
     raw_requests_5m = 2000
     info = ""
     initialized = False
 
-    def __init__(self):
+    def __init__(self, request_weights: Optional[Dict[str, RequestWeight]] = None):
         super().__init__()
-        # BinanceRestApi.weight_limit_1m = int(
-        #     [v['limit'] for v in exchange_info['rateLimits'] if v['rateLimitType'] == 'REQUEST_WEIGHT'][0])
-        #
+        self.request_weights = request_weights if request_weights is not None else SPOT_REQUEST_WEIGHTS
+        self.weight_bucket = TokenBucket(self.weight_limit_1m, WEIGHT_INTERVAL)
+        self.raw_requests_bucket = TokenBucket(self.raw_requests_5m, RAW_REQUESTS_INTERVAL)
+        self.blocked_until = 0.0
+        self.used_weight_1m = 0
+        self.weight_total = 0
+        self._lock: Optional[asyncio.Lock] = None
 
     def init(self, weight_limit_1m: int, raw_requests_5m: int):
         self.weight_limit_1m = weight_limit_1m
         self.raw_requests_5m = raw_requests_5m
+        self.weight_bucket = TokenBucket(weight_limit_1m * SAFETY_RATIO, WEIGHT_INTERVAL)
+        self.raw_requests_bucket = TokenBucket(raw_requests_5m * SAFETY_RATIO, RAW_REQUESTS_INTERVAL)
         self.initialized = True
 
-    async def delay(self, resp: Any):
+    @property
+    def lock(self) -> asyncio.Lock:
+        # created lazily: the limiter is a class attribute, built before any loop is running
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def get_weight(self, url: str, params: Optional[Dict[str, Any]] = None) -> int:
+        weight = self.request_weights.get(url, DEFAULT_WEIGHT)
+        return weight(params or {}) if callable(weight) else weight
+
+    async def acquire(self, weight: int = DEFAULT_WEIGHT):
+        if not self.initialized:
+            return
+
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                delay = max(self.blocked_until - now,
+                            self.weight_bucket.wait_time(weight, now),
+                            self.raw_requests_bucket.wait_time(1, now))
+                if delay <= 0:
+                    break
+
+                self.info = (
+                    f"Delay: {round(delay, 3)}s  "
+                    f"Weight: {self.used_weight_1m}/{self.weight_limit_1m} "
+                    f"Raw: /{self.raw_requests_5m} "
+                )
+                logging.debug(self.info)
+                await asyncio.sleep(delay)
+
+            self.weight_bucket.consume(weight, now)
+            self.raw_requests_bucket.consume(1, now)
+            self.weight_total += weight
+
+    def update(self, resp: Any):
         if not self.initialized or resp is None:
             return
 
         headers = resp.headers
-        used_weight_1m = int(
-            dict_any_value(
-                ["x-mbx-used-weight-1m", "x-sapi-used-weight-1m", "x-mbx-used-weight"],
-                headers,
-                self.weight_limit_1m,
-            )
-        )
-
-        slow_down_time = used_weight_1m / self.weight_limit_1m
-        # second = pd.to_datetime(headers['date']).second
-        # f'Seconds: {60 - second}'
-
-        delay = (
-            slow_down_time
-            if "retry-after" not in headers
-            else int(headers["retry-after"])
-        )
-
-        self.info = (
-            f"Delay: {round(delay, 3)}s  "
-            f"Weight: {used_weight_1m}/{self.weight_limit_1m} "
-            f"Raw: /{self.raw_requests_5m} "
-        )
-        print(self.info)
-        sleep(delay)
-        # await asyncio.sleep(delay)
+        now = time.monotonic()
+        self.used_weight_1m = int(dict_any_value(USED_WEIGHT_HEADERS, headers, 0))
+        self.weight_bucket.sync_used(self.used_weight_1m, now)
+
+        retry_after = headers.get("retry-after", None)
+        if retry_after is not None:
+            self.blocked_until = max(self.blocked_until, now + int(retry_after))
+            logging.warning(f"Request limit hit [{resp.status}], retry after {retry_after}s")
+
+        self.info = f"Weight: {self.used_weight_1m}/{self.weight_limit_1m} Raw: /{self.raw_requests_5m} "
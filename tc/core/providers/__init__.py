@@ -1 +1,2 @@
 from .data_provider import TimescaleDataProvider, DataProvider
+from .file_data_provider import FileDataProvider
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from core.types import SymbolStr, Tf
+
+CANDLES_CACHE_BYTES = 256 * 2 ** 20
+
+CacheKey = Tuple[SymbolStr, Tf]
+TimeRange = Tuple[datetime, datetime]
+
+
+class CoveredRange(object):
+    def __init__(self, start: datetime, end: datetime, candles: pd.DataFrame):
+        # every candle of [start, end) is in `candles`
+        self.start = start
+        self.end = end
+        self.candles = candles
+        self.size = int(candles.memory_usage(index=True).sum())
+
+
+def slice_candles(candles: pd.DataFrame, start: datetime, end: datetime) -> pd.DataFrame:
+    index = candles.index
+    return candles.iloc[index.searchsorted(start, side="left"):index.searchsorted(end, side="left")]
+
+
+class CandlesCache(object):
+    """
+    Candles per (symbol, tf) as contiguous covered ranges [start, end), merged when they touch.
+    Least recently used keys are evicted once the frames take more than `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = CANDLES_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.ranges: "OrderedDict[CacheKey, List[CoveredRange]]" = OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def missing(self, key: CacheKey, start: datetime, end: datetime) -> List[TimeRange]:
+        """
+        Parts of [start, end) not covered yet, counted as a hit, partial hit or miss.
+        """
+        missing = []
+        position = start
+        for covered in self.ranges.get(key, []):
+            if covered.end <= position:
+                continue
+            if covered.start >= end:
+                break
+            if covered.start > position:
+                missing.append((position, covered.start))
+            position = covered.end
+            if position >= end:
+                break
+
+        if position < end:
+            missing.append((position, end))
+
+        if len(missing) == 0:
+            self.hits += 1
+        elif missing == [(start, end)]:
+            self.misses += 1
+        else:
+            self.partial_hits += 1
+
+        return missing
+
+    def put(self, key: CacheKey, start: datetime, end: datetime, candles: pd.DataFrame):
+        if start >= end:
+            return
+
+        ranges = self.ranges.pop(key, [])
+        merged_start, merged_end = start, end
+        parts = [candles]
+        kept = []
+        for covered in ranges:
+            if covered.end < merged_start or covered.start > merged_end:
+                kept.append(covered)
+                continue
+            # overlapping or touching: one range
+            merged_start, merged_end = min(merged_start, covered.start), max(merged_end, covered.end)
+            parts.append(covered.candles)
+            self.bytes -= covered.size
+
+        parts = [p for p in parts if len(p) > 0]
+        merged = pd.concat(parts) if len(parts) > 0 else candles
+        merged = merged[~merged.index.duplicated(keep="first")].sort_index()
+        covered = CoveredRange(merged_start, merged_end, merged)
+        self.ranges[key] = sorted(kept + [covered], key=lambda r: r.start)
+        self.bytes += covered.size
+        self.evict(keep=key)
+
+    def update(self, key: CacheKey, candles: pd.DataFrame):
+        # candles written meanwhile (REST fills the DB): added to the ranges covering them
+        for i, covered in enumerate(self.ranges.get(key, [])):
+            new = slice_candles(candles, covered.start, covered.end)
+            if len(new) == 0:
+                continue
+            merged = pd.concat([covered.candles, new]) if len(covered.candles) > 0 else new
+            merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+            self.bytes -= covered.size
+            self.ranges[key][i] = CoveredRange(covered.start, covered.end, merged)
+            self.bytes += self.ranges[key][i].size
+
+        self.evict(keep=key)
+
+    def read(self, key: CacheKey, start: datetime, end: datetime) -> Optional[pd.DataFrame]:
+        for covered in self.ranges.get(key, []):
+            if covered.start <= start and end <= covered.end:
+                self.ranges.move_to_end(key)
+                return slice_candles(covered.candles, start, end)
+
+        return None
+
+    def evict(self, keep: Optional[CacheKey] = None):
+        while self.bytes > self.max_bytes and len(self.ranges) > 0:
+            key = next(iter(self.ranges))
+            if key == keep:
+                break
+            self.bytes -= sum(covered.size for covered in self.ranges.pop(key))
+            self.evictions += 1
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        requests = self.hits + self.partial_hits + self.misses
+        return dict(hits=self.hits, partial_hits=self.partial_hits, misses=self.misses,
+                    hit_rate=round(self.hits / requests, 3) if requests > 0 else 0.0,
+                    keys=len(self.ranges), bytes=self.bytes, evictions=self.evictions)
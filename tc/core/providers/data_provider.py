@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional, Union, Dict, Any, List, TypeVar
 from urllib.parse import quote_plus
 import logging
@@ -8,8 +8,10 @@ from config import Config
 
 from core.types import Singleton, SymbolStr, Tf, Tuple, TaLevels
 from core.utils.data import candles_to_data_frame
+from core.utils.timeframe import tf_size_minutes
 from core.db import TimesScaleDb
 from core.base import CoreBase
+from core.providers.candles_cache import CANDLES_CACHE_BYTES, CandlesCache, TimeRange
 
 
 class DataProvider(object):
@@ -29,20 +31,38 @@ class DataProvider(object):
         logging.warning(f"load_candles - not implemented")
         return pd.DataFrame()
 
+    async def load_candles_many(
+            self,
+            symbols: List[SymbolStr],
+            tf: Tf,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+    ) -> Dict[SymbolStr, pd.DataFrame]:
+        return {symbol: await self.load_candles(symbol, tf, start_time, end_time) for symbol in symbols}
+
     async def init(self):
         pass
 
+    async def close(self):
+        pass
+
 
 # TDataProvider = TypeVar("TDataProvider", bound="DataProvider")
 
 
 class TimescaleDataProvider(DataProvider):
-    def __init__(self, config: Optional[Config] = None, db: Optional[TimesScaleDb] = None):
+    def __init__(self, config: Optional[Config] = None, db: Optional[TimesScaleDb] = None,
+                 cache_bytes: int = CANDLES_CACHE_BYTES):
         super().__init__()
+        # pool: candles of many symbols are loaded concurrently
         self.db: Optional[TimesScaleDb] = db or TimesScaleDb(**config.get_timescale_db_params())
+        # overlapping windows are read from memory, only the uncovered parts from the DB; 0 turns it off
+        self.cache: Optional[CandlesCache] = CandlesCache(cache_bytes) if cache_bytes > 0 else None
 
     async def save_candles(self, symbol: SymbolStr, tf: Tf, candles: pd.DataFrame):
         await self.db.save_candles(symbol, tf, candles)
+        if self.cache is not None:
+            self.cache.update((symbol, tf), candles)
 
     async def load_candles(
             self,
@@ -51,11 +71,63 @@ class TimescaleDataProvider(DataProvider):
             start_time: Optional[datetime] = None,
             end_time: Optional[datetime] = None,
     ) -> pd.DataFrame:
-        return await self.db.load_candles(symbol, tf, start_time, end_time)
+        if self.cache is None:
+            return await self.db.load_candles(symbol, tf, start_time, end_time)
+
+        return (await self.load_candles_many([symbol], tf, start_time, end_time))[symbol]
+
+    async def load_candles_many(
+            self,
+            symbols: List[SymbolStr],
+            tf: Tf,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+    ) -> Dict[SymbolStr, pd.DataFrame]:
+        if self.cache is None:
+            return await self.db.load_candles_many(symbols, tf, start_time, end_time)
+
+        now = datetime.utcnow()
+        start, end = start_time or datetime.min, min(end_time or datetime.max, now)
+        step = timedelta(minutes=tf_size_minutes(tf))
+        ranges: Dict[TimeRange, List[SymbolStr]] = {}
+        for symbol in symbols:
+            for missing in self.cache.missing((symbol, tf), start, end):
+                ranges.setdefault(missing, []).append(symbol)
+
+        # symbols missing the same range share one query
+        tails: Dict[SymbolStr, datetime] = {}
+        for (missing_from, missing_to), group in ranges.items():
+            candles = await self.db.load_candles_many(group, tf, None if missing_from == datetime.min else missing_from,
+                                                      missing_to)
+            for symbol in group:
+                covered_to = missing_to
+                if missing_to > now - step:
+                    # the newest candles may not be written yet: covered only up to the last one returned,
+                    # the tail after it is asked again next time
+                    last = candles[symbol].index[-1] + step if len(candles[symbol]) > 0 else missing_from
+                    covered_to = tails[symbol] = min(last, missing_to)
+                self.cache.put((symbol, tf), missing_from, covered_to, candles[symbol])
+
+        result = {}
+        for symbol in symbols:
+            # nothing is stored after an uncovered tail
+            read_to = tails.get(symbol, end)
+            candles = self.cache.read((symbol, tf), start, read_to) if read_to > start else None
+            if candles is None:
+                # evicted meanwhile by a tight budget or nothing stored at all
+                candles = await self.db.load_candles(symbol, tf, start_time, end_time)
+            result[symbol] = candles
+
+        return result
 
     async def init(self):
         await self.db.init()
 
+    async def close(self):
+        # writes the buffered trades before the pool goes
+        await self.db.close()
+
+
 # async def create_timescale_db_data_provider(host: str, username: str, password: str):
 #     db_provider = TimescaleDataProvider(host, username, password)
 #     await db_provider.db.init()
@@ -0,0 +1,245 @@
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.providers.data_provider import DataProvider
+from core.types import SymbolStr, Tf
+from core.utils.data import candles_to_data_frame
+from core.utils.logs import add_traceback
+from core.utils.timeframe import tf_size_minutes
+
+CANDLES_COLUMNS = ["o", "h", "l", "c", "v"]
+COLUMN_DTYPES = {"timestamp": np.int64, **{name: np.float64 for name in CANDLES_COLUMNS}}
+COLUMN_SIZE = 8
+COVERED_FROM_FILE = "covered_from.i8"
+# covered_from of a cache filled from the first stored candle on
+COVERED_ALL = np.iinfo(np.int64).min
+
+
+def to_ns(time: datetime) -> int:
+    return int(np.datetime64(time, "ns").astype(np.int64))
+
+
+def from_ns(value: int) -> datetime:
+    return pd.Timestamp(value).to_pydatetime()
+
+
+class CandlesFile(object):
+    """
+    Candles of one symbol/tf in a directory with a file per column: `timestamp` (int64 ns) and `o`, `h`, `l`,
+    `c`, `v` (float64), rows in timestamp order. New candles are appended, reads map the files with np.memmap.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if not os.path.exists(path) and os.path.exists(f"{path}.old"):
+            # a rewrite stopped between its two renames
+            os.rename(f"{path}.old", path)
+        os.makedirs(path, exist_ok=True)
+
+    def column_path(self, name: str, path: Optional[str] = None) -> str:
+        return os.path.join(path or self.path, name)
+
+    def __len__(self) -> int:
+        # an append cut short leaves columns of different length, the complete rows are the shortest column
+        sizes = [os.path.getsize(self.column_path(name)) if os.path.exists(self.column_path(name)) else 0
+                 for name in COLUMN_DTYPES]
+        return min(sizes) // COLUMN_SIZE
+
+    def column(self, name: str, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.empty(0, dtype=COLUMN_DTYPES[name])
+        return np.memmap(self.column_path(name), dtype=COLUMN_DTYPES[name], mode="r", shape=(rows,))
+
+    @property
+    def last_time(self) -> Optional[datetime]:
+        rows = len(self)
+        return from_ns(self.column("timestamp", rows)[-1]) if rows > 0 else None
+
+    @property
+    def covered_from(self) -> Optional[datetime]:
+        """
+        Start of the range read through from the upstream provider, None before the first read through.
+        """
+        path = self.column_path(COVERED_FROM_FILE)
+        if not os.path.exists(path):
+            return None
+        value = int(np.fromfile(path, dtype=np.int64)[0])
+        return datetime.min if value == COVERED_ALL else from_ns(value)
+
+    @covered_from.setter
+    def covered_from(self, value: datetime):
+        np.array([COVERED_ALL if value == datetime.min else to_ns(value)], dtype=np.int64).tofile(
+            self.column_path(COVERED_FROM_FILE))
+
+    def read(self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> pd.DataFrame:
+        # [start_time, end_time) as TimesScaleDb.load_candles
+        rows = len(self)
+        timestamps = self.column("timestamp", rows)
+        start = 0 if start_time is None else np.searchsorted(timestamps, to_ns(start_time), side="left")
+        end = rows if end_time is None else np.searchsorted(timestamps, to_ns(end_time), side="left")
+
+        index = pd.DatetimeIndex(np.array(timestamps[start:end]).view("datetime64[ns]"), name="timestamp")
+        return pd.DataFrame({name: np.array(self.column(name, rows)[start:end]) for name in CANDLES_COLUMNS},
+                            index=index)
+
+    def append(self, candles: pd.DataFrame):
+        if len(candles) == 0:
+            return
+
+        candles = candles[~candles.index.duplicated(keep="last")].sort_index()
+        timestamps = candles.index.values.astype("datetime64[ns]").view(np.int64)
+        rows = len(self)
+        stored = self.column("timestamp", rows)
+        last = stored[-1] if rows > 0 else None
+
+        older = timestamps <= last if last is not None else np.zeros(len(timestamps), dtype=bool)
+        if older.any() and not np.isin(timestamps[older], stored).all():
+            self.rewrite(candles)
+            return
+
+        newer = ~older
+        if not newer.any():
+            return
+
+        values = {"timestamp": timestamps[newer],
+                  **{name: candles[name].to_numpy(dtype=np.float64)[newer] for name in CANDLES_COLUMNS}}
+        for name, column in values.items():
+            with open(self.column_path(name), "ab") as f:
+                f.truncate(rows * COLUMN_SIZE)
+                f.write(column.astype(COLUMN_DTYPES[name]).tobytes())
+
+    def rewrite(self, candles: pd.DataFrame):
+        # candles before the last stored one: merge and write a new directory in place of the old one
+        merged = pd.concat([self.read(), candles[CANDLES_COLUMNS]])
+        merged = merged[~merged.index.duplicated(keep="first")].sort_index()
+        covered_from = self.covered_from
+
+        path = f"{self.path}.tmp"
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        merged.index.values.astype("datetime64[ns]").view(np.int64).tofile(self.column_path("timestamp", path))
+        for name in CANDLES_COLUMNS:
+            merged[name].to_numpy(dtype=np.float64).tofile(self.column_path(name, path))
+
+        os.rename(self.path, f"{self.path}.old")
+        os.rename(path, self.path)
+        shutil.rmtree(f"{self.path}.old")
+        if covered_from is not None:
+            self.covered_from = covered_from
+
+
+class FileDataProvider(DataProvider):
+    """
+    Candles in local column files (`CandlesFile`) in front of an optional upstream provider (TimescaleDataProvider):
+    reads fetch from upstream only what the files don't hold yet, writes go to both.
+    Without upstream it serves what is on disk.
+    """
+
+    def __init__(self, path: str, upstream: Optional[DataProvider] = None):
+        super().__init__()
+        self.path = path
+        self.upstream = upstream
+        self.files: Dict[Tuple[SymbolStr, Tf], CandlesFile] = {}
+
+    async def init(self):
+        os.makedirs(self.path, exist_ok=True)
+        if self.upstream is not None:
+            await self.upstream.init()
+
+    async def close(self):
+        if self.upstream is not None:
+            await self.upstream.close()
+
+    def get_file(self, symbol: SymbolStr, tf: Tf) -> CandlesFile:
+        file = self.files.get((symbol, tf), None)
+        if file is None:
+            file = self.files[(symbol, tf)] = CandlesFile(os.path.join(self.path, f"{symbol}_{tf}"))
+        return file
+
+    def get_missing(self, file: CandlesFile, start_time: Optional[datetime],
+                    end_time: Optional[datetime]) -> List[Tuple[Optional[datetime], Optional[datetime]]]:
+        covered_from = file.covered_from
+        if covered_from is None:
+            return [(start_time, end_time)]
+
+        missing = []
+        if covered_from != datetime.min and (start_time is None or start_time < covered_from):
+            missing.append((start_time, covered_from))
+
+        # from the last stored candle on (it is read again and skipped by append), even if start_time is later:
+        # the files never get a hole
+        tail = file.last_time or (covered_from if covered_from != datetime.min else start_time)
+        if end_time is None or tail is None or tail < end_time:
+            missing.append((tail, end_time))
+
+        return missing
+
+    async def read_through(self, symbols: List[SymbolStr], tf: Tf, start_time: Optional[datetime],
+                           end_time: Optional[datetime]):
+        # symbols missing the same range (a cold start, tails after a restart) share one upstream query
+        ranges: Dict[Tuple[Optional[datetime], Optional[datetime]], List[SymbolStr]] = {}
+        for symbol in symbols:
+            for missing in self.get_missing(self.get_file(symbol, tf), start_time, end_time):
+                ranges.setdefault(missing, []).append(symbol)
+
+        for (missing_from, missing_to), group in ranges.items():
+            candles = await self.upstream.load_candles_many(group, tf, missing_from, missing_to)
+            for symbol in group:
+                file = self.get_file(symbol, tf)
+                file.append(candles.get(symbol, candles_to_data_frame([])))
+                covered_from = file.covered_from
+                if missing_from is None:
+                    file.covered_from = datetime.min
+                elif covered_from is None or (covered_from != datetime.min and missing_from < covered_from):
+                    file.covered_from = missing_from
+
+    async def save_candles(self, symbol: SymbolStr, tf: Tf, candles: pd.DataFrame):
+        if self.upstream is None:
+            self.get_file(symbol, tf).append(candles)
+            return
+
+        await self.upstream.save_candles(symbol, tf, candles)
+        file = self.get_file(symbol, tf)
+        last_time = file.last_time
+        if len(candles) > 0 and file.covered_from is not None and last_time is not None \
+                and candles.index.min() > last_time + timedelta(minutes=tf_size_minutes(tf)):
+            # candles after a hole: the range from the last stored candle is read through first (the saved
+            # candles included), if it fails they aren't appended, the files never get a hole
+            try:
+                await self.read_through([symbol], tf, last_time, candles.index.max() + timedelta(seconds=1))
+            except Exception as e:
+                logging.error(f"Read through {symbol} {tf} before saving failed: {add_traceback(e)}")
+                return
+
+        file.append(candles)
+
+    async def load_candles(
+            self,
+            symbol: SymbolStr,
+            tf: Tf,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+    ) -> pd.DataFrame:
+        return (await self.load_candles_many([symbol], tf, start_time, end_time))[symbol]
+
+    async def load_candles_many(
+            self,
+            symbols: List[SymbolStr],
+            tf: Tf,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+    ) -> Dict[SymbolStr, pd.DataFrame]:
+        if self.upstream is not None:
+            try:
+                await self.read_through(symbols, tf, start_time, end_time)
+            except Exception as e:
+                # what is on disk is served all the same
+                logging.error(f"Read through {tf} candles failed: {add_traceback(e)}")
+
+        return {symbol: self.get_file(symbol, tf).read(start_time, end_time) for symbol in symbols}
@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
 from datetime import timedelta
-from typing import Dict
+from typing import AsyncIterator, Dict
 # import numba
 # from numba import jit
 #
@@ -9,20 +9,40 @@ from typing import Dict
 
 
 # @jit(nopython=True)
-def get_clusters_by_tf(trades: pd.DataFrame, min_price: float,  max_price: float, step: float, tf_size:timedelta):
-    data = trades[["price", "volume"]]
-    clusters_all = {}
-    min_vol = 1e10
-    max_vol = 0
-    for interval in list(pd.cut(data.index, np.arange(trades.index[0], trades.index[-1], tf_size)).categories):
-        print(interval)
-        if not pd.isnull(interval):
-            chunk = data.query("@interval.left <= index < @interval.right")
-            # clusters = chunk['volume'].groupby(pd.cut(chunk.price, np.arange(min_price, max_price, step))).sum()
-            clusters = get_clusters(chunk, chunk.price.min(), chunk.price.max(), step)
-            clusters_all[interval.left] = clusters
-            min_vol = min(clusters[clusters > 0].min(), max_vol)
-            max_vol = max(clusters.max(), max_vol)
+async def get_clusters_by_tf(trades_chunks: AsyncIterator[pd.DataFrame], min_price: float, max_price: float,
+                             step: float, tf_size: timedelta):
+    """
+    Volume per price level of every `tf_size` interval from the first trade, the trades streamed in chunks
+    (`TimesScaleDb.iter_trades`): only the volumes per interval and level are kept, never all the trades.
+    The interval of the last trade is left out, it may be incomplete.
+    """
+    edges = np.arange(min_price, max_price, step)
+    levels = pd.CategoricalIndex(pd.IntervalIndex.from_breaks(edges), name="price")
+    tf_ns = int(tf_size.total_seconds() * 1e9)
+    volumes = np.zeros((0, len(levels)))
+    first, last = None, None
+    async for chunk in trades_chunks:
+        if len(chunk) == 0:
+            continue
+
+        times = chunk.index.to_numpy().astype("datetime64[ns]").view(np.int64)
+        first = times[0] if first is None else first
+        last = times[-1]
+        intervals = (times - first) // tf_ns
+        # levels are closed on the right like pd.cut, prices outside the edges are not counted
+        price_levels = np.searchsorted(edges, chunk["price"].to_numpy(), side="left") - 1
+        counted = (price_levels >= 0) & (price_levels < len(levels))
+        if intervals[-1] >= len(volumes):
+            volumes = np.vstack([volumes, np.zeros((intervals[-1] + 1 - len(volumes), len(levels)))])
+        np.add.at(volumes, (intervals[counted], price_levels[counted]), chunk["volume"].to_numpy()[counted])
+
+    count = 0 if first is None else max(-(-(last - first) // tf_ns) - 1, 0)
+    clusters_all = {pd.Timestamp(first + i * tf_ns): pd.Series(volumes[i], index=levels, name="volume")
+                    for i in range(min(count, len(volumes)))}
+    counted_volumes = volumes[:count]
+    positive = counted_volumes[counted_volumes > 0]
+    min_vol = positive.min() if len(positive) > 0 else 1e10
+    max_vol = counted_volumes.max() if counted_volumes.size > 0 else 0
 
     return clusters_all, (min_vol, max_vol)
 
@@ -1,8 +1,27 @@
+from operator import itemgetter
 from typing import Any, List
 
+import numpy as np
 import pandas as pd
 
+CANDLE_COLUMNS = ["o", "h", "l", "c", "v"]
+
 
 def candles_to_data_frame(data: List[List[Any]]) -> pd.DataFrame:
     df = pd.DataFrame(data, columns=["timestamp", "o", "h", "l", "c", "v"])
     return df.set_index("timestamp")
+
+
+def klines_to_data_frame(klines: List[List[Any]]) -> pd.DataFrame:
+    """
+    Binance klines ([open time ms, "o", "h", "l", "c", "v", close time, ...] rows) as typed candle columns:
+    each column is read straight into a preallocated numpy array, no row lists, datetimes or frames per row.
+    """
+    n = len(klines)
+    timestamps = np.fromiter(map(itemgetter(0), klines), dtype=np.int64, count=n)
+    columns = {
+        name: np.fromiter(map(float, map(itemgetter(i), klines)), dtype=np.float64, count=n)
+        for i, name in enumerate(CANDLE_COLUMNS, start=1)
+    }
+    index = pd.DatetimeIndex(timestamps.astype("datetime64[ms]").astype("datetime64[ns]"), name="timestamp")
+    return pd.DataFrame(columns, index=index)
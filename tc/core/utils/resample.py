@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.types import Tf
+from core.utils.timeframe import tf_size_minutes
+
+CANDLE_COLUMNS = ["o", "h", "l", "c", "v"]
+DAY_MINUTES = 24 * 60
+
+
+def can_resample(tf: Tf, base_tf: Tf) -> bool:
+    # whole base candles per tf candle, and tf candles aligned within the day as round_time_to_tf aligns them
+    size, base_size = tf_size_minutes(tf), tf_size_minutes(base_tf)
+    return size > base_size and size % base_size == 0 and DAY_MINUTES % size == 0
+
+
+def get_derived_tfs(base_tf: Tf, tfs: List[Tf]) -> List[Tf]:
+    return [tf for tf in tfs if can_resample(tf, base_tf)]
+
+
+def tf_floor(timestamps: np.ndarray, tf: Tf) -> np.ndarray:
+    # round_time_to_tf for a whole array: the epoch starts at midnight and tf divides the day
+    step = tf_size_minutes(tf) * 60 * 10 ** 9
+    ns = np.asarray(timestamps, dtype="datetime64[ns]").view(np.int64)
+    return (ns - ns % step).view("datetime64[ns]")
+
+
+def resample_candles(candles: pd.DataFrame, tf: Tf, base_tf: Tf, complete_only: bool = True) -> pd.DataFrame:
+    """
+    OHLCV of `tf` from time ordered `base_tf` candles in one pass: the bounds of every tf candle are found at once
+    and each column is reduced with ufunc.reduceat.
+    With `complete_only` the first and last tf candles are dropped unless the base candles reach their bounds
+    (the last one is still open, the first one started before the loaded history).
+    """
+    assert can_resample(tf, base_tf), f"{tf} can't be built from {base_tf}"
+    if len(candles) == 0:
+        return candles[CANDLE_COLUMNS].copy()
+
+    timestamps = candles.index.values.astype("datetime64[ns]")
+    buckets = tf_floor(timestamps, tf)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)]
+
+    o, h, l, c, v = [candles[name].to_numpy(dtype=np.float64) for name in CANDLE_COLUMNS]
+    result = pd.DataFrame({
+        "o": o[starts],
+        "h": np.maximum.reduceat(h, starts),
+        "l": np.minimum.reduceat(l, starts),
+        "c": c[ends - 1],
+        "v": np.add.reduceat(v, starts),
+    }, index=pd.DatetimeIndex(buckets[starts], name="timestamp"))
+
+    if complete_only:
+        tf_delta = np.timedelta64(tf_size_minutes(tf), "m")
+        base_delta = np.timedelta64(tf_size_minutes(base_tf), "m")
+        keep = np.ones(len(result), dtype=bool)
+        keep[0] &= timestamps[0] == buckets[0]
+        keep[-1] &= timestamps[-1] + base_delta == buckets[-1] + tf_delta
+        result = result[keep]
+
+    return result
+
+
+def aggregate_candles(timestamps: np.ndarray, values: np.ndarray, start: datetime,
+                      end: datetime) -> Optional[List[Any]]:
+    """
+    One candle [start, o, h, l, c, v] of the base candles within [start, end) (`values` rows are o, h, l, c, v),
+    None if there are none.
+    """
+    in_range = (timestamps >= np.datetime64(start, "ns")) & (timestamps < np.datetime64(end, "ns"))
+    if not in_range.any():
+        return None
+
+    o, h, l, c, v = values[:, in_range]
+    return [start, float(o[0]), float(h.max()), float(l.min()), float(c[-1]), float(v.sum())]
@@ -1,6 +1,10 @@
 import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
 from core.base import CoreBase
 from core.types import RestMethod
+from core.utils.logs import add_traceback
 import logging
 from urllib.parse import quote
 from config import Config
@@ -10,6 +14,12 @@ CHANNEL_ID = "-1001734167495"
 
 TELEGRAM_API_SEND_MESSAGE_URL = 'https://api.telegram.org/bot{apiToken}/sendMessage'
 TELEGRAM_API_GET_UPDATES_URL = 'https://api.telegram.org/bot{apiToken}/getUpdates'
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+TELEGRAM_CHAT_INTERVAL = 1.0
+TELEGRAM_GROUP_INTERVAL = 3.0
+TELEGRAM_COALESCE_TIME = 2.0
+TELEGRAM_MAX_RETRIES = 5
 
 
 async def get_telegram_chat_updates():
@@ -19,7 +29,10 @@ async def get_telegram_chat_updates():
     print(content)
 
 
-async def send_to_telegram(message: str, channel_id: str = CHANNEL_ID):
+async def post_to_telegram(message: str, channel_id: str = CHANNEL_ID) -> Tuple[bool, Optional[float]]:
+    """
+    Returns (delivered, retry_after), retry_after is set when Telegram rate limited the request.
+    """
     try:
         content, _ = await CoreBase.get_request().request_json(url=TELEGRAM_API_SEND_MESSAGE_URL.format(
             apiToken= Config.TELEGRAM_BOT_TOKEN),
@@ -27,6 +40,97 @@ async def send_to_telegram(message: str, channel_id: str = CHANNEL_ID):
             params={'chat_id': quote(channel_id), 'text': message, 'parse_mode': 'html'})
     except Exception as e:
         logging.error(f"Telegram error {e}")
+        return False, None
+
+    if content.get("ok", False):
+        return True, None
+
+    if content.get("error_code", None) == 429:
+        return False, float(content.get("parameters", {}).get("retry_after", TELEGRAM_CHAT_INTERVAL))
+
+    logging.error(f"Telegram error {content.get('error_code', None)}: {content.get('description', None)}")
+    return False, None
+
+
+async def send_to_telegram(message: str, channel_id: str = CHANNEL_ID):
+    await post_to_telegram(message, channel_id)
+
+
+def split_message(lines: List[str], max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
+    messages = []
+    current = ""
+    for line in lines:
+        line = line[:max_length]
+        if current and len(current) + len(line) + 1 > max_length:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+
+    if current:
+        messages.append(current)
+
+    return messages
+
+
+class TelegramQueue(object):
+    """
+    Background delivery of telegram messages. `send` only enqueues, messages of one chat arriving within
+    `coalesce_time` are joined into one digest, delivery keeps the per chat rate and retries on 429.
+    """
+
+    def __init__(self, coalesce_time: float = TELEGRAM_COALESCE_TIME, max_retries: int = TELEGRAM_MAX_RETRIES):
+        self.coalesce_time = coalesce_time
+        self.max_retries = max_retries
+        self.pending: Dict[str, List[str]] = {}
+        self.workers: Dict[str, asyncio.Task] = {}
+        self.last_sent: Dict[str, float] = {}
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, message: str, channel_id: str = CHANNEL_ID):
+        self.pending.setdefault(channel_id, []).append(message)
+        if channel_id not in self.workers:
+            self.workers[channel_id] = CoreBase.get_loop().create_task(self._deliver(channel_id))
+
+    async def flush(self):
+        while len(self.workers) > 0:
+            await asyncio.gather(*list(self.workers.values()), return_exceptions=True)
+
+    @staticmethod
+    def chat_interval(channel_id: str) -> float:
+        return TELEGRAM_GROUP_INTERVAL if channel_id.startswith("-") else TELEGRAM_CHAT_INTERVAL
+
+    async def _deliver(self, channel_id: str):
+        try:
+            while len(self.pending.get(channel_id, [])) > 0:
+                await asyncio.sleep(self.coalesce_time)  # let the burst of one candle close gather
+                lines = self.pending.pop(channel_id, [])
+                for message in split_message(lines):
+                    await self._post(message, channel_id)
+        except Exception as e:
+            logging.error(add_traceback(e))
+        finally:
+            del self.workers[channel_id]
+
+    async def _post(self, message: str, channel_id: str):
+        for attempt in range(self.max_retries):
+            wait = self.last_sent.get(channel_id, 0) + self.chat_interval(channel_id) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            delivered, retry_after = await post_to_telegram(message, channel_id)
+            self.last_sent[channel_id] = time.monotonic()
+            if delivered:
+                self.sent += 1
+                return
+            if retry_after is None:
+                break
+
+            logging.warning(f"Telegram rate limit for {channel_id}, retry after {retry_after}s")
+            await asyncio.sleep(retry_after)
+
+        self.dropped += 1
+        logging.error(f"Telegram message to {channel_id} dropped: {message[:100]}")
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List
 
 
 def human_price(price: float) -> str:
@@ -16,3 +17,7 @@ def get_cluster_size(price: float):
             return v
 
     return 0.00001
+
+
+def paginate(data: List, page_length: int):
+    return [data[i: i + page_length] for i in range(0, len(data), page_length)]
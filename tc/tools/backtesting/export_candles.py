@@ -14,12 +14,13 @@ futures_api = PublicFuturesBinance()
 kline_lengths = {"1d": 365 * 5 * 24 * 60, "4h": 365 * 6 * 60, "1h": 190 * 24 * 60}
 
 
-def save_to_csv(symbol, tf, candles):
+def save_to_csv(symbol, tf, candles, append: bool = False):
     count = len(candles)
     if count > 0:
         # last_candle_time = int(candles.iloc[-1][0].timestamp())
         logging.info(f"{symbol} {tf} save {count} candles from exchange.")
-        candles.to_csv(f"{Config.DATA_PATH}/candles/{symbol}_{tf}.csv", sep=";")
+        candles.to_csv(f"{Config.DATA_PATH}/candles/{symbol}_{tf}.csv", sep=";", mode="a" if append else "w",
+                       header=not append)
 
 
 # async def import_candles(symbols: List[Symbol]):
@@ -55,9 +56,12 @@ async def main():
     data = await db.get_symbol_status(active=True)
     for s in data:
         for tf in ['1d', '4h', '1h', '15m']:
-            df = await db.load_candles(s['symbol'], Tf(tf))
-            df['timestamp'] = df.index
-            save_to_csv(s['symbol'], tf, df)
+            # chunk by chunk, the whole history of a symbol is never in memory
+            append = False
+            async for df in db.iter_candles(s['symbol'], Tf(tf)):
+                df['timestamp'] = df.index
+                save_to_csv(s['symbol'], tf, df, append=append)
+                append = True
     # await import_candles(symbols)
 
     # for symbol, candles_by_tf in spot_api.candles.items():
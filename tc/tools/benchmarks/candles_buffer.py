@@ -0,0 +1,54 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from core.exchange.common.candles_buffer import CandlesBuffer
+from core.utils.data import candles_to_data_frame
+
+SYMBOLS = 300
+TFS = ["1h", "4h", "1d"]
+HISTORY = 2000
+CLOSES = 20
+
+
+def make_history(length: int = HISTORY) -> pd.DataFrame:
+    index = pd.date_range(datetime(2022, 1, 1), periods=length, freq="1h", name="timestamp")
+    values = np.random.random((length, 5))
+    return pd.DataFrame(values, columns=["o", "h", "l", "c", "v"], index=index)
+
+
+def bench_concat(history: pd.DataFrame) -> float:
+    candles = {(s, tf): history for s in range(SYMBOLS) for tf in TFS}
+    c_time = history.index[-1].to_pydatetime()
+
+    started = time.perf_counter()
+    for i in range(CLOSES):
+        c_time += timedelta(hours=1)
+        for key in candles:
+            candles[key] = pd.concat([candles[key], candles_to_data_frame([[c_time, 1.0, 2.0, 0.5, 1.5, 10.0]])])
+
+    return time.perf_counter() - started
+
+
+def bench_buffer(history: pd.DataFrame) -> float:
+    candles = {(s, tf): CandlesBuffer.from_frame(history, HISTORY) for s in range(SYMBOLS) for tf in TFS}
+    c_time = history.index[-1].to_pydatetime()
+
+    started = time.perf_counter()
+    for i in range(CLOSES):
+        c_time += timedelta(hours=1)
+        for buffer in candles.values():
+            buffer.append(c_time, 1.0, 2.0, 0.5, 1.5, 10.0)
+
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    history_ = make_history()
+    appends = SYMBOLS * len(TFS) * CLOSES
+
+    for name, bench in [("pd.concat", bench_concat), ("CandlesBuffer", bench_buffer)]:
+        elapsed = bench(history_)
+        print(f"{name:>14}: {appends} appends in {elapsed:.3f}s - {appends / elapsed:,.0f} appends/s")
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from core.db.pg_copy import CANDLES_COPY_COLUMNS, decode_copy, encode_candles_copy
+from core.db.timescaledb import TimesScaleDb
+
+ROWS = 1_000_000
+ROUNDS = 5
+# ranges of the single symbol loads, around the COLUMNAR_MIN_ROWS estimate for 1h candles
+LOAD_DAYS = [1, 10, 30, 120]
+COLUMNS = [name for name, _ in CANDLES_COPY_COLUMNS]
+
+
+def make_candles(rows: int = ROWS) -> pd.DataFrame:
+    index = pd.date_range("2000-01-01", periods=rows, freq="15min", name="timestamp")
+    return pd.DataFrame(np.random.random((rows, 5)), columns=["o", "h", "l", "c", "v"], index=index)
+
+
+def bench_decode(rows: int):
+    candles = make_candles(rows)
+    # Records behave like tuples for pd.DataFrame: one python object per row and per value
+    records = [(t, 1, o, h, l, c, v) for t, (o, h, l, c, v) in zip(candles.index.to_pydatetime(), candles.values)]
+    payload = encode_candles_copy(candles, 1)
+
+    started = time.perf_counter()
+    pd.DataFrame(records, columns=COLUMNS)
+    elapsed = time.perf_counter() - started
+    print(f"decode      records: {rows} rows in {elapsed:.3f}s - {rows / elapsed:,.0f} rows/s")
+
+    started = time.perf_counter()
+    pd.DataFrame(decode_copy(payload, CANDLES_COPY_COLUMNS), columns=COLUMNS)
+    elapsed = time.perf_counter() - started
+    print(f"decode  binary COPY: {rows} rows in {elapsed:.3f}s - {rows / elapsed:,.0f} rows/s")
+
+
+def pin_columnar(db: TimesScaleDb, columnar: bool):
+    # the loads pick the path from their expected size, the benchmark pins it to time both
+    fetch = TimesScaleDb.fetch_as_dataframe
+
+    async def fetch_as_dataframe(sql: str, *args, **kwargs):
+        return await fetch(db, sql, *args, columnar=columnar)
+
+    db.fetch_as_dataframe = fetch_as_dataframe
+
+
+async def bench_loads(host: str, username: str, password: str, symbol: str, tf: str, symbols: int):
+    db = TimesScaleDb(host, username, password)
+    await db.init()
+    many = sorted({s for s, t in db.symbol_tf.keys() if t == tf})[:symbols]
+    end_time = datetime.utcnow()
+    loads = [(f"load_candles {days}d", lambda days=days: db.load_candles(symbol, tf, end_time - timedelta(days=days),
+                                                                          end_time))
+             for days in LOAD_DAYS]
+    loads += [(f"load_candles_many {len(many)}", lambda: db.load_candles_many(many, tf)),
+              ("load_trades", lambda: db.load_trades(symbol))]
+
+    for name, load in loads:
+        for columnar in (False, True):
+            pin_columnar(db, columnar)
+            elapsed = []
+            for _ in range(ROUNDS):
+                started = time.perf_counter()
+                result = await load()
+                elapsed.append(time.perf_counter() - started)
+
+            rows = sum(len(df) for df in result.values()) if isinstance(result, dict) else len(result)
+            path = "binary COPY" if columnar else "records"
+            print(f"{name:>22} {path:>12}: {rows} rows, best of {ROUNDS} {min(elapsed) * 1e3:.1f}ms")
+
+
+
+def main(rows: int, host: Optional[str], username: str, password: str, symbol: str, tf: str, symbols: int):
+    bench_decode(rows)
+    if host is not None:
+        asyncio.run(bench_loads(host, username, password, symbol, tf, symbols))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="load_candles / load_candles_many / load_trades: Records vs binary COPY")
+    parser.add_argument("--rows", type=int, default=ROWS)
+    parser.add_argument("--host", default=None, help="timescaledb host to time the loads as well")
+    parser.add_argument("--username", default="postgres")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--tf", default="15m")
+    parser.add_argument("--symbols", type=int, default=300, help="symbols of the load_candles_many call")
+    args = parser.parse_args()
+    main(args.rows, args.host, args.username, args.password, args.symbol, args.tf, args.symbols)
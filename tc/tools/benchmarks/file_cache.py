@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from core.providers.file_data_provider import FileDataProvider
+
+SYMBOLS = 300
+ROWS = 2000
+TF = "1h"
+
+
+def make_candles(rows: int) -> pd.DataFrame:
+    index = pd.date_range("2023-01-01", periods=rows, freq="1h", name="timestamp")
+    return pd.DataFrame(np.random.random((rows, 5)), columns=["o", "h", "l", "c", "v"], index=index)
+
+
+async def main(symbols: int, rows: int):
+    symbol_names = [f"S{i}USDT" for i in range(symbols)]
+    with tempfile.TemporaryDirectory() as path:
+        provider = FileDataProvider(path)
+        await provider.init()
+        candles = make_candles(rows)
+        started = time.perf_counter()
+        for symbol in symbol_names:
+            await provider.save_candles(symbol, TF, candles)
+        elapsed = time.perf_counter() - started
+        print(f"write: {symbols} x {rows} candles in {elapsed:.3f}s - {symbols * rows / elapsed:,.0f} rows/s")
+
+        # a restarted bot: new provider, nothing in memory
+        provider = FileDataProvider(path)
+        started = time.perf_counter()
+        loaded = await provider.load_candles_many(symbol_names, TF)
+        elapsed = time.perf_counter() - started
+        total = sum(len(df) for df in loaded.values())
+        print(f" read: {total} candles in {elapsed:.3f}s - {total / elapsed:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preload of candles from the local column files")
+    parser.add_argument("--symbols", type=int, default=SYMBOLS)
+    parser.add_argument("--rows", type=int, default=ROWS)
+    args = parser.parse_args()
+    asyncio.run(main(args.symbols, args.rows))
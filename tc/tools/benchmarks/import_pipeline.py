@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from core.utils.data import candles_to_data_frame
+from tools.candles_importer.importer import CandlesImporter, ImportJob
+
+PAGES = 50
+PAGE = 1000
+TF = "1m"
+# latencies of one /klines request and of one COPY, the COPY grows with the rows
+FETCH_LATENCY = 0.05
+WRITE_LATENCY = 0.02
+WRITE_PER_ROW = 0.00003
+
+
+class SimulatedDb:
+    def __init__(self):
+        self.writes = 0
+
+    async def save_candles(self, symbol, tf, candles, replace=False):
+        await asyncio.sleep(WRITE_LATENCY + WRITE_PER_ROW * len(candles))
+        self.writes += 1
+
+
+async def main(pages: int):
+    date_to = datetime(2023, 1, 1)
+    date_from = date_to - timedelta(minutes=pages * PAGE)
+
+    async def load_candles(symbol, tf="1m", start_time=None, end_time=None, job=None):
+        await asyncio.sleep(FETCH_LATENCY)
+        times = [t for t in (start_time + timedelta(minutes=i) for i in range(PAGE)) if t <= end_time]
+        return candles_to_data_frame([[t, 1.0, 2.0, 0.5, 1.5, 1.0] for t in times])
+
+    db = SimulatedDb()
+    importer = CandlesImporter(db)
+    importer._load_candles = load_candles
+    job = ImportJob("BTCUSDT", TF)
+    started = time.perf_counter()
+    await importer.load_gap("BTCUSDT", TF, date_from, date_to, job=job)
+    elapsed = time.perf_counter() - started
+
+    # a write per page before the next fetch took the sum of both
+    serial = job.fetch_time + WRITE_LATENCY * pages + WRITE_PER_ROW * job.candles
+    print(f"{job.candles} candles in {elapsed:.2f}s, {db.writes} writes for {pages} pages")
+    print(f"fetch {job.fetch_time:.2f}s, write {job.write_time:.2f}s, serial ~{serial:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import of one symbol/tf with simulated REST and DB latencies")
+    parser.add_argument("--pages", type=int, default=PAGES)
+    args = parser.parse_args()
+    asyncio.run(main(args.pages))
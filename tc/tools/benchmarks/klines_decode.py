@@ -0,0 +1,52 @@
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+import ujson
+
+from core.utils.data import candles_to_data_frame, klines_to_data_frame
+
+PAGE = 1000
+PAGES = 1000
+ROWS = 1_000_000
+
+
+def make_klines(rows: int, start: int = 1483228800000) -> list:
+    # as the REST response decodes: int times, prices and volumes as strings
+    prices = np.round(16000 + np.random.random((rows, 5)) * 100, 8)
+    tail = ["1.0", 10, "0.5", "0.5", "0"]
+    klines = [[start + i * 60000] + [f"{p:.8f}" for p in row] + [start + i * 60000 + 59999] + tail
+              for i, row in enumerate(prices.tolist())]
+    return ujson.loads(ujson.dumps(klines))
+
+
+def legacy_decode(klines: list):
+    # what the REST loaders did before: a datetime and five float() per row
+    candles = [[datetime.utcfromtimestamp(c[0] / 1e3), float(c[1]), float(c[2]), float(c[3]), float(c[4]),
+                float(c[5])] for c in klines]
+    return candles_to_data_frame(candles)
+
+
+def bench(name: str, pages: list):
+    rows = sum(len(page) for page in pages)
+    for decoder_name, decode in [("row by row", legacy_decode), ("numpy", klines_to_data_frame)]:
+        started = time.perf_counter()
+        for page in pages:
+            decode(page)
+        elapsed = time.perf_counter() - started
+        print(f"{name} {decoder_name:>10}: {rows} rows in {elapsed:.3f}s - {rows / elapsed:,.0f} rows/s")
+
+
+def main(pages: int, rows: int):
+    page = make_klines(PAGE)
+    bench(f"{pages} x {PAGE} pages", [page] * pages)
+    bench(f"{rows} rows at once", [make_klines(rows)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decoding of /klines responses into candles")
+    parser.add_argument("--pages", type=int, default=PAGES)
+    parser.add_argument("--rows", type=int, default=ROWS)
+    args = parser.parse_args()
+    main(args.pages, args.rows)
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+import asyncpg
+import numpy as np
+import pandas as pd
+
+from core.db.pg_copy import CANDLES_COPY_COLUMNS, encode_candles_copy
+
+ROWS = 1_000_000
+SYMBOL_TF_ID = 1
+COLUMNS = [name for name, _ in CANDLES_COPY_COLUMNS]
+BENCH_TABLE = "_bench_candles"
+
+
+def make_candles(rows: int = ROWS) -> pd.DataFrame:
+    index = pd.date_range("2017-01-01", periods=rows, freq="1min", name="timestamp")
+    return pd.DataFrame(np.random.random((rows, 5)), columns=["o", "h", "l", "c", "v"], index=index)
+
+
+def legacy_records(candles: pd.DataFrame):
+    # what save_candles did before: add columns to the frame and build a python tuple per row
+    candles = candles.copy()
+    candles["timestamp"] = candles.index
+    candles["symbol_tf_id"] = SYMBOL_TF_ID
+    return [tuple(x) for x in candles[COLUMNS].values]
+
+
+def bench_encode(candles: pd.DataFrame):
+    for name, encode in [("tuples", legacy_records), ("binary COPY", lambda c: encode_candles_copy(c, SYMBOL_TF_ID))]:
+        started = time.perf_counter()
+        encode(candles)
+        elapsed = time.perf_counter() - started
+        print(f"encode {name:>12}: {len(candles)} rows in {elapsed:.3f}s - {len(candles) / elapsed:,.0f} rows/s")
+
+
+async def bench_copy(candles: pd.DataFrame, dsn: str):
+    conn = await asyncpg.connect(dsn)
+    await conn.execute(f"CREATE TEMPORARY TABLE {BENCH_TABLE} (timestamp TIMESTAMP, symbol_tf_id INTEGER, "
+                       f"o DOUBLE PRECISION, h DOUBLE PRECISION, l DOUBLE PRECISION, c DOUBLE PRECISION, "
+                       f"v DOUBLE PRECISION)")
+
+    async def records():
+        await conn.copy_records_to_table(BENCH_TABLE, records=legacy_records(candles), columns=COLUMNS)
+
+    async def binary():
+        await conn.copy_to_table(BENCH_TABLE, source=memoryview(encode_candles_copy(candles, SYMBOL_TF_ID)),
+                                 columns=COLUMNS, format="binary")
+
+    for name, copy in [("records", records), ("binary COPY", binary)]:
+        await conn.execute(f"TRUNCATE {BENCH_TABLE}")
+        started = time.perf_counter()
+        await copy()
+        elapsed = time.perf_counter() - started
+        print(f"save   {name:>12}: {len(candles)} rows in {elapsed:.3f}s - {len(candles) / elapsed:,.0f} rows/s")
+
+    await conn.close()
+
+
+def main(rows: int, dsn: Optional[str]):
+    candles = make_candles(rows)
+    bench_encode(candles)
+    if dsn is not None:
+        asyncio.run(bench_copy(candles, dsn))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="save_candles: python tuples vs binary COPY")
+    parser.add_argument("--rows", type=int, default=ROWS)
+    parser.add_argument("--dsn", default=None, help="postgres://... to time the COPY itself as well")
+    args = parser.parse_args()
+    main(args.rows, args.dsn)
@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.db.timescaledb import STREAM_CHUNK_SIZE, TimesScaleDb
+from core.ta.clusters import get_clusters_by_tf
+
+ROWS = 1_000_000
+STEP = 10.0
+MIN_PRICE, MAX_PRICE = 15000.0, 25000.0
+TF_SIZE = timedelta(minutes=15)
+COLUMNS = ["timestamp", "symbol_tf_id", "price", "volume", "is_buyer"]
+
+
+def make_rows(start: int, count: int) -> list:
+    # python tuples, as a cursor hands out records; seeded, so both runs see the same trades
+    rng = np.random.default_rng(start)
+    timestamps = pd.date_range(pd.Timestamp("2023-01-01") + pd.Timedelta(milliseconds=100 * start), periods=count,
+                               freq="100ms")
+    prices = 20000 + np.cumsum(rng.normal(0, 1, count))
+    volumes = rng.random(count)
+    return list(zip(timestamps, [1] * count, prices.tolist(), volumes.tolist(), (volumes > 0.5).tolist()))
+
+
+async def synthetic_load(rows: int, chunk_size: int) -> pd.DataFrame:
+    chunks = [make_rows(i, min(chunk_size, rows - i)) for i in range(0, rows, chunk_size)]
+    return pd.DataFrame([r for chunk in chunks for r in chunk], columns=COLUMNS).set_index("timestamp")
+
+
+async def synthetic_iter(rows: int, chunk_size: int) -> AsyncIterator[pd.DataFrame]:
+    for i in range(0, rows, chunk_size):
+        yield pd.DataFrame(make_rows(i, min(chunk_size, rows - i)), columns=COLUMNS).set_index("timestamp")
+
+
+async def one_chunk(trades: pd.DataFrame) -> AsyncIterator[pd.DataFrame]:
+    yield trades
+
+
+def clusters_of(trades_chunks: AsyncIterator[pd.DataFrame]) -> Awaitable[Tuple[Dict, Tuple[float, float]]]:
+    return get_clusters_by_tf(trades_chunks, MIN_PRICE, MAX_PRICE, STEP, TF_SIZE)
+
+
+async def measure(name: str, run: Callable[[], Awaitable[Tuple[Dict, Tuple[float, float]]]]):
+    tracemalloc.start()
+    started = time.perf_counter()
+    clusters, _ = await run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>8}: {len(clusters)} intervals of clusters in {elapsed:.2f}s, peak {peak / 2 ** 20:,.0f} MiB")
+
+
+async def main(rows: int, chunk_size: int, host: Optional[str], user: str, password: str, symbol: str, days: int):
+    if host is None:
+        print(f"synthetic trades: {rows} rows, chunks of {chunk_size}")
+
+        async def load():
+            return await clusters_of(one_chunk(await synthetic_load(rows, chunk_size)))
+
+        async def stream():
+            return await clusters_of(synthetic_iter(rows, chunk_size))
+    else:
+        db = TimesScaleDb(host, user, password)
+        await db.init()
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(days=days)
+        print(f"{symbol} trades of {days} days, chunks of {chunk_size}")
+
+        async def load():
+            return await clusters_of(one_chunk(await db.load_trades(symbol, start_time, end_time)))
+
+        async def stream():
+            return await clusters_of(db.iter_trades(symbol, start_time, end_time, chunk_size))
+
+    await measure("load", load)
+    await measure("stream", stream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory high-water of trade clusters: load_trades vs iter_trades")
+    parser.add_argument("--rows", type=int, default=ROWS, help="synthetic trades, without --host")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE)
+    parser.add_argument("--host", default=None, help="timescaledb host to read real trades")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.chunk_size, args.host, args.user, args.password, args.symbol, args.days))
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+
+import ujson
+
+from core.exchange.binance.public import MAX_TRADES, PublicBinance, side_data_to_float
+from core.exchange.common.candles_buffer import CandlesBuffer
+from core.exchange.common.mappers import binance_to_symbol
+from core.exchange.common.order_book import OrderBook
+from core.types import Symbol, Tf
+
+MESSAGES = 200_000
+SYMBOL = Symbol("BTCUSDT")
+TF = Tf("1m")
+
+# recorded spot stream payloads, one frame each
+SAMPLES = [
+    '{"e":"kline","E":1672515782136,"s":"BTCUSDT","k":{"t":1672515780000,"T":1672515839999,"s":"BTCUSDT",'
+    '"i":"1m","f":100,"L":200,"o":"16500.10","c":"16510.20","h":"16512.00","l":"16499.90","v":"12.345",'
+    '"n":100,"x":false,"q":"203850.1","V":"6.1","Q":"100750.2","B":"0"}}',
+    '{"e":"trade","E":1672515782136,"s":"BTCUSDT","t":12345,"p":"16510.20","q":"0.015","b":88,"a":50,'
+    '"T":1672515782136,"m":true,"M":true}',
+    '{"e":"aggTrade","E":1672515782136,"s":"BTCUSDT","a":12345,"p":"16510.30","q":"0.100","f":100,"l":105,'
+    '"T":1672515782136,"m":false,"M":true}',
+    '{"e":"depthUpdate","E":1672515782136,"s":"BTCUSDT","U":157,"u":160,'
+    '"b":[["16510.10","0.5"],["16509.00","1.2"]],"a":[["16510.30","0.1"],["16512.00","0.0"]]}',
+    '[{"e":"24hrMiniTicker","E":1672515782136,"s":"BTCUSDT","c":"16510.20","o":"16400.00","h":"16600.00",'
+    '"l":"16300.00","v":"1000.0","q":"16500000.0"}]',
+]
+
+
+async def legacy_on_message(exchange: PublicBinance, msg):
+    # the if/elif chain ws_on_message used before the dispatch table
+    if isinstance(msg, list):
+        if exchange.on_all_price_callback is not None:
+            exchange.on_all_price_callback(msg)
+        return
+
+    if "result" in msg:
+        return
+
+    channel = msg["e"]
+    symbol = binance_to_symbol(msg["s"])
+
+    if channel in ["trade", "aggTrade"]:
+        item = (float(msg["p"]), float(msg["q"]), msg["m"])
+        exchange.trades[symbol].append(item)
+        exchange.trades[symbol] = list(exchange.trades[symbol])[-MAX_TRADES:]
+    elif channel == "depthUpdate":
+        exchange.order_books[symbol].update_sides(side_data_to_float(msg["b"]), side_data_to_float(msg["a"]))
+    elif channel == "kline":
+        tf = Tf(msg["k"]["i"])
+        if (symbol, tf) in exchange.candles_pending:
+            exchange.candles_pending[(symbol, tf)].append(msg)
+            return
+
+        await exchange.on_kline_message(msg, symbol)
+
+
+async def legacy_read(exchange: PublicBinance, frame: str):
+    for line in str(frame).splitlines():
+        await legacy_on_message(exchange, ujson.loads(line))
+
+
+async def dispatch_read(exchange: PublicBinance, frame: str):
+    await exchange.ws_on_message(ujson.loads(frame))
+
+
+def make_exchange() -> PublicBinance:
+    async def on_candle(symbol, tf, closed, item, close_time):
+        pass
+
+    exchange = PublicBinance(on_candle_callback=on_candle, on__all_price_callback=lambda msg: None)
+    exchange.candles[SYMBOL] = {TF: CandlesBuffer(1000)}
+    exchange.candles[SYMBOL][TF].append(datetime(2023, 1, 1), 1.0, 1.0, 1.0, 1.0, 1.0)
+    exchange.candle_unclosed[SYMBOL] = {TF: None}
+    exchange.order_books[SYMBOL] = OrderBook()
+    exchange.trades[SYMBOL] = deque(maxlen=MAX_TRADES)
+    return exchange
+
+
+async def bench(read, frames) -> float:
+    exchange = make_exchange()
+
+    started = time.perf_counter()
+    for frame in frames:
+        await read(exchange, frame)
+
+    return time.perf_counter() - started
+
+
+async def main():
+    frames = [SAMPLES[i % len(SAMPLES)] for i in range(MESSAGES)]
+    for name, read in [("if/elif chain", legacy_read), ("dispatch table", dispatch_read)]:
+        elapsed = await bench(read, frames)
+        print(f"{name:>14}: {MESSAGES} msgs in {elapsed:.3f}s - {MESSAGES / elapsed:,.0f} msgs/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,21 @@
-from tools.candles_importer.importer import CandlesImporter
+from config import Config
+from core.db import TimesScaleDb
+from tools.candles_importer.importer import CandlesImporter, CANDLES_TIMEFRAMES
+from tools.candles_importer.archive import ArchiveImporter, IMPORT_ARCHIVE_PATH
 import logging
 import asyncio
 
 if __name__ == "__main__":
     logging.getLogger().setLevel(logging.INFO)
 
-    ce = CandlesImporter()
+    config = Config.load_from_env()
+    ce = CandlesImporter(TimesScaleDb(**config.get_timescale_db_params()))
 
     async def main():
         await ce.init()
+        if IMPORT_ARCHIVE_PATH:
+            # the bulk of the history from the archive files, REST only fills the gaps left after them
+            await ArchiveImporter(ce.db, IMPORT_ARCHIVE_PATH).import_all(ce.exportable_symbols, CANDLES_TIMEFRAMES)
         await ce.import_all()
 
     asyncio.run(main())
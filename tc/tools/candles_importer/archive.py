@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.base import CoreBase
+from core.db import TimesScaleDb
+from core.types import SymbolStr, Tf
+from core.utils.logs import add_traceback
+from tools.candles_importer.importer import CandlesWriter
+
+# a local copy of https://data.binance.vision spot klines: <SYMBOL>-<tf>-<YYYY>-<MM>[-<DD>].zip (+ .zip.CHECKSUM)
+IMPORT_ARCHIVE_PATH = os.getenv("IMPORT_ARCHIVE_PATH", None)
+ARCHIVE_CHUNK_ROWS = 200_000
+MANIFEST_NAME = "import_manifest.json"
+ARCHIVE_NAME = re.compile(r"^(?P<symbol>[A-Z0-9]+)-(?P<tf>\d+[mhd])-(?P<period>\d{4}-\d{2}(-\d{2})?)\.zip$")
+# open times are milliseconds, microseconds in the spot files since 2025
+MICROSECONDS_FROM = 10 ** 14
+KLINE_COLUMNS = ["timestamp", "o", "h", "l", "c", "v"]
+KLINE_DTYPES = {"timestamp": np.int64, "o": np.float64, "h": np.float64, "l": np.float64, "c": np.float64,
+                "v": np.float64}
+
+
+class KlineArchive(object):
+    def __init__(self, path: str, symbol: SymbolStr, tf: Tf, period: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.symbol = symbol
+        self.tf = tf
+        self.period = period
+
+    @property
+    def checksum_path(self) -> str:
+        return f"{self.path}.CHECKSUM"
+
+    def __str__(self):
+        return self.name
+
+
+def find_archives(path: str) -> List[KlineArchive]:
+    # flat or the data.binance.vision tree (spot/monthly/klines/<SYMBOL>/<tf>/...), monthly before daily files
+    archives = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            match = ARCHIVE_NAME.match(name)
+            if match is not None:
+                archives.append(KlineArchive(os.path.join(root, name), SymbolStr(match["symbol"]), Tf(match["tf"]),
+                                             match["period"]))
+
+    return sorted(archives, key=lambda a: (a.symbol, a.tf, a.period))
+
+
+def file_sha256(path: str, block_size: int = 2 ** 20) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+def read_checksum(archive: KlineArchive) -> Optional[str]:
+    # "<sha256>  <file name>"
+    if not os.path.exists(archive.checksum_path):
+        return None
+
+    with open(archive.checksum_path) as f:
+        return f.read().split()[0].lower()
+
+
+def to_candles(chunk: pd.DataFrame) -> pd.DataFrame:
+    timestamps = chunk["timestamp"].to_numpy(dtype=np.int64)
+    ns = np.where(timestamps >= MICROSECONDS_FROM, timestamps * 1_000, timestamps * 1_000_000)
+    index = pd.DatetimeIndex(ns.view("datetime64[ns]"), name="timestamp")
+    return pd.DataFrame({name: chunk[name].to_numpy() for name in KLINE_COLUMNS[1:]}, index=index)
+
+
+def iter_archive_candles(path: str, chunk_rows: int = ARCHIVE_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Candles of a kline archive in frames of up to `chunk_rows`, decompressed and parsed as the CSV is read.
+    Only the open time and OHLCV columns are parsed, a header row (futures files) is skipped.
+    """
+    with zipfile.ZipFile(path) as zf:
+        for member in zf.namelist():
+            if not member.endswith(".csv"):
+                continue
+
+            with zf.open(member) as raw:
+                header = None if raw.peek(1)[:1].isdigit() else 0
+                chunks = pd.read_csv(raw, header=header, names=KLINE_COLUMNS, usecols=range(len(KLINE_COLUMNS)),
+                                     dtype=KLINE_DTYPES, chunksize=chunk_rows)
+                for chunk in chunks:
+                    yield to_candles(chunk)
+
+
+class ArchiveImporter(object):
+    """
+    Bulk import of kline archives from a local directory, written with binary COPY (ON CONFLICT DO NOTHING).
+    Imported files are recorded in a manifest with their sha256: re-runs skip them, changed files are imported again
+    and overwrite the stored candles (ON CONFLICT DO UPDATE).
+    The REST importer then only tops up what comes after the archives.
+    """
+
+    def __init__(self, db: TimesScaleDb, path: str, require_checksum: bool = True,
+                 chunk_rows: int = ARCHIVE_CHUNK_ROWS):
+        self.db = db
+        self.path = path
+        self.require_checksum = require_checksum
+        self.chunk_rows = chunk_rows
+        self.manifest_path = os.path.join(path, MANIFEST_NAME)
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+
+    def load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def save_manifest(self):
+        # replaced at once, an interrupted run leaves the previous manifest
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def manifest_key(self, archive: KlineArchive) -> str:
+        # the spot and futures trees hold files of the same name
+        return os.path.relpath(archive.path, self.path)
+
+    def verify(self, archive: KlineArchive) -> Optional[str]:
+        """
+        sha256 of the archive, None if it doesn't match its .CHECKSUM file or that is missing but required.
+        """
+        sha256 = file_sha256(archive.path)
+        expected = read_checksum(archive)
+        if expected is None and self.require_checksum:
+            logging.error(f"Archive {archive}: no checksum file, skipped")
+            return None
+        if expected is not None and expected != sha256:
+            logging.error(f"Archive {archive}: checksum mismatch {sha256} != {expected}, skipped")
+            return None
+
+        return sha256
+
+    async def import_archive(self, archive: KlineArchive, sha256: str) -> int:
+        # a file imported before has changed: its corrected candles replace the stored ones
+        replace = self.manifest_key(archive) in self.manifest
+        writer = CandlesWriter(self.db, archive.symbol, archive.tf, batch_size=self.chunk_rows, replace=replace)
+        chunks = iter_archive_candles(archive.path, self.chunk_rows)
+        rows = 0
+        first, last = None, None
+        try:
+            while writer.error is None:
+                # parsed off the loop, the previous chunk is written meanwhile
+                candles = await CoreBase.get_loop().run_in_executor(None, next, chunks, None)
+                if candles is None:
+                    break
+
+                await writer.put(candles)
+                rows += len(candles)
+                first = first if first is not None else candles.index[0]
+                last = candles.index[-1]
+        finally:
+            chunks.close()
+            await writer.close()
+
+        # recorded only once all of its rows are written
+        self.manifest[self.manifest_key(archive)] = dict(sha256=sha256, rows=rows, first=str(first), last=str(last),
+                                           imported=str(datetime.utcnow()))
+        self.save_manifest()
+        return rows
+
+    async def import_all(self, symbols: Optional[List[SymbolStr]] = None,
+                         tfs: Optional[List[Tf]] = None) -> Dict[str, int]:
+        self.load_manifest()
+        stats = dict(imported=0, skipped=0, failed=0, rows=0)
+        for archive in find_archives(self.path):
+            if (symbols is not None and archive.symbol not in symbols) or (tfs is not None and archive.tf not in tfs):
+                continue
+
+            sha256 = await CoreBase.get_loop().run_in_executor(None, self.verify, archive)
+            if sha256 is None:
+                stats["failed"] += 1
+                continue
+            if self.manifest.get(self.manifest_key(archive), {}).get("sha256") == sha256:
+                stats["skipped"] += 1
+                continue
+
+            try:
+                rows = await self.import_archive(archive, sha256)
+            except Exception as e:
+                stats["failed"] += 1
+                logging.error(f"Archive {archive} import failed: {add_traceback(e)}")
+                continue
+
+            stats["imported"] += 1
+            stats["rows"] += rows
+            logging.info(f"Archive {archive}: {rows} candles imported")
+
+        logging.info(f"Archives of {self.path}: {stats}")
+        return stats
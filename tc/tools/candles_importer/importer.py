@@ -3,10 +3,13 @@ from core.exchange.binance import PublicBinance, PublicFuturesBinance
 from core.base import CoreBase
 from core.types import RestMethod, Symbol, Tf, SymbolStr
 from typing import Dict, List, Any, Tuple, Optional
-from core.utils.data import candles_to_data_frame
+from core.utils.data import klines_to_data_frame
 from core.utils.utils import string_to_date, get_cluster_size
+from core.utils.logs import add_traceback
 from core.utils.timeframe import tf_size_minutes, round_time_to_tf, get_time_shift
+from core.utils.resample import get_derived_tfs, resample_candles
 from core.db import TimesScaleDb
+from config import Config
 from core.exchange.common.mappers import symbol_to_binance, binance_to_symbol
 
 from core.exchange.binance.common import get_filter_value
@@ -15,6 +18,8 @@ import os
 import logging
 import asyncio
 import sys
+import time
+import pandas as pd
 
 BASE_URI = "https://api.binance.com/api/v3"
 BASE_FUTURES_URI = "https://api.binance.com/api/v3"
@@ -22,22 +27,167 @@ MAX_CANDLES = os.getenv("MAX_CANDLES", 1000)
 CANDLES_TIMEFRAMES = os.getenv("CANDLES_TIMEFRAMES", "1d,4h,1h,15m").split(",")
 IMPORT_DATE_FROM = os.getenv("IMPORT_DATE_FROM", "01-01-2017")
 IMPORT_DATE_TO = os.getenv("IMPORT_DATE_TO", None)
+# tfs which are multiples of it are built from its stored candles instead of being loaded from REST
+IMPORT_BASE_TF = os.getenv("IMPORT_BASE_TF", None)
+# concurrent symbol/tf jobs of import_all, they share the weight limiter and the DB pool
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 1))
+PROGRESS_INTERVAL = 30
+# fetched pages waiting for the writer, the fetcher waits once that many are queued
+IMPORT_QUEUE_PAGES = int(os.getenv("IMPORT_QUEUE_PAGES", 8))
+# queued pages are written together up to that many candles
+IMPORT_WRITE_BATCH = int(os.getenv("IMPORT_WRITE_BATCH", 20_000))
+# only report the missing candles, nothing is imported
+IMPORT_DRY_RUN = os.getenv("IMPORT_DRY_RUN", "0") == "1"
+
+TimeRange = Tuple[datetime, datetime]
+Gaps = Dict[Tf, Dict[SymbolStr, List[TimeRange]]]
 
 
 # IMPORTER_INFLUX_DB_HOST = os.getenv("IMPORTER_INFLUX_DB_HOST", "5.75.137.107")
 
 
+def count_missing(gaps: List[TimeRange], tf: Tf) -> int:
+    step = timedelta(minutes=tf_size_minutes(tf))
+    return sum((gap_to - gap_from) // step for gap_from, gap_to in gaps)
+
+
+def gaps_report(gaps: Gaps) -> pd.DataFrame:
+    """
+    Holes per symbol and tf: their count, the missing candles and the range they span.
+    History before the first available candle of a symbol is left out once the importer has recorded it.
+    """
+    rows = [
+        [symbol, tf, len(symbol_gaps), count_missing(symbol_gaps, tf), symbol_gaps[0][0], symbol_gaps[-1][1]]
+        for tf, tf_gaps in gaps.items() for symbol, symbol_gaps in tf_gaps.items() if len(symbol_gaps) > 0
+    ]
+    return pd.DataFrame(rows, columns=["symbol", "tf", "gaps", "missing", "first", "last"])
+
+
+class ImportJob(object):
+    def __init__(self, symbol: Symbol, tf: Tf, gaps: Optional[List[TimeRange]] = None,
+                 start: Optional[datetime] = None):
+        self.symbol = symbol
+        self.tf = tf
+        self.gaps = gaps or []
+        # the first expected candle; when the exchange has nothing from there, where it starts
+        self.start = start
+        self.first_available: Optional[datetime] = None
+        self.candles = 0
+        self.weight = 0
+        self.fetch_time = 0.0
+        self.write_time = 0.0
+        self.started = 0.0
+        self.finished = 0.0
+        self.error: Optional[Exception] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started if self.started else 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.candles / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"{symbol_to_binance(self.symbol)}_{self.tf}: {self.candles} candles in {self.elapsed:.1f}s " \
+               f"({self.rate:.0f} candles/s), weight {self.weight}, " \
+               f"fetch {self.fetch_time:.1f}s, write {self.write_time:.1f}s"
+
+
+class ImportProgress(object):
+    def __init__(self, jobs: List[ImportJob], weight_total: int):
+        self.jobs = jobs
+        self.started = time.monotonic()
+        self.weight_start = weight_total
+
+    def report(self, weight_total: int) -> str:
+        done = [j for j in self.jobs if j.finished]
+        running = [j for j in self.jobs if j.started and not j.finished]
+        candles = sum(j.candles for j in self.jobs)
+        elapsed = time.monotonic() - self.started
+        weight = weight_total - self.weight_start
+        return f"Import {len(done)}/{len(self.jobs)} jobs ({len(running)} running, " \
+               f"{sum(1 for j in done if j.error is not None)} failed): {candles} candles in {elapsed:.0f}s " \
+               f"({candles / max(elapsed, 1e-9):.0f} candles/s), weight {weight} " \
+               f"({weight * 60 / max(elapsed, 1e-9):.0f}/min)"
+
+
+class CandlesWriter(object):
+    """
+    Writes the pages of one symbol/tf while the next ones are fetched. Pages wait in a bounded queue,
+    whatever is queued is coalesced into one `save_candles` (one COPY) of up to `batch_size` candles.
+    After a failed write the remaining pages are dropped and `close` raises the error.
+    With `replace` stored candles are overwritten, otherwise they are kept.
+    """
+
+    def __init__(self, db: TimesScaleDb, symbol_str: SymbolStr, tf: Tf, job: Optional[ImportJob] = None,
+                 queue_pages: int = IMPORT_QUEUE_PAGES, batch_size: int = IMPORT_WRITE_BATCH, replace: bool = False):
+        self.db = db
+        self.symbol_str = symbol_str
+        self.tf = tf
+        self.job = job
+        self.replace = replace
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_pages)
+        self.error: Optional[Exception] = None
+        self.batches = 0
+        self.task = CoreBase.get_loop().create_task(self.run())
+
+    async def put(self, candles: pd.DataFrame):
+        await self.queue.put(candles)
+
+    async def run(self):
+        closed = False
+        while not closed:
+            pages = [await self.queue.get()]
+            size = len(pages[0]) if pages[0] is not None else 0
+            while size < self.batch_size and not self.queue.empty():
+                pages.append(self.queue.get_nowait())
+                size += len(pages[-1]) if pages[-1] is not None else 0
+
+            closed = pages[-1] is None
+            pages = [page for page in pages if page is not None]
+            if len(pages) == 0 or self.error is not None:
+                continue
+
+            try:
+                await self.write(pd.concat(pages).sort_index() if len(pages) > 1 else pages[0])
+            except Exception as e:
+                # keeps taking the pages, the fetcher must not wait on a full queue
+                self.error = e
+
+    async def write(self, candles: pd.DataFrame):
+        started = time.monotonic()
+        await self.db.save_candles(self.symbol_str, self.tf, candles, replace=self.replace, bulk=True)
+        self.batches += 1
+        if self.job is not None:
+            self.job.write_time += time.monotonic() - started
+            self.job.candles += len(candles)
+
+    async def close(self):
+        await self.queue.put(None)
+        await self.task
+        if self.error is not None:
+            raise self.error
+
+
 class CandlesImporter(object):
     request_limiter = BinanceRequestLimiter()
     last_url_response = None
     db: TimesScaleDb = None
 
-    def __init__(self, db: TimesScaleDb, date_from: Optional[str] = None, date_to: Optional[str] = None):
+    def __init__(self, db: TimesScaleDb, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 base_tf: Optional[Tf] = IMPORT_BASE_TF):
         self.spot_symbols: List[SymbolStr] = []
         self.exportable_symbols: List[SymbolStr] = []
         self.db = db
         self.date_from = None
         self.date_to = None
+        self.base_tf = base_tf
+        # missing candles per tf and symbol, only those are imported
+        self.gaps: Gaps = {}
+        # the first candle on the exchange per symbol, nothing is expected before it
+        self.first_available: Dict[SymbolStr, datetime] = {}
 
     async def init(self):
         # await self.db.init()
@@ -83,21 +233,54 @@ class CandlesImporter(object):
             headers: Dict = {},
             base_url: str = BASE_URI,
     ) -> Any:
-        await self.request_limiter.delay(self.last_url_response)
+        await self.request_limiter.acquire(self.request_limiter.get_weight(url, params))
 
         content, _ = await CoreBase.get_request().request_json(f"{base_url}{url}", method,
                                                                params=params, headers=headers)
         self.last_url_response = _
+        self.request_limiter.update(_)
         if _.status != 200:
             logging.error(f"{_.url} {_.reason}")
         return content
 
+    def get_gaps_range(self, tf: Tf, date_from: Optional[datetime] = None) -> TimeRange:
+        # open times of the expected candles: from the first one at date_from, the unclosed one is excluded
+        step = timedelta(minutes=tf_size_minutes(tf))
+        date_from = date_from or self.date_from or datetime.strptime("01-01-2017", '%d-%m-%Y')
+        start_time = round_time_to_tf(date_from, tf)
+        if start_time < date_from:
+            start_time += step
+
+        return start_time, round_time_to_tf(self.date_to or datetime.utcnow(), tf)
+
+    def get_symbol_start(self, symbol_str: SymbolStr, tf: Tf, date_from: Optional[datetime] = None) -> datetime:
+        # the first expected candle of a symbol: the one of its first available candle when that is later
+        start_time, _ = self.get_gaps_range(tf, date_from)
+        first_available = self.first_available.get(symbol_str, None)
+        return max(start_time, round_time_to_tf(first_available, tf)) if first_available is not None else start_time
+
+    async def load_gaps(self, symbols: List[SymbolStr], tf: Tf,
+                        date_from: Optional[datetime] = None) -> Dict[SymbolStr, List[TimeRange]]:
+        # the holes of every symbol in one query, instead of a query per symbol
+        start_time, end_time = self.get_gaps_range(tf, date_from)
+        gaps = await self.db.load_candle_gaps(symbols, tf, start_time, end_time)
+
+        # nothing is missing before the listing of a symbol
+        for symbol_str, symbol_gaps in gaps.items():
+            symbol_start = self.get_symbol_start(symbol_str, tf, date_from)
+            if symbol_start > start_time:
+                gaps[symbol_str] = [(max(gap_from, symbol_start), gap_to) for gap_from, gap_to in symbol_gaps
+                                    if gap_to > symbol_start]
+
+        return gaps
+
     async def _load_candles(
             self,
             symbol: Symbol,
             tf: Tf = "1m",
             start_time: Optional[datetime] = None,
             end_time: Optional[datetime] = None,
+            job: Optional[ImportJob] = None,
     ):
 
         params = {"symbol": f"{symbol_to_binance(symbol)}", "interval": tf, "limit": MAX_CANDLES}
@@ -111,21 +294,10 @@ class CandlesImporter(object):
             params["endTime"] = int(int(end_time.replace(tzinfo=timezone.utc).timestamp()) * 1e3)
 
         content = await self.request_url(f"/klines", RestMethod.GET, params=params)
+        if job is not None:
+            job.weight += self.request_limiter.get_weight("/klines", params)
 
-        candles = [
-            [
-                datetime.utcfromtimestamp(c[0] / 1e3),
-                float(c[1]),
-                float(c[2]),
-                float(c[3]),
-                float(c[4]),
-                float(c[5]),
-            ]
-            for c in content
-        ]
-
-        return candles_to_data_frame(candles)
-        # return candles
+        return klines_to_data_frame(content)
 
     async def load_candles(
             self,
@@ -133,80 +305,187 @@ class CandlesImporter(object):
             tf: Tf = "1m",
             start_time: Optional[datetime] = None,
             end_time: Optional[datetime] = None,
+            job: Optional[ImportJob] = None,
     ):
-        candle_size_minutes = tf_size_minutes(tf)
-
-        async def load_candles_with_cache(from_time, to_time):
-            if (to_time - from_time) <= timedelta(minutes=candle_size_minutes):  # *2
-                return candles_to_data_frame([])
-
-            candles_batch = await self._load_candles(symbol, tf, from_time, to_time)
-            if len(candles_batch) == 0:
-                return candles_to_data_frame([])
-
-            await self.db.save_candles(symbol_to_binance(symbol), tf, candles_batch)
-            return candles_batch
-
-        end_time = round_time_to_tf(
-            end_time or datetime.utcnow(), tf
-        ) - timedelta(minutes=1)  # exclude LAST CANDLE
-
-        # end_time = end_time or datetime.utcnow()
-        start_time = start_time or get_time_shift(end_time, candle_size_minutes)
-
-        logging.info(f"Import candles: {symbol}_{tf} - {start_time} - {end_time}.")
-
-        start_time_ = get_time_shift(end_time, candle_size_minutes)
-
-        candles = await load_candles_with_cache(start_time_, end_time)
-
-        while len(candles) > 0 and candles.index[0] - timedelta(minutes=1) > start_time_:
-            end_time = candles.index[0] - timedelta(minutes=1)
-            start_time_ = get_time_shift(end_time, candle_size_minutes)
-
-            candles = await load_candles_with_cache(start_time_, end_time)
-
-        logging.info(f"Import candles: {symbol}_{tf} DONE.")
-
-    async def import_symbol(self, symbol: Symbol, date_from: Optional[datetime]=None,
-                            tfs: List[Tf]=CANDLES_TIMEFRAMES):
+        """
+        Candles of [start_time, end_time) that are not stored yet, the unclosed one excluded: only the holes
+        found by `load_candle_gaps` are fetched. Without start_time the last MAX_CANDLES are expected.
+        """
         symbol_str = symbol_to_binance(symbol)
-        start_import = datetime.utcnow()
-
-        for tf in tfs:
-            d_from = date_from
-            if d_from is None:
-                d_from = (await self.db.get_symbol_status(symbol=symbol_str))["last_sync"]
-                if d_from is None:
-                    d_from = datetime.strptime("01-01-2017", '%d-%m-%Y')
-
-            await self.load_candles(symbol, Tf(tf), d_from, self.date_to)
+        gap_end = round_time_to_tf(end_time or datetime.utcnow(), tf)
+        gap_start, _ = self.get_gaps_range(tf, start_time or get_time_shift(gap_end, tf_size_minutes(tf)))
+        gaps = (await self.db.load_candle_gaps([symbol_str], tf, gap_start, gap_end))[symbol_str]
+
+        logging.info(f"Import candles: {symbol}_{tf} - {gap_start} - {gap_end}, {len(gaps)} gaps.")
+        for gap_from, gap_to in gaps:
+            await self.load_gap(symbol, tf, gap_from, gap_to, job=job)
+
+    async def load_gap(self, symbol: Symbol, tf: Tf, gap_from: datetime, gap_to: datetime,
+                       job: Optional[ImportJob] = None) -> Optional[datetime]:
+        """
+        Candles of [gap_from, gap_to), paginated forwards from the first missing one. An empty page ends it:
+        the exchange has nothing there (before the listing, an outage).
+        Returns the open time of the first candle found in the gap, None if there was none.
+        """
+        step = timedelta(minutes=tf_size_minutes(tf))
+        writer = CandlesWriter(self.db, symbol_to_binance(symbol), tf, job)
+        start_time = gap_from
+        first = None
+        try:
+            while start_time < gap_to and writer.error is None:
+                started = time.monotonic()
+                # endTime is inclusive
+                candles = await self._load_candles(symbol, tf, start_time, gap_to - timedelta(seconds=1), job=job)
+                if job is not None:
+                    job.fetch_time += time.monotonic() - started
+                candles = candles[candles.index < gap_to]
+                if len(candles) == 0:
+                    break
+
+                await writer.put(candles)
+                first = first or candles.index[0].to_pydatetime()
+                start_time = candles.index[-1].to_pydatetime() + step
+        finally:
+            await writer.close()
+
+        if start_time < gap_to:
+            logging.info(f"Import gap: {symbol}_{tf} nothing on the exchange from {start_time} to {gap_to}.")
+
+        return first
+
+    async def derive_candles(self, symbol_str: SymbolStr, tf: Tf, start_time: datetime,
+                             end_time: Optional[datetime] = None):
+        start_time = round_time_to_tf(start_time, tf)
+        base_candles = await self.db.load_candles(symbol_str, self.base_tf, start_time, end_time)
+        candles = resample_candles(base_candles, tf, self.base_tf)
+        logging.info(f"Derive candles: {symbol_str}_{tf} from {len(base_candles)} {self.base_tf} - {start_time}.")
+        await self.db.save_candles(symbol_str, tf, candles, bulk=True)
+
+    def split_tfs(self, tfs: List[Tf]) -> Tuple[List[Tf], List[Tf]]:
+        # (loaded from REST, built from base_tf), the base tf is loaded first
+        derived = get_derived_tfs(self.base_tf, tfs) if self.base_tf is not None else []
+        if len(derived) == 0:
+            return list(tfs), []
+
+        loaded = [self.base_tf] + [tf for tf in tfs if tf not in derived and tf != self.base_tf]
+        return loaded, derived
+
+    async def import_job(self, job: ImportJob):
+        job.started = time.monotonic()
+        try:
+            for gap_from, gap_to in job.gaps:
+                first = await self.load_gap(job.symbol, job.tf, gap_from, gap_to, job=job)
+                if gap_from == job.start and first != gap_from:
+                    # the exchange starts later: at the first candle found or at the stored ones after the gap
+                    job.first_available = first or gap_to
+        except Exception as e:
+            job.error = e
+            logging.error(f"Import {job} failed: {add_traceback(e)}")
+        finally:
+            job.finished = time.monotonic()
+
+        if job.error is None:
+            logging.info(f"Imported {job}")
+
+    async def finish_symbol(self, symbol: Symbol, derived: List[Tf], gaps: Gaps, start_import: datetime,
+                            jobs: List[ImportJob]):
+        symbol_str = symbol_to_binance(symbol)
+        for tf in derived:
+            for gap_from, gap_to in gaps[tf].get(symbol_str, []):
+                await self.derive_candles(symbol_str, tf, gap_from, gap_to)
 
         await self.db.update_symbol_status_one_value(symbol_str, last_sync=start_import)
 
+        # the latest one: a coarser tf has its first candle before the listing time
+        first_available = max([j.first_available for j in jobs if j.first_available is not None]
+                              + [self.first_available.get(symbol_str, datetime.min)])
+        if first_available != self.first_available.get(symbol_str, datetime.min):
+            self.first_available[symbol_str] = first_available
+            await self.db.update_symbol_status_one_value(symbol_str, first_available=first_available)
+
     async def import_symbol(self, symbol: Symbol, date_from: Optional[datetime] = None,
                             tfs: List[Tf] = CANDLES_TIMEFRAMES):
         symbol_str = symbol_to_binance(symbol)
         start_import = datetime.utcnow()
-
-        for tf in tfs:
-            d_from = date_from
-            if d_from is None:
-                d_from = (await self.db.get_symbol_status(symbol=symbol_str))["last_sync"]
-                if d_from is None:
-                    d_from = datetime.strptime("01-01-2017", '%d-%m-%Y')
-
-            await self.load_candles(symbol, Tf(tf), d_from, self.date_to)
-
-        await self.db.update_symbol_status_one_value(symbol_str, last_sync=start_import)
-
-    async def import_all(self):
-        total = len(self.exportable_symbols)
-        for i, symbol in enumerate(self.exportable_symbols):
-            await self.import_symbol(binance_to_symbol(symbol), self.date_from)
-            logging.info(f"Imported of {symbol} ({i}/{total}) DONE.")
-
+        loaded, derived = self.split_tfs([Tf(tf) for tf in tfs])
+        # the whole history is scanned (from date_from or its first available candle), not from last_sync:
+        # holes anywhere before it are found too, last_sync is only bookkeeping
+        self.first_available.update(await self.db.load_first_available([symbol_str]))
+        gaps = {tf: await self.load_gaps([symbol_str], tf, date_from) for tf in loaded + derived}
+
+        jobs = [ImportJob(symbol, tf, gaps[tf][symbol_str], self.get_symbol_start(symbol_str, tf, date_from))
+                for tf in loaded]
+        for job in jobs:
+            await self.import_job(job)
+            if job.error is not None:
+                raise job.error
+
+        await self.finish_symbol(symbol, derived, gaps, start_import, jobs)
+
+    async def find_gaps(self, tfs: List[Tf]) -> Gaps:
+        self.first_available = await self.db.load_first_available(self.exportable_symbols)
+        gaps = {tf: await self.load_gaps(self.exportable_symbols, tf) for tf in tfs}
+        report = gaps_report(gaps)
+        logging.info(f"Missing {report['missing'].sum()} candles in {report['gaps'].sum()} gaps "
+                     f"from {self.date_from} to {self.date_to}:\n{report.to_string()}")
+        return gaps
+
+    async def import_all(self, workers: int = IMPORT_WORKERS,
+                         dry_run: bool = IMPORT_DRY_RUN) -> Optional[ImportProgress]:
+        loaded, derived = self.split_tfs([Tf(tf) for tf in CANDLES_TIMEFRAMES])
+        self.gaps = await self.find_gaps(loaded + derived)
+        if dry_run:
+            return None
+
+        progress = await self.import_gaps(max(workers, 1), loaded, derived)
         logging.info(f"Imported  ALL from {self.date_from} to {self.date_to}")
+        return progress
+
+    async def import_gaps(self, workers: int, loaded: List[Tf], derived: List[Tf]) -> ImportProgress:
+        """
+        The gaps of `self.gaps` as symbol/tf jobs, `workers` at a time (in order with one worker).
+        The REST weight is shared through the class wide request limiter, the DB writes through the DB pool.
+        A symbol is finished (derived tfs, last_sync) once all its jobs are done.
+        """
+        start_import = datetime.utcnow()
+        symbols = [binance_to_symbol(s) for s in self.exportable_symbols]
+        jobs = {
+            symbol: [ImportJob(symbol, tf, self.gaps[tf].get(symbol_to_binance(symbol), []),
+                               self.get_symbol_start(symbol_to_binance(symbol), tf)) for tf in loaded]
+            for symbol in symbols
+        }
+        queue: asyncio.Queue = asyncio.Queue()
+        for symbol in symbols:
+            for job in jobs[symbol]:
+                queue.put_nowait(job)
+
+        progress = ImportProgress([j for symbol in symbols for j in jobs[symbol]], self.request_limiter.weight_total)
+
+        async def worker():
+            while not queue.empty():
+                job = queue.get_nowait()
+                await self.import_job(job)
+
+                symbol_jobs = jobs[job.symbol]
+                if all(j.finished for j in symbol_jobs) and all(j.error is None for j in symbol_jobs):
+                    try:
+                        await self.finish_symbol(job.symbol, derived, self.gaps, start_import, symbol_jobs)
+                    except Exception as e:
+                        logging.error(f"Finish import of {job.symbol} failed: {add_traceback(e)}")
+
+        async def report():
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                logging.info(progress.report(self.request_limiter.weight_total))
+
+        reporter = CoreBase.get_loop().create_task(report())
+        try:
+            await asyncio.gather(*[worker() for _ in range(workers)])
+        finally:
+            reporter.cancel()
+            logging.info(progress.report(self.request_limiter.weight_total))
+
+        return progress
 
 
 async def get_symbol_names():
@@ -241,7 +520,8 @@ async def update_cluster_size():
 if __name__ == "__main__":
     logging.getLogger().setLevel(logging.INFO)
 
-    ce = CandlesImporter()
+    config = Config.load_from_env()
+    ce = CandlesImporter(TimesScaleDb(**config.get_timescale_db_params()))
 
     async def main():
         # 2022-11-17 18:03:12.994060
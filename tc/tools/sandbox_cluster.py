@@ -24,17 +24,16 @@ date_from = date_to - timedelta(minutes=tf_size_minutes(tf)*4*10)
 async def main():
     try:
         await db.init()
-        trades = await db.load_trades(symbol=symbol, start_time=date_from, end_time=date_to)
         params = (tf, date_from, date_to)
         await ce.load_candles(binance_to_symbol(symbol), *params)
         candles = await db.load_candles(symbol, *params)
         candles["dnv"] = candles["v"] * candles["c"]
-        # trades = trades[trades.index >= round_time_to_tf(trades.index[0], tf)]
-        min_price = trades.price.min()
-        max_price = trades.price.max()
+        # the price range of the trades, without loading them all
+        min_price = candles.l.min()
+        max_price = candles.h.max()
         start = time.time()
-        clusters, min_max = get_clusters_by_tf(trades, min_price, max_price, step=10,
-                                               tf_size=timedelta(minutes=tf_size_minutes(tf)))
+        clusters, min_max = await get_clusters_by_tf(db.iter_trades(symbol, date_from, date_to), min_price, max_price,
+                                                     step=10, tf_size=timedelta(minutes=tf_size_minutes(tf)))
         end = time.time()
         print(f"TIME: {start - end}")
         candles['timestamp'] = candles.index
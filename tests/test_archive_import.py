@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+import os
+import zipfile
+from datetime import datetime, timedelta
+
+from core.base import CoreBase
+from tools.candles_importer.archive import ArchiveImporter, MANIFEST_NAME, iter_archive_candles
+
+HEADER = "open_time,open,high,low,close,volume,close_time,quote_volume,count,taker_buy_volume," \
+         "taker_buy_quote_volume,ignore\n"
+
+
+def write_archive(directory, name: str, start: datetime, hours: int, unit: int = 1000, header: bool = False,
+                  checksum: bool = True) -> str:
+    lines = []
+    for i in range(hours):
+        open_time = int((start + timedelta(hours=i) - datetime(1970, 1, 1)).total_seconds()) * unit
+        close_time = open_time + 3600 * unit - 1
+        lines.append(f"{open_time},{i}.5,{i + 1}.0,{i}.0,{i}.75,10.5,{close_time},100.0,5,1.0,2.0,0\n")
+
+    path = os.path.join(directory, f"{name}.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"{name}.csv", (HEADER if header else "") + "".join(lines))
+    if checksum:
+        with open(path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        with open(f"{path}.CHECKSUM", "w") as f:
+            f.write(f"{sha256}  {name}.zip\n")
+    return path
+
+
+class FakeDb:
+    def __init__(self):
+        self.saved = []
+        self.replaced = None
+
+    async def save_candles(self, symbol, tf, candles, replace=False, bulk=False):
+        self.saved.append((symbol, tf, candles))
+        self.replaced = replace
+
+
+def run_import(monkeypatch, db, path, **kwargs):
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        return await ArchiveImporter(db, str(path), chunk_rows=100).import_all(**kwargs)
+
+    return asyncio.run(main())
+
+
+def test_millisecond_and_microsecond_files_with_header(tmp_path):
+    ms = write_archive(tmp_path, "BTCUSDT-1h-2024-12", datetime(2024, 12, 1), 250)
+    us = write_archive(tmp_path, "BTCUSDT-1h-2025-01-01", datetime(2025, 1, 1), 24, unit=10 ** 6, header=True)
+
+    chunks = list(iter_archive_candles(ms, chunk_rows=100))
+    assert [len(c) for c in chunks] == [100, 100, 50]
+    assert chunks[0].index[0] == datetime(2024, 12, 1) and chunks[-1].index[-1] == datetime(2024, 12, 11, 9)
+    assert chunks[0].iloc[1].tolist() == [1.5, 2.0, 1.0, 1.75, 10.5]
+
+    candles = next(iter_archive_candles(us))
+    assert len(candles) == 24
+    assert candles.index[0] == datetime(2025, 1, 1) and candles.index[-1] == datetime(2025, 1, 1, 23)
+
+
+def test_verified_idempotent_import(tmp_path, monkeypatch):
+    tree = tmp_path / "spot" / "monthly" / "klines" / "BTCUSDT" / "1h"
+    tree.mkdir(parents=True)
+    write_archive(tree, "BTCUSDT-1h-2023-01", datetime(2023, 1, 1), 744)
+    write_archive(tmp_path, "ETHUSDT-1h-2023-01", datetime(2023, 1, 1), 744, checksum=False)
+    write_archive(tmp_path, "XRPUSDT-1h-2023-01", datetime(2023, 1, 1), 744)
+    write_archive(tmp_path, "BTCUSDT-4h-2023-01", datetime(2023, 1, 1), 10)
+    with open(tmp_path / "XRPUSDT-1h-2023-01.zip.CHECKSUM", "w") as f:
+        f.write(f"{'0' * 64}  XRPUSDT-1h-2023-01.zip\n")
+
+    db = FakeDb()
+    stats = run_import(monkeypatch, db, tmp_path, tfs=["1h"])
+    # ETHUSDT has no checksum file, XRPUSDT doesn't match it
+    assert stats == dict(imported=1, skipped=0, failed=2, rows=744) and db.replaced is False
+    assert {(symbol, tf) for symbol, tf, _ in db.saved} == {("BTCUSDT", "1h")}
+    saved = [ts for _, _, candles in db.saved for ts in candles.index]
+    assert saved == [datetime(2023, 1, 1) + timedelta(hours=i) for i in range(744)]
+    assert os.path.exists(tmp_path / MANIFEST_NAME)
+
+    # nothing changed: nothing written again
+    db = FakeDb()
+    stats = run_import(monkeypatch, db, tmp_path, tfs=["1h"])
+    assert stats["skipped"] == 1 and stats["imported"] == 0 and db.saved == []
+
+    # a re-downloaded file with other contents is imported again
+    write_archive(tree, "BTCUSDT-1h-2023-01", datetime(2023, 1, 1), 740)
+    stats = run_import(monkeypatch, db, tmp_path, symbols=["BTCUSDT"], tfs=["1h"])
+    assert stats == dict(imported=1, skipped=0, failed=0, rows=740)
+    # its corrected candles overwrite the stored ones
+    assert db.replaced is True
+
+
+def test_manifest_keeps_files_of_the_same_name_apart(tmp_path, monkeypatch):
+    trees = [os.path.join("spot", "monthly", "klines", "BTCUSDT", "1h"),
+             os.path.join("futures", "um", "monthly", "klines", "BTCUSDT", "1h")]
+    for tree, hours in zip(trees, [744, 740]):
+        (tmp_path / tree).mkdir(parents=True)
+        write_archive(tmp_path / tree, "BTCUSDT-1h-2023-01", datetime(2023, 1, 1), hours)
+
+    stats = run_import(monkeypatch, FakeDb(), tmp_path)
+    assert stats == dict(imported=2, skipped=0, failed=0, rows=1484)
+    with open(tmp_path / MANIFEST_NAME) as f:
+        assert sorted(json.load(f).keys()) == sorted(os.path.join(tree, "BTCUSDT-1h-2023-01.zip") for tree in trees)
+
+    stats = run_import(monkeypatch, FakeDb(), tmp_path)
+    assert stats["skipped"] == 2 and stats["imported"] == 0
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from core.base import CoreBase
+from core.exchange.binance.public import PublicBinance
+from core.exchange.common.candles_buffer import CandlesBuffer
+from core.types import Symbol, Tf
+from core.utils.data import candles_to_data_frame
+
+SYMBOL = Symbol("BTCUSDT")
+TF = Tf("1h")
+
+
+def make_candles(start: datetime, count: int) -> pd.DataFrame:
+    return candles_to_data_frame(
+        [[start + timedelta(hours=i), 1.0, 2.0, 0.5, float(i), 10.0] for i in range(count)]
+    )
+
+
+def test_backfill_loads_only_the_gap_and_replays_in_order(monkeypatch):
+    now_ = datetime.utcnow().replace(minute=30, second=0, microsecond=0)
+    history_start = now_.replace(minute=0) - timedelta(hours=20)
+    remote = make_candles(history_start, 20)  # the last one is closed one hour ago
+    requests = []
+    closed = []
+
+    async def load_candles(symbol, tf, start_time=None, end_time=None):
+        requests.append((start_time, end_time))
+        part = remote[(remote.index >= start_time) & (remote.index <= end_time)]
+        return part.iloc[:3]  # small pages
+
+    async def on_candle(symbol, tf, candle_closed, item, close_time):
+        if candle_closed:
+            closed.append(item[0])
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        exchange = PublicBinance()
+        monkeypatch.setattr(exchange, "data_provider", None)
+        monkeypatch.setattr(exchange, "on_candle_callback", on_candle)
+        monkeypatch.setattr(exchange, "_load_candles", load_candles)
+        monkeypatch.setattr(exchange, "candles_pending", {})
+        monkeypatch.setitem(exchange.candle_unclosed, SYMBOL, {TF: None})
+        monkeypatch.setitem(exchange.candles, SYMBOL, {TF: CandlesBuffer.from_frame(remote.iloc[:12], 100)})
+
+        await exchange.reconnect_streams(["btcusdt@kline_1h", "btcusdt@depth"])
+        assert (SYMBOL, TF) in exchange.candles_pending
+        while (SYMBOL, TF) in exchange.candles_pending:
+            await asyncio.sleep(0.01)
+        return exchange
+
+    exchange = asyncio.run(main())
+    buffer = exchange.candles[SYMBOL][TF]
+    assert buffer.count == 20
+    assert closed == list(remote.index[12:].to_pydatetime())
+    assert requests[0][0] == remote.index[12]
+    assert (SYMBOL, TF) not in exchange.candles_pending
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from core.exchange.common.candles_buffer import CandlesBuffer
+
+
+def make_candles(length: int, start: datetime = datetime(2022, 1, 1)) -> pd.DataFrame:
+    index = pd.date_range(start, periods=length, freq="1h", name="timestamp")
+    values = np.arange(length * 5, dtype=np.float64).reshape(length, 5)
+    return pd.DataFrame(values, columns=["o", "h", "l", "c", "v"], index=index)
+
+
+def test_candles_buffer_wraps_around():
+    history = make_candles(25)
+    buffer = CandlesBuffer.from_frame(history.iloc[:7], capacity=10)
+
+    for timestamp, row in history.iloc[7:].iterrows():
+        buffer.append(timestamp.to_pydatetime(), row.o, row.h, row.l, row.c, row.v)
+
+    assert len(buffer) == 10
+    pd.testing.assert_frame_equal(buffer.to_frame(), history.iloc[-10:], check_freq=False, check_index_type=False)
+    assert buffer.last_timestamp == history.index[-1].to_pydatetime()
+    assert np.array_equal(buffer.column("c"), history.c.values[-10:])
+
+
+def test_candles_buffer_iloc_matches_data_frame():
+    history = make_candles(30)
+    buffer = CandlesBuffer.from_frame(history, capacity=24)
+    expected = history.iloc[-24:]
+
+    pd.testing.assert_frame_equal(buffer.iloc[-21:], expected.iloc[-21:], check_freq=False, check_index_type=False)
+    pd.testing.assert_series_equal(buffer.iloc[-1], expected.iloc[-1], check_names=False)
+    assert buffer.iloc[-100:].shape == expected.shape
+    for key in [slice(None, None, -1), slice(-3, 2, -2), slice(5, None, -1), slice(1, 20, 3), slice(10, 2)]:
+        pd.testing.assert_frame_equal(buffer.iloc[key], expected.iloc[key], check_freq=False, check_index_type=False)
+
+
+def test_candles_buffer_view_includes_unclosed_candle():
+    history = make_candles(15)
+    buffer = CandlesBuffer.from_frame(history.iloc[:12], capacity=10)
+    unclosed = history.index[12].to_pydatetime()
+    buffer.set_unclosed(unclosed, 1.0, 2.0, 0.5, 1.5, 10.0)
+
+    view = buffer.view()
+    assert len(view) == 11
+    assert view.timestamp[-1] == np.datetime64(unclosed)
+    assert view.c[-1] == 1.5
+    assert np.array_equal(view.c[:-1], history.c.values[2:12])
+    assert np.shares_memory(view.c, buffer.values)
+
+    assert len(buffer.view(last_n=3)) == 3
+    assert len(buffer.view(include_unclosed=False)) == 10
+
+    row = history.iloc[12]
+    buffer.append(unclosed, row.o, row.h, row.l, row.c, row.v)
+    pd.testing.assert_frame_equal(buffer.view().to_frame(), history.iloc[3:13], check_freq=False,
+                                  check_index_type=False)
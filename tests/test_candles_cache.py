@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from core.providers.candles_cache import CandlesCache
+from core.providers.data_provider import TimescaleDataProvider
+from core.utils.data import candles_to_data_frame
+
+START = datetime(2023, 1, 1)
+KEY = ("BTCUSDT", "1h")
+
+
+def hour(h: int) -> datetime:
+    return START + timedelta(hours=h)
+
+
+def make_candles(hours):
+    return candles_to_data_frame([[hour(h), 1.0, 2.0, 0.5, 1.5 + h, 10.0] for h in hours])
+
+
+class FakeDb:
+    def __init__(self):
+        self.candles = make_candles(range(100))
+        self.queries = []
+
+    async def load_candles_many(self, symbols, tf, start_time=None, end_time=None):
+        self.queries.append((tuple(symbols), start_time, end_time))
+        df = self.candles
+        df = df[(df.index >= (start_time or datetime.min)) & (df.index < (end_time or datetime.max))]
+        return {symbol: df for symbol in symbols}
+
+    async def save_candles(self, symbol, tf, candles):
+        pass
+
+
+def test_missing_parts_and_merged_ranges():
+    cache = CandlesCache()
+    cache.put(KEY, hour(10), hour(20), make_candles(range(10, 20)))
+    cache.put(KEY, hour(30), hour(40), make_candles(range(30, 40)))
+
+    assert cache.missing(KEY, hour(12), hour(18)) == []
+    assert cache.missing(KEY, hour(0), hour(50)) == [(hour(0), hour(10)), (hour(20), hour(30)), (hour(40), hour(50))]
+    assert cache.missing(KEY, hour(60), hour(70)) == [(hour(60), hour(70))]
+    assert (cache.hits, cache.partial_hits, cache.misses) == (1, 1, 1)
+
+    cache.put(KEY, hour(20), hour(30), make_candles(range(20, 30)))
+    assert len(cache.ranges[KEY]) == 1
+    candles = cache.read(KEY, hour(15), hour(35))
+    assert candles["c"].tolist() == [1.5 + h for h in range(15, 35)]
+
+
+def test_evicts_least_recently_used_keys_by_bytes():
+    size = int(make_candles(range(10)).memory_usage(index=True).sum())
+    cache = CandlesCache(max_bytes=2 * size)
+    for symbol in ["A", "B"]:
+        cache.put((symbol, "1h"), hour(0), hour(10), make_candles(range(10)))
+    cache.read(("A", "1h"), hour(0), hour(5))
+    cache.put(("C", "1h"), hour(0), hour(10), make_candles(range(10)))
+
+    assert list(cache.ranges.keys()) == [("A", "1h"), ("C", "1h")]
+    assert cache.bytes == 2 * size and cache.stats["evictions"] == 1
+
+
+def test_provider_fetches_only_uncovered_ranges():
+    db = FakeDb()
+    provider = TimescaleDataProvider(db=db)
+
+    async def main():
+        first = await provider.load_candles_many(["BTCUSDT", "ETHUSDT"], "1h", hour(10), hour(20))
+        second = await provider.load_candles("BTCUSDT", "1h", hour(12), hour(18))
+        wider = await provider.load_candles("BTCUSDT", "1h", hour(5), hour(25))
+        await provider.save_candles("BTCUSDT", "1h", candles_to_data_frame([[hour(24), 9.0, 9.0, 9.0, 9.0, 9.0]]))
+        saved = await provider.load_candles("BTCUSDT", "1h", hour(24), hour(25))
+        return first, second, wider, saved
+
+    first, second, wider, saved = asyncio.run(main())
+    assert db.queries == [
+        (("BTCUSDT", "ETHUSDT"), hour(10), hour(20)),
+        (("BTCUSDT",), hour(5), hour(10)),
+        (("BTCUSDT",), hour(20), hour(25)),
+    ]
+    assert len(first["ETHUSDT"]) == 10 and len(second) == 6
+    assert wider.index.tolist() == [hour(h) for h in range(5, 25)]
+    assert saved["c"].tolist() == [9.0]
+    assert provider.cache.stats["hits"] == 2 and provider.cache.stats["partial_hits"] == 1
+
+
+def test_open_end_is_covered_only_up_to_the_last_candle():
+    db = FakeDb()
+    provider = TimescaleDataProvider(db=db)
+
+    async def main():
+        first = await provider.load_candles("BTCUSDT", "1h", hour(90))
+        # written to the DB by someone else, not through the provider
+        db.candles = make_candles(range(101))
+        second = await provider.load_candles("BTCUSDT", "1h", hour(90))
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert len(first) == 10 and second.index[-1] == hour(100)
+    assert db.queries[1][1] == hour(100)
+    assert provider.cache.ranges[KEY][0].end == hour(101)
@@ -0,0 +1,41 @@
+import asyncio
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from core.ta.clusters import get_clusters_by_tf
+
+TF_SIZE = timedelta(minutes=15)
+
+
+def make_trades() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    index = pd.date_range("2023-01-01 00:03:10", periods=1000, freq="7s", name="timestamp")
+    return pd.DataFrame({"price": 100 + rng.normal(0, 5, len(index)), "volume": rng.random(len(index))}, index=index)
+
+
+def clusters_of(trades: pd.DataFrame, chunk_size: int):
+    async def chunks():
+        for start in range(0, len(trades), chunk_size):
+            yield trades.iloc[start:start + chunk_size]
+
+    return asyncio.run(get_clusters_by_tf(chunks(), 90.0, 110.0, 2.0, TF_SIZE))
+
+
+def test_streamed_clusters_match_clusters_of_each_interval():
+    trades = make_trades()
+    # chunk edges fall inside 15m intervals
+    clusters, (min_vol, max_vol) = clusters_of(trades, 90)
+
+    edges = np.arange(trades.index[0], trades.index[-1], TF_SIZE)
+    assert list(clusters.keys()) == list(edges[:-1])
+    for left, right in zip(edges[:-1], edges[1:]):
+        chunk = trades[(trades.index >= left) & (trades.index < right)]
+        expected = chunk["volume"].groupby(pd.cut(chunk["price"], np.arange(90.0, 110.0, 2.0)), observed=False).sum()
+        np.testing.assert_allclose(clusters[left].to_numpy(), expected.to_numpy())
+        assert list(clusters[left].index) == list(expected.index)
+
+    whole, min_max = clusters_of(trades, len(trades))
+    assert all(np.allclose(whole[t], clusters[t]) for t in clusters)
+    assert np.isclose(min_max[1], max_vol) and 0 < min_vol <= max_vol
@@ -0,0 +1,111 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from core.providers.data_provider import DataProvider
+from core.providers.file_data_provider import CandlesFile, FileDataProvider
+from core.utils.data import candles_to_data_frame
+
+START = datetime(2023, 1, 1)
+
+
+def make_candles(hours, close: float = 1.5):
+    return candles_to_data_frame([[START + timedelta(hours=h), 1.0, 2.0, 0.5, close + h, 10.0] for h in hours])
+
+
+class FakeUpstream(DataProvider):
+    def __init__(self, candles):
+        super().__init__()
+        self.candles = candles
+        self.requests = []
+        self.saved = []
+
+    async def save_candles(self, symbol, tf, candles):
+        self.saved.append((symbol, tf, len(candles)))
+        self.candles[symbol] = pd.concat([self.candles.get(symbol, candles_to_data_frame([])), candles]).sort_index()
+
+    async def load_candles_many(self, symbols, tf, start_time=None, end_time=None):
+        self.requests.append((tuple(symbols), start_time, end_time))
+        result = {}
+        for symbol in symbols:
+            df = self.candles.get(symbol, candles_to_data_frame([]))
+            if start_time is not None:
+                df = df[df.index >= start_time]
+            if end_time is not None:
+                df = df[df.index < end_time]
+            result[symbol] = df
+        return result
+
+
+def test_read_through_loads_only_what_files_miss(tmp_path):
+    upstream = FakeUpstream({"BTCUSDT": make_candles(range(48)), "ETHUSDT": make_candles(range(10, 48), 3.0)})
+    provider = FileDataProvider(str(tmp_path), upstream=upstream)
+    start, end = START + timedelta(hours=24), START + timedelta(hours=40)
+
+    async def main():
+        first = await provider.load_candles_many(["BTCUSDT", "ETHUSDT"], "1h", start, end)
+        second = await provider.load_candles_many(["BTCUSDT", "ETHUSDT"], "1h", start, end)
+        older = await provider.load_candles("BTCUSDT", "1h", START, end)
+        return first, second, older
+
+    first, second, older = asyncio.run(main())
+    # a cold start is one query for both symbols, then only the tail from the last stored candle and the head
+    assert upstream.requests == [
+        (("BTCUSDT", "ETHUSDT"), start, end),
+        (("BTCUSDT", "ETHUSDT"), START + timedelta(hours=39), end),
+        (("BTCUSDT",), START, start),
+        (("BTCUSDT",), START + timedelta(hours=39), end),
+    ]
+    assert len(first["BTCUSDT"]) == 16 and first["ETHUSDT"]["c"].iloc[0] == 27.0
+    assert (second["BTCUSDT"].index == first["BTCUSDT"].index).all()
+    assert len(older) == 40 and older.index.is_monotonic_increasing
+    assert older["c"].tolist() == make_candles(range(40))["c"].tolist()
+
+
+def test_files_serve_without_upstream_after_restart(tmp_path):
+    async def main():
+        provider = FileDataProvider(str(tmp_path), upstream=FakeUpstream({}))
+        await provider.save_candles("BTCUSDT", "1h", make_candles(range(5, 10)))
+        # older candles than the stored ones are merged in order
+        await provider.save_candles("BTCUSDT", "1h", make_candles(range(0, 6)))
+        await provider.save_candles("BTCUSDT", "1h", make_candles(range(9, 12)))
+
+        saved = provider.upstream.saved
+        provider = FileDataProvider(str(tmp_path))
+        return saved, await provider.load_candles("BTCUSDT", "1h", START + timedelta(hours=2))
+
+    saved, candles = asyncio.run(main())
+    assert saved == [("BTCUSDT", "1h", 5), ("BTCUSDT", "1h", 6), ("BTCUSDT", "1h", 3)]
+    assert candles.index.tolist() == [START + timedelta(hours=h) for h in range(2, 12)]
+    assert candles["c"].tolist() == [1.5 + h for h in range(2, 12)]
+
+
+def test_save_after_a_hole_reads_the_hole_through(tmp_path):
+    upstream = FakeUpstream({"BTCUSDT": make_candles(range(20))})
+    provider = FileDataProvider(str(tmp_path), upstream=upstream)
+
+    async def main():
+        await provider.load_candles("BTCUSDT", "1h", START, START + timedelta(hours=5))
+        # hours 5..19 are only upstream when candles of hours 20..21 are saved
+        await provider.save_candles("BTCUSDT", "1h", make_candles(range(20, 22)))
+        upstream.requests.clear()
+        return await provider.load_candles("BTCUSDT", "1h", START, START + timedelta(hours=22))
+
+    candles = asyncio.run(main())
+    assert candles.index.tolist() == [START + timedelta(hours=h) for h in range(22)]
+    assert upstream.requests == [(("BTCUSDT",), START + timedelta(hours=21), START + timedelta(hours=22))]
+
+
+def test_interrupted_append_keeps_complete_rows(tmp_path):
+    file = CandlesFile(os.path.join(tmp_path, "BTCUSDT_1h"))
+    file.append(make_candles(range(3)))
+    with open(file.column_path("o"), "ab") as f:
+        f.write(np.float64(1.0).tobytes())
+
+    assert len(file) == 3
+    file.append(make_candles(range(3, 5)))
+    assert len(file) == 5 and os.path.getsize(file.column_path("o")) == 5 * 8
+    assert file.read()["o"].tolist() == [1.0] * 5
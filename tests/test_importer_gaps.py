@@ -0,0 +1,123 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from core.base import CoreBase
+from core.utils.data import candles_to_data_frame
+from tools.candles_importer.importer import CandlesImporter, gaps_report
+
+TF = "1h"
+DATE_FROM = datetime(2023, 1, 1)
+DATE_TO = datetime(2023, 1, 5)
+LISTED = {"BTCUSDT": DATE_FROM, "NEWUSDT": datetime(2023, 1, 4)}
+
+
+def hour(h: int) -> datetime:
+    return DATE_FROM + timedelta(hours=h)
+
+
+class FakeDb:
+    def __init__(self):
+        self.saved = []
+        # BTCUSDT is stored except for two holes, NEWUSDT isn't stored yet
+        self.gaps = {"BTCUSDT": [(hour(10), hour(13)), (hour(90), hour(96))], "NEWUSDT": [(hour(0), hour(96))]}
+        self.gap_queries = []
+        self.first_available = {}
+
+    async def load_candle_gaps(self, symbols, tf, start_time, end_time):
+        self.gap_queries.append((tuple(symbols), start_time, end_time))
+        return {symbol: self.gaps[symbol] for symbol in symbols}
+
+    async def save_candles(self, symbol, tf, candles, replace=False, bulk=False):
+        self.saved.append((symbol, candles))
+
+    async def load_first_available(self, symbols):
+        return {symbol: self.first_available[symbol] for symbol in symbols if symbol in self.first_available}
+
+    async def update_symbol_status_one_value(self, symbol, first_available=None, **kwargs):
+        if first_available is not None:
+            self.first_available[symbol] = first_available
+
+
+def run_import(monkeypatch, dry_run: bool, db: Optional[FakeDb] = None):
+    requests = []
+    db = db or FakeDb()
+
+    async def load_candles(symbol, tf="1m", start_time=None, end_time=None, job=None):
+        requests.append((symbol, start_time, end_time))
+        first = max(start_time, LISTED[symbol])
+        hours = [first + timedelta(hours=i) for i in range(1000) if first + timedelta(hours=i) <= end_time]
+        return candles_to_data_frame([[h, 1.0, 2.0, 0.5, 1.5, 1.0] for h in hours])
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        monkeypatch.setattr("tools.candles_importer.importer.CANDLES_TIMEFRAMES", [TF])
+        importer = CandlesImporter(db)
+        importer.exportable_symbols = list(LISTED.keys())
+        importer.date_from, importer.date_to = DATE_FROM, DATE_TO + timedelta(minutes=30)
+        importer._load_candles = load_candles
+        await importer.import_all(workers=1, dry_run=dry_run)
+        return importer
+
+    importer = asyncio.run(main())
+    return importer, db, requests
+
+
+def test_only_the_holes_are_fetched(monkeypatch):
+    importer, db, requests = run_import(monkeypatch, dry_run=False)
+
+    # one query for all symbols, the unclosed candle of date_to is not expected
+    assert db.gap_queries == [(("BTCUSDT", "NEWUSDT"), DATE_FROM, DATE_TO)]
+    assert [(symbol, start) for symbol, start, _ in requests] == [
+        ("BTCUSDT", hour(10)), ("BTCUSDT", hour(90)), ("NEWUSDT", hour(0)),
+    ]
+    saved = {symbol: [] for symbol in LISTED}
+    for symbol, candles in db.saved:
+        saved[symbol].extend(candles.index)
+    assert saved["BTCUSDT"] == [hour(h) for h in list(range(10, 13)) + list(range(90, 96))]
+    assert saved["NEWUSDT"] == [hour(h) for h in range(72, 96)]
+
+
+def test_dry_run_reports_missing_candles(monkeypatch):
+    importer, db, requests = run_import(monkeypatch, dry_run=True)
+
+    assert requests == [] and db.saved == []
+    report = gaps_report(importer.gaps).set_index("symbol")
+    assert report.loc["BTCUSDT", "gaps"] == 2 and report.loc["BTCUSDT", "missing"] == 9
+    assert report.loc["NEWUSDT", "missing"] == 96 and report.loc["NEWUSDT", "last"] == DATE_TO
+
+
+def test_history_before_the_listing_is_not_a_gap(monkeypatch):
+    db = FakeDb()
+    run_import(monkeypatch, dry_run=False, db=db)
+    # NEWUSDT starts later on the exchange, BTCUSDT's first gap is a hole in stored history
+    assert db.first_available == {"NEWUSDT": LISTED["NEWUSDT"]}
+
+    importer, db, requests = run_import(monkeypatch, dry_run=False, db=db)
+    assert [(symbol, start) for symbol, start, _ in requests if symbol == "NEWUSDT"] == [("NEWUSDT", hour(72))]
+
+    importer, db, requests = run_import(monkeypatch, dry_run=True, db=db)
+    report = gaps_report(importer.gaps).set_index("symbol")
+    assert report.loc["NEWUSDT", "missing"] == 24 and report.loc["NEWUSDT", "first"] == hour(72)
+
+
+def test_import_symbol_scans_the_whole_history(monkeypatch):
+    requests = []
+
+    async def load_candles(symbol, tf="1m", start_time=None, end_time=None, job=None):
+        requests.append((symbol, start_time))
+        return candles_to_data_frame([])
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        db = FakeDb()
+        importer = CandlesImporter(db)
+        importer.date_from, importer.date_to = DATE_FROM, DATE_TO
+        importer._load_candles = load_candles
+        await importer.import_symbol("BTCUSDT", tfs=[TF])
+        return db
+
+    db = asyncio.run(main())
+    # a later last_sync doesn't hide the holes before it
+    assert db.gap_queries == [(("BTCUSDT",), DATE_FROM, DATE_TO)]
+    assert requests == [("BTCUSDT", hour(10)), ("BTCUSDT", hour(90))]
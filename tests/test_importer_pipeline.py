@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.base import CoreBase
+from core.utils.data import candles_to_data_frame
+from tools.candles_importer.importer import CandlesImporter, ImportJob
+
+SYMBOL = "BTCUSDT"
+TF = "1h"
+PAGE = 100
+PAGES = 10
+DATE_FROM = datetime(2023, 1, 1)
+DATE_TO = DATE_FROM + timedelta(hours=PAGE * PAGES)
+
+
+class SlowDb:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.saved = []
+        self.writing = False
+
+    async def save_candles(self, symbol, tf, candles, replace=False, bulk=False):
+        # slower than a fetch: the pages queued meanwhile are written together
+        self.writing = True
+        await asyncio.sleep(0.03)
+        self.writing = False
+        if self.fail:
+            raise ConnectionError("connection lost")
+        self.saved.append(candles)
+
+    async def load_candle_gaps(self, symbols, tf, start_time, end_time):
+        # nothing stored yet
+        return {symbol: [(start_time, end_time)] for symbol in symbols}
+
+
+def run_import(monkeypatch, db):
+    fetched = []
+    overlapped = []
+
+    async def load_candles(symbol, tf="1m", start_time=None, end_time=None, job=None):
+        overlapped.append(db.writing)
+        await asyncio.sleep(0.01)
+        # the first PAGE candles opened from start_time on
+        hours = [start_time + timedelta(hours=i) for i in range(PAGE) if start_time + timedelta(hours=i) <= end_time]
+        fetched.append(len(hours))
+        return candles_to_data_frame([[h, 1.0, 2.0, 0.5, 1.5, 1.0] for h in hours])
+
+    job = ImportJob(SYMBOL, TF)
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        importer = CandlesImporter(db)
+        importer._load_candles = load_candles
+        await importer.load_gap(SYMBOL, TF, DATE_FROM, DATE_TO, job=job)
+
+    asyncio.run(main())
+    return job, fetched, overlapped
+
+
+def test_pages_are_fetched_while_written_and_coalesced(monkeypatch):
+    db = SlowDb()
+    job, fetched, overlapped = run_import(monkeypatch, db)
+
+    assert sum(fetched) == PAGE * PAGES
+    assert any(overlapped)
+    assert len(db.saved) < PAGES
+    saved = [ts for candles in db.saved for ts in candles.index]
+    assert sorted(saved) == [DATE_FROM + timedelta(hours=i) for i in range(PAGE * PAGES)]
+    assert all(candles.index.is_monotonic_increasing for candles in db.saved)
+    assert job.candles == PAGE * PAGES and job.write_time > 0 and job.fetch_time > 0
+
+
+def test_failed_write_stops_the_fetch(monkeypatch):
+    with pytest.raises(ConnectionError):
+        run_import(monkeypatch, SlowDb(fail=True))
+
+
+def test_load_candles_fetches_from_the_requested_start(monkeypatch):
+    db = SlowDb()
+    requested = []
+    date_to = DATE_FROM + timedelta(hours=2500)
+
+    async def load_candles(symbol, tf="1m", start_time=None, end_time=None, job=None):
+        requested.append(start_time)
+        # candles open on the hour, the first one at or after start_time
+        first = start_time.replace(minute=0) + timedelta(hours=1 if start_time.minute > 0 else 0)
+        hours = [first + timedelta(hours=i) for i in range(1000) if first + timedelta(hours=i) <= end_time]
+        return candles_to_data_frame([[h, 1.0, 2.0, 0.5, 1.5, 1.0] for h in hours])
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        importer = CandlesImporter(db)
+        importer._load_candles = load_candles
+        await importer.load_candles(SYMBOL, TF, DATE_FROM, date_to)
+
+    asyncio.run(main())
+    saved = sorted(ts for candles in db.saved for ts in candles.index)
+    assert requested == [DATE_FROM + timedelta(hours=h) for h in [0, 1000, 2000]]
+    assert saved == [DATE_FROM + timedelta(hours=i) for i in range(2500)]
@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from core.base import CoreBase
+from core.exchange.protectors.binance_request_limiter import BinanceRequestLimiter
+from core.types import Tf
+from core.utils.data import candles_to_data_frame
+from core.utils.timeframe import tf_size_minutes
+from tools.candles_importer.importer import CandlesImporter
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "XRPUSDT", "ADAUSDT"]
+TFS = ["1d", "4h", "1h", "15m"]
+DATE_FROM = datetime(2023, 1, 1)
+DATE_TO = datetime(2023, 1, 11)
+
+
+class FakeDb:
+    def __init__(self):
+        self.saved = {}
+        self.synced = []
+
+    async def load_first_available(self, symbols):
+        return {}
+
+    async def load_candle_gaps(self, symbols, tf, start_time, end_time):
+        return {symbol: [(start_time, end_time)] for symbol in symbols}
+
+    async def load_candles(self, symbol, tf, start_time=None, end_time=None):
+        return pd.concat(self.saved[(symbol, tf)])
+
+    async def save_candles(self, symbol, tf, candles, replace=False, bulk=False):
+        self.saved.setdefault((symbol, tf), []).append(candles)
+
+    async def update_symbol_status_one_value(self, symbol, **kwargs):
+        if "last_sync" in kwargs:
+            self.synced.append(symbol)
+
+
+def test_workers_share_the_limiter_and_report_progress(monkeypatch):
+    running = []
+    peak = []
+
+    async def load_candles(symbol, tf="1m", start_time=None, end_time=None, job=None):
+        running.append(1)
+        peak.append(len(running))
+        await importer.request_limiter.acquire(2)
+        await asyncio.sleep(0.001)
+        running.pop()
+        job.weight += 2
+        # all of the history in one page
+        step = timedelta(minutes=tf_size_minutes(tf))
+        count = int((DATE_TO - start_time) / step)
+        return candles_to_data_frame([[start_time + step * i, 1.0, 2.0, 0.5, 1.5, 1.0] for i in range(count)])
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        limiter = BinanceRequestLimiter()
+        limiter.init(1200, 6100)
+        monkeypatch.setattr(CandlesImporter, "request_limiter", limiter)
+        monkeypatch.setattr("tools.candles_importer.importer.CANDLES_TIMEFRAMES", TFS)
+        return await importer.import_all(workers=3)
+
+    db = FakeDb()
+    importer = CandlesImporter(db, base_tf=Tf("1h"))
+    importer.exportable_symbols = SYMBOLS
+    importer.date_from, importer.date_to = DATE_FROM, DATE_TO
+    importer._load_candles = load_candles
+    progress = asyncio.run(main())
+
+    assert max(peak) == 3
+    # 1d and 4h are built from the stored 1h candles, the loaded tfs of every symbol are saved once
+    assert sorted(db.saved.keys()) == sorted((s, tf) for s in SYMBOLS for tf in ["1h", "15m", "1d", "4h"])
+    assert sorted(db.synced) == sorted(SYMBOLS)
+    assert len(progress.jobs) == 2 * len(SYMBOLS) and all(j.finished and j.error is None for j in progress.jobs)
+    assert sum(j.weight for j in progress.jobs) == importer.request_limiter.weight_total
+    assert [j.candles for j in progress.jobs[:2]] == [240, 960]
+    assert "8/8 jobs (0 running, 0 failed): 4800 candles" in progress.report(importer.request_limiter.weight_total)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from ta.momentum import rsi
+from ta.volatility import BollingerBands
+
+from indicators import IndicatorEngine, StreamingIndicators, evaluate_batch, stack_closes
+from utils import BB_WINDOW, RSI_WINDOW, should_buy, should_sell
+
+
+def make_closes(length: int = 600, seed: int = 7) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    return pd.Series(30000 + np.cumsum(rng.normal(0, 50, length)))
+
+
+def test_streaming_indicators_match_ta():
+    closes = make_closes()
+    expected_rsi = rsi(closes, window=RSI_WINDOW)
+    bb = BollingerBands(closes, window=BB_WINDOW)
+    expected_upper = bb.bollinger_hband()
+    expected_lower = bb.bollinger_lband()
+
+    state = StreamingIndicators()
+    state.warm_up(closes.values[:250])
+    for i in range(250, len(closes)):
+        values = state.update(closes.values[i])
+        assert np.isclose(values.rsi, expected_rsi.iloc[i], rtol=1e-9)
+        assert np.isclose(values.bb_upper, expected_upper.iloc[i], rtol=1e-9)
+        assert np.isclose(values.bb_lower, expected_lower.iloc[i], rtol=1e-9)
+
+
+def test_streaming_indicators_from_empty_history():
+    closes = make_closes(60)
+    expected_rsi = rsi(closes, window=RSI_WINDOW)
+    expected_upper = BollingerBands(closes, window=BB_WINDOW).bollinger_hband()
+
+    state = StreamingIndicators()
+    for i, close in enumerate(closes.values):
+        values = state.update(close)
+        assert np.isclose(values.rsi, expected_rsi.iloc[i], rtol=1e-9, equal_nan=True)
+        assert np.isclose(values.bb_upper, expected_upper.iloc[i], rtol=1e-9, equal_nan=True)
+
+
+def test_indicator_engine_skips_unknown_and_short_series():
+    engine = IndicatorEngine()
+    assert engine.update("BTCUSDT", "1h", 1.0) is None
+
+    engine.warm_up("BTCUSDT", "1h", make_closes(BB_WINDOW - 1).values)
+    assert engine.get("BTCUSDT", "1h") is None
+
+    engine.update("BTCUSDT", "1h", 30000.0)
+    assert engine.get("BTCUSDT", "1h") is not None
+
+
+def test_evaluate_batch_matches_streaming_state():
+    series = [make_closes(length, seed=length).values for length in (5, 30, 400, 650)]
+    series.append(np.array([30000.0] * 30))
+    series.append(np.r_[np.linspace(110, 100, 39), 80.0])
+    series.append(np.r_[np.linspace(90, 100, 39), 120.0])
+    batch = evaluate_batch(stack_closes(series))
+
+    for i, closes in enumerate(series):
+        state = StreamingIndicators()
+        for close in closes:
+            values = state.update(close)
+
+        assert np.isclose(batch.rsi[i], values.rsi, rtol=1e-9, equal_nan=True)
+        assert np.isclose(batch.bb_upper[i], values.bb_upper, rtol=1e-9, equal_nan=True)
+        assert np.isclose(batch.bb_lower[i], values.bb_lower, rtol=1e-9, equal_nan=True)
+        assert batch.buy[i] == should_buy(values)
+        assert batch.sell[i] == should_sell(values)
+
+    assert batch.buy.tolist() == [False, False, False, False, False, True, False]
+    assert batch.sell.tolist() == [False, False, False, False, False, False, True]
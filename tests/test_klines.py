@@ -0,0 +1,30 @@
+from datetime import datetime
+
+import numpy as np
+
+from core.utils.data import candles_to_data_frame, klines_to_data_frame
+
+# /klines rows as decoded from the response
+KLINES = [
+    [1672531200000, "16541.77000000", "16545.70000000", "16508.39000000", "16529.67000000", "4364.83570000",
+     1672534799999, "72146932.28020360", 96293, "2173.34412000", "35924163.38727280", "0"],
+    [1672534800000, "16529.59000000", "16556.80000000", "16525.78000000", "16551.47000000", "3590.06669000",
+     1672538399999, "59386859.62620650", 78787, "1839.04037000", "30422045.55050420", "0"],
+]
+
+
+def test_klines_decode_like_the_row_by_row_conversion():
+    candles = klines_to_data_frame(KLINES)
+    expected = candles_to_data_frame(
+        [[datetime.utcfromtimestamp(k[0] / 1e3)] + [float(v) for v in k[1:6]] for k in KLINES]
+    )
+
+    assert candles.index.tolist() == expected.index.tolist() == [datetime(2023, 1, 1), datetime(2023, 1, 1, 1)]
+    assert candles.index.name == "timestamp" and list(candles.columns) == ["o", "h", "l", "c", "v"]
+    assert np.array_equal(candles.values, expected.values) and candles.values.dtype == np.float64
+
+
+def test_no_klines():
+    candles = klines_to_data_frame([])
+    assert len(candles) == 0 and list(candles.columns) == ["o", "h", "l", "c", "v"]
+    assert candles.index.dtype == "datetime64[ns]"
@@ -0,0 +1,77 @@
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from core.db.pg_copy import CANDLES_COPY_COLUMNS, PG_COPY_HEADER, decode_copy, encode_candles_copy, \
+    encode_trades_copy
+from core.utils.data import candles_to_data_frame
+
+
+def parse_copy(payload: bytes):
+    assert payload.startswith(PG_COPY_HEADER)
+    pos = len(PG_COPY_HEADER)
+    rows = []
+    while True:
+        (count,) = struct.unpack_from(">h", payload, pos)
+        pos += 2
+        if count == -1:
+            break
+        row = []
+        for i in range(count):
+            (length,) = struct.unpack_from(">i", payload, pos)
+            pos += 4
+            fmt = {0: ">q", 1: ">i"}.get(i, ">d")
+            assert length == struct.calcsize(fmt)
+            row.append(struct.unpack_from(fmt, payload, pos)[0])
+            pos += length
+        rows.append(row)
+
+    assert pos == len(payload)
+    return rows
+
+
+def test_encode_candles_copy():
+    start = datetime(2023, 5, 1, 12)
+    candles = candles_to_data_frame(
+        [[start + timedelta(hours=i), 1.0 + i, 2.0, 0.5, 1.5, np.nan if i == 2 else 10.0] for i in range(3)]
+    )
+    columns = list(candles.columns)
+
+    rows = parse_copy(encode_candles_copy(candles, 42))
+
+    assert list(candles.columns) == columns
+    assert len(rows) == 3
+    pg_epoch = datetime(2000, 1, 1)
+    assert rows[1][:7] == [int((start + timedelta(hours=1) - pg_epoch) / timedelta(microseconds=1)), 42,
+                           2.0, 2.0, 0.5, 1.5, 10.0]
+    assert np.isnan(rows[2][6])
+
+
+def test_encode_trades_copy_row_layout():
+    timestamps = np.array(["2023-01-01T00:00:00.001", "2023-01-01T00:00:00.002"], dtype="datetime64[ms]")
+    payload = encode_trades_copy(7, timestamps, np.array([1.5, 2.5]), np.array([0.1, 0.2]), np.array([True, False]))
+
+    row_size = 2 + (4 + 8) + (4 + 4) + (4 + 8) + (4 + 8) + (4 + 1)
+    assert len(payload) == len(PG_COPY_HEADER) + 2 * row_size + 2
+    second = len(PG_COPY_HEADER) + row_size
+    assert struct.unpack_from(">hiqiiidid", payload, second)[2] == 725_846_400_002_000
+    assert payload[second + row_size - 1] == 0
+
+
+def test_decode_copy_round_trip_and_nulls():
+    start = datetime(2023, 5, 1, 12)
+    candles = candles_to_data_frame([[start + timedelta(minutes=15 * i), 1.0 + i, 2.0, 0.5, 1.5, 10.0]
+                                     for i in range(4)])
+    payload = encode_candles_copy(candles, 42)
+
+    columns = decode_copy(payload, CANDLES_COPY_COLUMNS)
+    assert (columns["timestamp"] == candles.index.values).all()
+    assert columns["timestamp"].dtype == np.dtype("datetime64[ns]")
+    assert (columns["symbol_tf_id"] == 42).all()
+    assert columns["o"].tolist() == candles["o"].tolist()
+
+    # a NULL value is sent with length -1 and no data: the fixed layout no longer fits
+    null_row = payload[:len(PG_COPY_HEADER)] + struct.pack(">hi", 7, -1)
+    assert decode_copy(null_row + payload[len(PG_COPY_HEADER) + 14:], CANDLES_COPY_COLUMNS) is None
+    assert decode_copy(payload[:len(PG_COPY_HEADER)] + struct.pack(">h", -1), CANDLES_COPY_COLUMNS)["o"].size == 0
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from core.exchange.protectors.binance_request_limiter import BinanceRequestLimiter, FUTURES_REQUEST_WEIGHTS, \
+    TokenBucket
+
+
+class Response:
+    def __init__(self, headers, status=200):
+        self.headers = headers
+        self.status = status
+
+
+def test_request_weights():
+    spot = BinanceRequestLimiter()
+    futures = BinanceRequestLimiter(FUTURES_REQUEST_WEIGHTS)
+
+    assert spot.get_weight("/klines", {"limit": 1000}) == 2
+    assert futures.get_weight("/klines", {"limit": 1000}) == 5
+    assert futures.get_weight("/klines", {"limit": 50}) == 1
+    assert spot.get_weight("/depth") == 5
+    assert spot.get_weight("/unknown") == 1
+
+
+def test_token_bucket_sync_used():
+    bucket = TokenBucket(capacity=60, interval=60)
+    now = bucket.updated
+    assert bucket.wait_time(10, now) == 0
+
+    bucket.sync_used(55, now)
+    assert 4.9 < bucket.wait_time(10, now) < 5.1
+
+
+def test_acquire_waits_without_blocking_loop_in_fifo_order():
+    async def main():
+        limiter = BinanceRequestLimiter()
+        limiter.init(weight_limit_1m=1200, raw_requests_5m=6100)
+        limiter.update(Response({"x-mbx-used-weight-1m": "10", "retry-after": "0"}))
+        limiter.blocked_until = time.monotonic() + 0.2
+
+        order = []
+        ticks = 0
+
+        async def request(i):
+            await limiter.acquire(limiter.get_weight("/klines"))
+            order.append(i)
+
+        async def ticker():
+            nonlocal ticks
+            while len(order) < 5:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(ticker(), *[request(i) for i in range(5)])
+        return order, ticks, limiter.weight_total
+
+    order, ticks, weight_total = asyncio.run(main())
+    assert order == [0, 1, 2, 3, 4]
+    assert ticks > 10
+    assert weight_total == 10
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from core.exchange.binance.public import PublicBinance
+from core.exchange.common.candles_buffer import CandlesBuffer
+from core.types import Symbol, Tf
+from core.utils.resample import can_resample, resample_candles, tf_floor
+from core.utils.timeframe import round_time_to_tf
+
+START = datetime(2023, 1, 1)
+
+
+def make_candles(start: datetime, count: int, freq: str = "1h") -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    index = pd.date_range(start, periods=count, freq=freq, name="timestamp")
+    c = 100 + np.cumsum(rng.normal(0, 1, count))
+    return pd.DataFrame({"o": c - 0.5, "h": c + 1, "l": c - 1, "c": c, "v": rng.random(count)}, index=index)
+
+
+def test_resample_matches_pandas_and_drops_partial_edges():
+    candles = make_candles(START + timedelta(hours=2), 49)  # starts and ends inside a 4h candle
+    result = resample_candles(candles, Tf("4h"), Tf("1h"))
+
+    expected = candles.resample("4h").agg({"o": "first", "h": "max", "l": "min", "c": "last", "v": "sum"})
+    expected = expected.iloc[1:-1]
+    assert result.index.tolist() == expected.index.tolist()
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy())
+    assert len(resample_candles(candles, Tf("4h"), Tf("1h"), complete_only=False)) == len(expected) + 2
+
+
+def test_floor_is_round_time_to_tf():
+    times = [START + timedelta(minutes=37 * i) for i in range(100)]
+    for tf in ["15m", "1h", "4h", "1d"]:
+        floored = tf_floor(np.array(times, dtype="datetime64[ns]"), Tf(tf))
+        assert floored.tolist() == [np.datetime64(round_time_to_tf(t, tf), "ns").astype(int) for t in times]
+    assert can_resample(Tf("4h"), Tf("1h")) and not can_resample(Tf("1h"), Tf("4h"))
+    assert not can_resample(Tf("3d"), Tf("1d"))
+
+
+def kline(open_time: datetime, close: float, closed: bool):
+    t = int(pd.Timestamp(open_time).value // 10 ** 6)
+    return {"e": "kline", "s": "BTCUSDT", "k": {"t": t, "T": t + 3599999, "i": "1h", "o": str(close - 0.5),
+                                               "h": str(close + 1), "l": str(close - 1), "c": str(close), "v": "1",
+                                               "x": closed}}
+
+
+def test_derived_candles_follow_the_base_stream(monkeypatch):
+    symbol = Symbol("BTCUSDT")
+    events = []
+
+    async def on_candle(symbol_, tf, closed, item, close_time):
+        if tf == "4h":
+            events.append((closed, item[0], item[2], item[4], item[5], close_time))
+
+    async def main():
+        exchange = PublicBinance()
+        monkeypatch.setattr(exchange, "kline_base_tf", Tf("1h"))
+        monkeypatch.setattr(exchange, "derived_tfs", {})
+        monkeypatch.setattr(exchange, "candles_pending", {})
+        monkeypatch.setattr(exchange, "on_candle_callback", on_candle)
+        feeds = exchange.derive_kline_feeds(["kline_4h", "kline_1d", "kline_15m"], [Tf("4h"), Tf("1d"), Tf("15m")])
+        assert feeds == ["kline_15m", "kline_1h"]
+        assert exchange.derived_tfs == {"1h": ["4h", "1d"]}
+        exchange.derived_tfs = {Tf("1h"): [Tf("4h")]}
+
+        exchange.candles[symbol] = {Tf("1h"): CandlesBuffer(100), Tf("4h"): CandlesBuffer(100)}
+        exchange.candles[symbol][Tf("4h")].append(START - timedelta(hours=4), 1, 1, 1, 1, 1)
+        exchange.candle_unclosed[symbol] = {}
+        for h in range(4):
+            await exchange.ws_on_message(kline(START + timedelta(hours=h), 10.0 + h, False))
+            await exchange.ws_on_message(kline(START + timedelta(hours=h), 10.0 + h, True))
+        await exchange.ws_on_message(kline(START + timedelta(hours=4), 20.0, False))
+        return exchange
+
+    exchange = asyncio.run(main())
+    assert [e[0] for e in events] == [False, False, False, False, False, False, False, True, False]
+    closed = events[7]
+    assert closed[1:5] == (START, 14.0, 13.0, 4.0)
+    assert closed[5] == START + timedelta(hours=4) - timedelta(milliseconds=1)
+    assert events[-1][1] == START + timedelta(hours=4)
+    buffer = exchange.candles[symbol][Tf("4h")]
+    assert buffer.last_timestamp == START and buffer.view().c.tolist() == [1.0, 13.0, 20.0]
+
+
+def test_unsubscribe_maps_derived_tfs_onto_the_base_stream(monkeypatch):
+    symbol = Symbol("BTCUSDT")
+    sent = []
+
+    async def send_message(symbols=[], feeds=[], global_feeds=None, method="SUBSCRIBE"):
+        sent.append((method, list(symbols), list(feeds)))
+        for f in feeds:
+            stream = f"{symbol.lower()}@{f}"
+            if method == "SUBSCRIBE":
+                exchange.streams[stream] = START
+            else:
+                exchange.streams.pop(stream, None)
+
+    exchange = PublicBinance()
+    monkeypatch.setattr(exchange, "kline_base_tf", Tf("1h"))
+    monkeypatch.setattr(exchange, "derived_tfs", {Tf("1h"): [Tf("4h"), Tf("1d")]})
+    monkeypatch.setattr(exchange, "kline_tfs", {symbol: [Tf("1h"), Tf("4h"), Tf("1d")]})
+    monkeypatch.setattr(exchange, "streams", {f"{symbol.lower()}@kline_1h": START})
+    monkeypatch.setattr(exchange, "send_message", send_message)
+    monkeypatch.setitem(exchange.candles, symbol, {tf: CandlesBuffer(10) for tf in ["1h", "4h", "1d"]})
+    monkeypatch.setitem(exchange.candle_unclosed, symbol, {tf: None for tf in ["1h", "4h", "1d"]})
+    exchange.candles[symbol][Tf("1h")].append(START, 1, 1, 1, 1, 1)
+
+    async def main():
+        # a derived tf has no stream of its own, the base one still feeds 1h and 1d
+        await exchange.unsubscribe([symbol], ["kline_4h"])
+        assert sent == [] and exchange.derived_tfs == {"1h": ["1d"]} and "4h" not in exchange.candles[symbol]
+        # the base tf isn't requested any more, but 1d is still built from it
+        await exchange.unsubscribe([symbol], ["kline_1h"])
+        assert sent == [] and exchange.candles[symbol]["1h"].count == 1
+        await exchange.unsubscribe([symbol], ["kline_1d"])
+
+    asyncio.run(main())
+    assert sent == [("UNSUBSCRIBE", [symbol], ["kline_1h"])]
+    assert exchange.derived_tfs == {"1h": []} and exchange.candles[symbol]["1h"].count == 0
@@ -0,0 +1,36 @@
+import asyncio
+
+from core.utils import telegram
+from core.utils.telegram import TelegramQueue, split_message
+
+
+def test_split_message_keeps_lines_under_limit():
+    assert split_message(["a" * 6, "b" * 6, "c" * 6], max_length=14) == ["a" * 6 + "\n" + "b" * 6, "c" * 6]
+    assert split_message([]) == []
+
+
+def test_queue_coalesces_burst_and_retries_rate_limit(monkeypatch):
+    posted = []
+    responses = [(False, 0.01), (True, None)]
+
+    async def post_to_telegram(message, channel_id):
+        posted.append((channel_id, message))
+        return responses.pop(0) if responses else (True, None)
+
+    monkeypatch.setattr(telegram, "post_to_telegram", post_to_telegram)
+    monkeypatch.setattr(telegram, "TELEGRAM_GROUP_INTERVAL", 0.0)
+
+    async def main():
+        queue = TelegramQueue(coalesce_time=0.05)
+        for i in range(3):
+            queue.send(f"signal {i}", "-100")
+        queue.send("direct", "42")
+        await queue.flush()
+        return queue
+
+    queue = asyncio.run(main())
+    digest = "signal 0\nsignal 1\nsignal 2"
+    assert [p for p in posted if p[0] == "-100"] == [("-100", digest), ("-100", digest)]
+    assert ("42", "direct") in posted
+    assert queue.sent == 2
+    assert queue.dropped == 0
@@ -0,0 +1,326 @@
+import asyncio
+from datetime import datetime
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import numpy as np
+
+from core.db.pg_copy import CANDLES_COPY_COLUMNS, encode_candles_copy
+from core.db.timescaledb import TimesScaleDb, get_timestamp_condition, is_bulk_load
+from core.utils.data import candles_to_data_frame
+
+
+class FakeConnection:
+    active = 0
+    max_active = 0
+
+    async def fetchval(self, sql, symbol, tf):
+        # asyncpg refuses concurrent operations on one connection
+        assert "$1" in sql
+        FakeConnection.active += 1
+        FakeConnection.max_active = max(FakeConnection.max_active, FakeConnection.active)
+        await asyncio.sleep(0.01)
+        FakeConnection.active -= 1
+        return hash((symbol, tf)) % 1000
+
+
+class FakePool:
+    connection = FakeConnection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection()
+
+
+class Record(tuple):
+    # the part of asyncpg.Record the db reads: values in order and their column names
+    def __new__(cls, columns, values):
+        record = super().__new__(cls, values)
+        record.columns = columns
+        return record
+
+    def keys(self):
+        return self.columns
+
+
+def make_db(use_pool: bool) -> TimesScaleDb:
+    db = object.__new__(TimesScaleDb)  # bypass the singleton
+    db.__init__("localhost", "user", "password", use_pool=use_pool)
+    return db
+
+
+def run_add_symbols(db: TimesScaleDb):
+    async def main():
+        if not db.use_pool:
+            db._conn_lock = asyncio.Lock()
+        FakeConnection.max_active = 0
+        return await asyncio.gather(*[db.add_symbol(f"S{i}USDT", "1h") for i in range(5)])
+
+    return asyncio.run(main())
+
+
+def test_single_connection_is_used_one_call_at_a_time():
+    db = make_db(use_pool=False)
+    db.conn = FakeConnection()
+    ids = run_add_symbols(db)
+    assert FakeConnection.max_active == 1
+    assert db.symbol_tf[("S3USDT", "1h")] == ids[3]
+
+
+def test_pool_runs_calls_concurrently():
+    db = make_db(use_pool=True)
+    db.conn = FakePool()
+    run_add_symbols(db)
+    assert FakeConnection.max_active == 5
+
+
+def test_timestamp_condition_is_parameterized():
+    start, end = datetime(2023, 1, 1), datetime(2023, 2, 1)
+    assert get_timestamp_condition(start, end, first_arg=2) == (" timestamp >= $2 AND timestamp < $3 ", [start, end])
+    assert get_timestamp_condition(None, end) == (" timestamp < $1 ", [end])
+    assert get_timestamp_condition() == (" 1=1 ", [])
+
+
+def test_load_candles_reuses_one_statement_per_shape():
+    queries = []
+    fetched = []
+    candles = candles_to_data_frame([[datetime(2023, 1, 1, i), 1.0, 2.0, 0.5, 1.5, 10.0] for i in range(3)])
+    columns = [name for name, _ in CANDLES_COPY_COLUMNS]
+
+    class Connection:
+        async def fetch(self, sql, *args):
+            queries.append(sql)
+            fetched.append(args)
+            return [Record(columns, (t, args[0], *row))
+                    for t, row in zip(candles.index.to_pydatetime(), candles.values.tolist())]
+
+        async def copy_from_query(self, sql, *args, output, format):
+            raise AssertionError("a few candles are read as Records")
+
+    db = make_db(use_pool=True)
+    db.conn = FakePool()
+    db.conn.connection = Connection
+    db.symbol_tf = {("BTCUSDT", "1h"): 1, ("ETHUSDT", "1h"): 2}
+
+    async def main():
+        frames = []
+        for symbol, day in [("BTCUSDT", 1), ("ETHUSDT", 2), ("BTCUSDT", 3)]:
+            frames.append(await db.load_candles(symbol, "1h", datetime(2023, 1, day), datetime(2023, 1, day, 3)))
+        return frames
+
+    frames = asyncio.run(main())
+    # one sql text, so asyncpg's statement cache prepares it once per connection
+    assert len(queries) == 3 and len(set(queries)) == 1
+    assert [args[0] for args in fetched] == [1, 2, 1]
+    assert (frames[1]["symbol_tf_id"] == 2).all()
+    assert (frames[1].index.values == candles.index.values).all()
+    assert frames[1]["c"].tolist() == candles["c"].tolist()
+
+
+def test_bulk_load_candles_decodes_binary_copy():
+    copied = []
+    candles = candles_to_data_frame([[datetime(2023, 1, 1, i), 1.0, 2.0, 0.5, 1.5 + i, 10.0] for i in range(3)])
+
+    class Statement:
+        def get_attributes(self):
+            return [SimpleNamespace(name=name, type=SimpleNamespace(name=pg_type))
+                    for name, pg_type in CANDLES_COPY_COLUMNS]
+
+    class Connection:
+        async def prepare(self, sql):
+            return Statement()
+
+        async def fetch(self, sql, *args):
+            raise AssertionError("the columnar path is expected")
+
+        async def copy_from_query(self, sql, *args, output, format):
+            assert format == "binary"
+            copied.append(args)
+            await output(encode_candles_copy(candles, 1))
+
+    db = make_db(use_pool=True)
+    db.conn = FakePool()
+    db.conn.connection = Connection
+    db.symbol_tf = {("BTCUSDT", "1h"): 1}
+
+    df = asyncio.run(db.load_candles("BTCUSDT", "1h", datetime(2023, 1, 1), datetime(2023, 2, 1)))
+    assert copied == [(1, datetime(2023, 1, 1), datetime(2023, 2, 1))]
+    assert df["c"].tolist() == [1.5, 2.5, 3.5] and (df.index.values == candles.index.values).all()
+
+
+def test_bulk_load_is_estimated_from_the_range():
+    start = datetime(2023, 1, 1)
+    assert not is_bulk_load("1h", start, datetime(2023, 1, 5))
+    assert is_bulk_load("1h", start, datetime(2023, 1, 5), series=4)
+    assert is_bulk_load("1m", start, datetime(2023, 1, 1, 6))
+    assert is_bulk_load("1d", None, datetime(2023, 1, 5))
+
+
+def test_empty_result_keeps_its_columns():
+    prepared = []
+
+    class Statement:
+        def get_attributes(self):
+            return [SimpleNamespace(name=name, type=SimpleNamespace(name=pg_type))
+                    for name, pg_type in CANDLES_COPY_COLUMNS]
+
+    class Connection:
+        async def prepare(self, sql):
+            prepared.append(sql)
+            return Statement()
+
+        async def fetch(self, sql, *args):
+            return []
+
+    db = make_db(use_pool=True)
+    db.conn = FakePool()
+    db.conn.connection = Connection
+
+    async def main():
+        return [await db.fetch_as_dataframe("SELECT * FROM candles WHERE symbol_tf_id = $1", i) for i in range(2)]
+
+    frames = asyncio.run(main())
+    # described once, later calls on any connection take the columns from the db
+    assert len(prepared) == 1
+    assert [list(df.columns) for df in frames] == [[name for name, _ in CANDLES_COPY_COLUMNS]] * 2
+
+
+def test_load_candles_many_splits_one_query_by_symbol():
+    fetched = []
+    # rows of ids 1 and 3 ordered by symbol_tf_id, timestamp; id 2 has nothing stored
+    ids = np.array([1, 1, 3, 3, 3])
+    timestamps = np.array([f"2023-01-01T0{i}" for i in [0, 1, 0, 1, 2]], dtype="datetime64[us]")
+    values = dict(timestamp=timestamps, symbol_tf_id=ids, o=ids * 1.0, h=ids * 2.0, l=ids * 0.5, c=ids * 1.5,
+                  v=np.arange(5) * 10.0)
+
+    columns = [name for name, _ in CANDLES_COPY_COLUMNS]
+
+    class Connection:
+        async def fetch(self, sql, *args):
+            assert "ANY($1::int[])" in sql
+            fetched.append(args)
+            return [Record(columns, row) for row in zip(*[values[name].tolist() for name in columns])]
+
+    db = make_db(use_pool=True)
+    db.conn = FakePool()
+    db.conn.connection = Connection
+    db.symbol_tf = {("BTCUSDT", "1h"): 1, ("ETHUSDT", "1h"): 2, ("BNBUSDT", "1h"): 3, ("BTCUSDT", "1d"): 4}
+
+    result = asyncio.run(db.load_candles_many(["BNBUSDT", "BTCUSDT", "ETHUSDT", "XRPUSDT"], "1h",
+                                              datetime(2023, 1, 1), datetime(2023, 1, 2)))
+    assert len(fetched) == 1 and sorted(fetched[0][0]) == [1, 2, 3]
+    assert [len(result[s]) for s in ["BNBUSDT", "BTCUSDT", "ETHUSDT", "XRPUSDT"]] == [3, 2, 0, 0]
+    assert result["BNBUSDT"]["v"].tolist() == [20.0, 30.0, 40.0]
+    assert (result["BTCUSDT"]["symbol_tf_id"] == 1).all()
+    assert result["BTCUSDT"].index[-1] == np.datetime64("2023-01-01T01")
+
+
+def test_last_candle_timestamps_in_one_aggregate_query():
+    queries = []
+
+    class Connection:
+        async def fetch(self, sql, ids):
+            assert "max(timestamp)" in sql and "GROUP BY symbol_tf_id" in sql
+            queries.append(ids)
+            return [dict(symbol_tf_id=1, timestamp=datetime(2023, 1, 2)), dict(symbol_tf_id=3, timestamp=None)]
+
+    db = make_db(use_pool=True)
+    db.conn = FakePool()
+    db.conn.connection = Connection
+    db.symbol_tf = {("BTCUSDT", "1h"): 1, ("BTCUSDT", "1d"): 2, ("ETHUSDT", "1h"): 3}
+
+    result = asyncio.run(db.load_last_candle_timestamps(["BTCUSDT", "ETHUSDT", "XRPUSDT"], "1h"))
+    assert queries == [[1, 3]]
+    assert result == {"BTCUSDT": datetime(2023, 1, 2)}
+
+
+def test_save_candles_keeps_or_replaces_stored_rows():
+    executed = []
+    copy_timeouts = []
+
+    class Connection:
+        @asynccontextmanager
+        async def transaction(self):
+            yield
+
+        async def execute(self, sql):
+            executed.append(sql)
+
+        async def copy_to_table(self, table, source, format, columns, timeout):
+            copy_timeouts.append(timeout)
+
+    db = make_db(use_pool=True)
+    db.conn = FakePool()
+    db.conn.connection = Connection
+    db.symbol_tf = {("BTCUSDT", "1h"): 1}
+    candles = candles_to_data_frame([[datetime(2023, 1, 1), 1.0, 2.0, 0.5, 1.5, 10.0]])
+
+    async def main():
+        await db.save_candles("BTCUSDT", "1h", candles)
+        await db.save_candles("BTCUSDT", "1h", candles, replace=True)
+        executed.append("-- bulk")
+        await db.save_candles("BTCUSDT", "1h", candles, bulk=True)
+
+    asyncio.run(main())
+    inserts = [sql for sql in executed if sql.startswith("INSERT")]
+    assert inserts[0].endswith("ON CONFLICT (symbol_tf_id, timestamp) DO NOTHING")
+    assert inserts[1].endswith("DO UPDATE SET o = EXCLUDED.o, h = EXCLUDED.h, l = EXCLUDED.l, c = EXCLUDED.c, "
+                               "v = EXCLUDED.v")
+    # only the bulk write lifts the timeouts, for its own transaction
+    bulk = executed.index("-- bulk")
+    assert "SET LOCAL statement_timeout = 0" not in executed[:bulk]
+    assert executed[bulk + 1] == "SET LOCAL statement_timeout = 0"
+    assert copy_timeouts == [10, 10, None]
+
+
+def test_iter_trades_streams_cursor_chunks_and_releases_connection():
+    fetched = []
+    released = []
+    columns = ["timestamp", "symbol_tf_id", "price", "volume", "is_buyer"]
+    rows = [Record(columns, (datetime(2023, 1, 1, 0, i), 1, 100.0 + i, 1.0, True)) for i in range(7)]
+
+    class Cursor:
+        def __init__(self):
+            self.position = 0
+
+        async def fetch(self, n):
+            fetched.append(n)
+            chunk = rows[self.position:self.position + n]
+            self.position += n
+            return chunk
+
+    class Connection:
+        async def cursor(self, sql, *args):
+            assert "ORDER BY timestamp" in sql and args[0] == 1
+            return Cursor()
+
+        @asynccontextmanager
+        async def transaction(self):
+            yield
+
+    class Pool:
+        @asynccontextmanager
+        async def acquire(self):
+            try:
+                yield Connection()
+            finally:
+                released.append(True)
+
+    db = make_db(use_pool=True)
+    db.conn = Pool()
+    db.symbol_tf = {("BTCUSDT", "1d"): 1}
+
+    async def main():
+        sizes = [len(df) async for df in db.iter_trades("BTCUSDT", chunk_size=3)]
+        assert released == [True]
+
+        chunks = db.iter_trades("BTCUSDT", chunk_size=3)
+        first = await chunks.__anext__()
+        await chunks.aclose()
+        return sizes, first
+
+    sizes, first = asyncio.run(main())
+    assert sizes == [3, 3, 1]
+    assert fetched == [3, 3, 3, 3]
+    assert released == [True, True]
+    assert first.index.name == "timestamp" and first["price"].tolist() == [100.0, 101.0, 102.0]
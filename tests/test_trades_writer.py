@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from core.base import CoreBase
+from core.db.timescaledb import TimesScaleDb
+from core.db.trades_writer import TradesWriter
+
+
+class FakeDb:
+    def __init__(self):
+        self.saved = []
+
+    async def save_trades(self, symbol, timestamps, prices, volumes, is_buyer):
+        await asyncio.sleep(0.01)
+        self.saved.append((symbol, list(prices)))
+
+
+def test_trades_writer_flushes_by_size_time_and_on_close(monkeypatch, caplog):
+    start = datetime(2023, 1, 1)
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        db = FakeDb()
+        writer = TradesWriter(db, batch_size=5, flush_interval=0.05, max_pending=9, stats_interval=0.1)
+        writer.start()
+        for i in range(12):
+            writer.add("BTCUSDT", float(i), 1.0, i % 2 == 0, start + timedelta(milliseconds=i))
+        writer.add("ETHUSDT", 100.0, 1.0, True, start)
+        stats = writer.stats
+        await asyncio.sleep(0.2)
+        saved_by_time = list(db.saved)
+        writer.add("ETHUSDT", 101.0, 1.0, True, start)
+        await writer.close()
+        return db, writer, stats, saved_by_time
+
+    caplog.set_level(logging.INFO)
+    db, writer, stats, saved_by_time = asyncio.run(main())
+    assert any(r.getMessage().startswith("Trades writer: {") for r in caplog.records)
+    assert stats["max_pending"] == 9
+    assert stats["dropped"] == 4
+    assert ("BTCUSDT", [0.0, 1.0, 2.0, 3.0, 4.0]) in saved_by_time
+    assert ("BTCUSDT", [5.0, 6.0, 7.0, 8.0]) in saved_by_time
+    assert db.saved[-1] == ("ETHUSDT", [101.0])
+    assert writer.pending == 0
+    assert writer.written == 10
+
+
+def test_add_trade_goes_through_the_writer_until_close(monkeypatch):
+    saved = []
+
+    class Pool:
+        async def close(self):
+            saved.append("pool closed")
+
+    db = object.__new__(TimesScaleDb)  # bypass the singleton
+    db.__init__("localhost", "user", "password")
+    db.conn = Pool()
+
+    async def save_trades(symbol, timestamps, prices, volumes, is_buyer):
+        saved.append((symbol, list(prices)))
+
+    monkeypatch.setattr(db, "save_trades", save_trades)
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        for i in range(3):
+            await db.add_trade("BTCUSDT", 100.0 + i, 1.0, True, datetime(2023, 1, 1, 0, 0, i))
+        # buffered, nothing written one trade at a time
+        assert saved == [] and db.trades_writer.pending == 3
+        await db.close()
+
+    asyncio.run(main())
+    assert saved == [("BTCUSDT", [100.0, 101.0, 102.0]), "pool closed"]
+    assert db.trades_writer is None and db.conn is None
@@ -0,0 +1,112 @@
+import asyncio
+
+import ujson
+
+from core.exchange.common.websocket_pool import SHARD_BY_HASH, WebSocketPool
+
+
+class FakeWs:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, msg):
+        self.sent.append(ujson.loads(msg))
+
+
+class FakeShard:
+    is_connected = True
+
+    def __init__(self):
+        self.ws = FakeWs()
+
+
+class FakePool(WebSocketPool):
+    def create_shard(self, index: int):
+        return FakeShard()
+
+
+def streams(symbol: str):
+    return [f"{symbol}@kline_1h", f"{symbol}@kline_4h", f"{symbol}@kline_1d"]
+
+
+def make_pool(**kwargs) -> FakePool:
+    return FakePool("pool", connect=None, on_message=None, msg_time=0, **kwargs)
+
+
+def test_pool_keeps_symbol_streams_together_and_grows():
+    async def main():
+        pool = make_pool(shards=2, max_streams=6)
+        await pool.subscribe([s for i in range(4) for s in streams(f"s{i}")])
+        await pool.subscribe(streams("s5"))
+        return pool
+
+    pool = asyncio.run(main())
+    assert pool.streams_count == [6, 6, 3]
+    for i in (0, 1, 2, 3, 5):
+        assert len({pool.stream_shard[s] for s in streams(f"s{i}")}) == 1
+    assert [m["method"] for m in pool.shards[2].ws.sent] == ["SUBSCRIBE"]
+
+
+def test_pool_rebalances_on_unsubscribe():
+    async def main():
+        pool = make_pool(shards=2, max_streams=12)
+        await pool.subscribe([s for i in range(8) for s in streams(f"s{i}")])
+        assert pool.streams_count == [12, 12]
+        on_first = [f"s{i}" for i in range(8) if pool.stream_shard[f"s{i}@kline_1h"] == 0]
+        await pool.unsubscribe([s for symbol in on_first[:3] for s in streams(symbol)])
+        return pool
+
+    pool = asyncio.run(main())
+    assert pool.streams_count == [6, 9]
+    assert pool.shards[0].ws.sent[-1]["method"] == "SUBSCRIBE"
+    assert pool.shards[1].ws.sent[-1]["method"] == "UNSUBSCRIBE"
+
+
+def test_pool_by_hash_is_stable():
+    async def main():
+        pool = make_pool(shards=3, shard_by=SHARD_BY_HASH)
+        await pool.subscribe([s for i in range(20) for s in streams(f"s{i}")])
+        first = dict(pool.stream_shard)
+        await pool.unsubscribe(streams("s0"))
+        await pool.subscribe(streams("s0"))
+        return first, pool.stream_shard
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert len(set(first.values())) == 3
+
+
+def test_reconnect_callback_skips_the_first_connect(monkeypatch):
+    from core.base import CoreBase
+    from core.exchange.common.websocket import WebSocketBase
+
+    connects = []
+    reconnects = []
+
+    class ClosingWs:
+        open = True
+
+        async def recv(self):
+            await asyncio.sleep(0.01)
+            self.open = False
+            raise ConnectionResetError()
+
+        async def close(self):
+            self.open = False
+
+    async def connect():
+        connects.append(1)
+        return ClosingWs()
+
+    async def on_reconnect():
+        reconnects.append(len(connects))
+
+    async def main():
+        monkeypatch.setattr(CoreBase, "loop", asyncio.get_running_loop())
+        ws = WebSocketBase("test", connect, on_message=None, on_reconnect=on_reconnect)
+        while len(connects) < 3:
+            await asyncio.sleep(0.005)
+        return ws
+
+    asyncio.run(main())
+    assert reconnects[:2] == [2, 3]
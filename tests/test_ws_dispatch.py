@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+from core.exchange.binance.public import MAX_TRADES, PublicBinance
+from core.exchange.common.candles_buffer import CandlesBuffer
+from core.types import Symbol, Tf
+
+
+def kline(open_time: int, close: str, closed: bool):
+    return {"e": "kline", "s": "BTCUSDT", "k": {"t": open_time, "T": open_time + 59999, "i": "1m", "o": "1",
+                                               "h": "2", "l": "0.5", "c": close, "v": "10", "x": closed}}
+
+
+def test_dispatch_table_routes_events():
+    candles = []
+
+    async def on_candle(symbol, tf, closed, item, close_time):
+        candles.append((symbol, tf, closed, item[4]))
+
+    async def main():
+        exchange = PublicBinance()
+        exchange.on_candle_callback = on_candle
+        exchange.on_trade_callback = None
+        exchange.candles[Symbol("BTCUSDT")] = {Tf("1m"): CandlesBuffer(10)}
+        exchange.candle_unclosed[Symbol("BTCUSDT")] = {}
+
+        for i in range(MAX_TRADES + 5):
+            await exchange.ws_on_message({"e": "aggTrade", "s": "ETHUSDT", "p": str(i), "q": "1", "m": True})
+        await exchange.ws_on_message({"e": "24hrTicker", "s": "ETHUSDT"})
+        await exchange.ws_on_message({"result": None, "id": 1})
+
+        exchange.candles_pending[(Symbol("BTCUSDT"), Tf("1m"))] = []
+        await exchange.ws_on_message(kline(1672531200000, "1.5", True))
+        assert candles == []
+        exchange.candles_pending.clear()
+        await exchange.ws_on_message(kline(1672531260000, "1.7", False))
+        return exchange
+
+    exchange = asyncio.run(main())
+    trades = exchange.trades[Symbol("ETHUSDT")]
+    assert len(trades) == MAX_TRADES
+    assert trades[-1] == (MAX_TRADES + 4.0, 1.0, True)
+    assert candles == [("BTCUSDT", "1m", False, 1.7)]
+    view = exchange.candles[Symbol("BTCUSDT")][Tf("1m")].view()
+    assert len(view) == 1
+    assert view.timestamp[-1] == np.datetime64(datetime(2023, 1, 1, 0, 1))
@@ -1,5 +1,6 @@
 from typing import List
 
+import numpy as np
 import pandas as pd
 from ta.momentum import rsi
 from ta.volatility import BollingerBands
@@ -13,6 +14,8 @@ class Position(Enum):
 
 BB_WINDOW = 20
 RSI_WINDOW = 14
+RSI_OVERSOLD = 30
+RSI_OVERBOUGHT = 70
 
 
 def get_indicators(df_: pd.DataFrame, rsi_window: int = RSI_WINDOW, bb_window: int = BB_WINDOW):
@@ -27,11 +30,21 @@ def get_indicators(df_: pd.DataFrame, rsi_window: int = RSI_WINDOW, bb_window: i
 
 
 def should_buy(r: pd.Series) -> bool:
-    return r.rsi < 30 and r.c < r.bb_lower
+    return r.rsi < RSI_OVERSOLD and r.c < r.bb_lower
 
 
 def should_sell(r: pd.Series) -> bool:
-    return r.rsi > 70 and r.c > r.bb_upper
+    return r.rsi > RSI_OVERBOUGHT and r.c > r.bb_upper
+
+
+def should_buy_mask(c: np.ndarray, rsi_: np.ndarray, bb_lower: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        return (rsi_ < RSI_OVERSOLD) & (c < bb_lower)
+
+
+def should_sell_mask(c: np.ndarray, rsi_: np.ndarray, bb_upper: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        return (rsi_ > RSI_OVERBOUGHT) & (c > bb_upper)
 
 
 def get_profit(side: Position, open_price: float, close_price: float):